@@ -0,0 +1,231 @@
+"""Optional columnar archive of old prices, one Parquet file per ticker and year (needs pyarrow).
+
+With `PORTFOLIOHUT_PRICE_ARCHIVE_DIR` set, the `HistoricalEquity` table only keeps the prices of
+the last `PORTFOLIOHUT_PRICE_ARCHIVE_KEEP_DAYS` days and the history before `cutoff()` is read
+from::
+
+    <PRICE_ARCHIVE_DIR>/<ticker>/<year>.parquet
+
+`ingest_prices` writes every price it receives to the archive (and only the ones on or after the
+cutoff to the database), so the archive has every price before the cutoff. `python manage.py
+archive_prices` deletes the rows that have since aged past the cutoff from the database, and copies
+the existing history into the archive when it is first enabled.
+
+Reads only open the files of the years in the requested range, only decode the requested columns
+and skip the row groups outside the date range. Prices are stored as float64 and converted back to
+the 2 decimal place `Decimal` of the database columns by `read_records`.
+
+pandas and pyarrow are imported where they are used (the models import this module).
+
+"""
+import os
+import tempfile
+from datetime import date, timedelta
+from decimal import Decimal
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterable, List, Optional, Sequence, Tuple
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# The archived `HistoricalEquity` fields (the ticker is the directory and the type is always equity)
+COLUMNS = [
+    "date",
+    "open",
+    "high",
+    "low",
+    "close",
+    "volume",
+    "dividends",
+    "stock_splits",
+]
+DECIMAL_COLUMNS = ["open", "high", "low", "close", "dividends"]
+INTEGER_COLUMNS = ["volume", "stock_splits"]
+
+
+def enabled() -> bool:
+    return bool(settings.PORTFOLIOHUT_PRICE_ARCHIVE_DIR)
+
+
+def cutoff(today: Optional[date] = None) -> Optional[date]:
+    """The first date whose prices are kept in the database (None if there is no archive)."""
+    if not enabled():
+        return None
+    today = today or timezone.localdate()
+    return today - timedelta(days=settings.PORTFOLIOHUT_PRICE_ARCHIVE_KEEP_DAYS)
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImproperlyConfigured(
+            "PRICE_ARCHIVE_DIR is set but pyarrow is not installed (pip install pyarrow)"
+        ) from e
+    return pyarrow, pyarrow.parquet
+
+
+def _schema(pa):
+    types = {"date": pa.date32()}
+    types.update((column, pa.float64()) for column in DECIMAL_COLUMNS)
+    types.update((column, pa.int64()) for column in INTEGER_COLUMNS)
+    return pa.schema([(column, types[column]) for column in COLUMNS])
+
+
+def _ticker_dir(ticker: str) -> Path:
+    # Keeps tickers like "BRK/B" in a directory of their own
+    return Path(settings.PORTFOLIOHUT_PRICE_ARCHIVE_DIR) / quote(ticker, safe="")
+
+
+def _year_path(ticker: str, year: int) -> Path:
+    return _ticker_dir(ticker) / f"{year}.parquet"
+
+
+def _years(ticker: str) -> List[int]:
+    directory = _ticker_dir(ticker)
+    if not directory.is_dir():
+        return []
+    return sorted(int(path.stem) for path in directory.glob("*.parquet"))
+
+
+def _to_frame(prices) -> "pd.DataFrame":
+    import pandas as pd
+
+    prices = pd.DataFrame(prices, columns=COLUMNS)
+    frame = pd.DataFrame({"date": pd.to_datetime(prices["date"])})
+    for column in DECIMAL_COLUMNS:
+        frame[column] = pd.to_numeric(prices[column]).astype("float64")
+    for column in INTEGER_COLUMNS:
+        frame[column] = pd.to_numeric(prices[column]).astype("Int64")
+    return frame
+
+
+def write(ticker: str, prices) -> int:
+    """Insert (or overwrite) prices of a ticker.
+
+    Each year's file is rewritten with the new prices merged in (a year is ~250 rows) and replaced
+    in one rename, so readers never see a partly written file.
+
+    Args:
+        ticker: The ticker the prices belong to
+        prices: Rows (or a `pd.DataFrame`) of the `COLUMNS`, dates and numbers may be strings
+
+    Returns:
+        int: The number of prices written
+
+    """
+    import pandas as pd
+
+    pa, pq = _pyarrow()
+    frame = _to_frame(prices)
+    if frame.empty:
+        return 0
+
+    directory = _ticker_dir(ticker)
+    directory.mkdir(parents=True, exist_ok=True)
+    for year, rows in frame.groupby(frame["date"].dt.year):
+        path = _year_path(ticker, year)
+        if path.exists():
+            stored = pq.read_table(path).to_pandas(date_as_object=False)
+            rows = pd.concat([stored, rows]).drop_duplicates("date", keep="last")
+        table = pa.Table.from_pandas(
+            rows.sort_values("date"), schema=_schema(pa), preserve_index=False
+        )
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pq.write_table(table, f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    return len(frame)
+
+
+def read(
+    tickers: Iterable[str],
+    columns: Sequence[str] = ("close",),
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+) -> "pd.DataFrame":
+    """Read archived prices.
+
+    Args:
+        tickers: The tickers to read
+        columns: The columns to read besides the date
+        start_date: Only prices on or after this date
+        end_date: Only prices on or before this date
+
+    Returns:
+        pd.DataFrame: `ticker`, `date` (`datetime64`) and `columns` sorted by ticker and date
+
+    """
+    import pandas as pd
+
+    _, pq = _pyarrow()
+    filters = []
+    if start_date is not None:
+        filters.append(("date", ">=", start_date))
+    if end_date is not None:
+        filters.append(("date", "<=", end_date))
+
+    frames = []
+    for ticker in tickers:
+        for year in _years(ticker):
+            if (start_date is not None and year < start_date.year) or (
+                end_date is not None and year > end_date.year
+            ):
+                continue
+            frame = pq.read_table(
+                _year_path(ticker, year),
+                columns=["date", *columns],
+                filters=filters or None,
+            ).to_pandas(date_as_object=False)
+            frame.insert(0, "ticker", ticker)
+            frames.append(frame)
+
+    if not frames:
+        return pd.DataFrame(
+            {
+                "ticker": pd.Series(dtype="object"),
+                "date": pd.Series(dtype="datetime64[ns]"),
+                **{column: pd.Series(dtype="float64") for column in columns},
+            }
+        )
+    return pd.concat(frames, ignore_index=True)
+
+
+def read_records(
+    ticker: str,
+    columns: Sequence[str] = ("close",),
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+) -> List[tuple]:
+    """The `(date, *columns)` of a ticker's archived prices, typed like the model fields."""
+    frame = read([ticker], columns, start_date, end_date)
+    values = [frame["date"].dt.date.tolist()]
+    for column in columns:
+        if column in DECIMAL_COLUMNS:
+            values.append([Decimal(f"{value:.2f}") for value in frame[column]])
+        else:
+            values.append(
+                [None if value != value else int(value) for value in frame[column]]
+            )
+    return list(zip(*values))
+
+
+def date_range(ticker: str) -> Tuple[Optional[date], Optional[date]]:
+    """The first and last archived date of a ticker."""
+    _, pq = _pyarrow()
+    years = _years(ticker)
+    if not years:
+        return None, None
+    first = pq.read_table(_year_path(ticker, years[0]), columns=["date"])
+    last = pq.read_table(_year_path(ticker, years[-1]), columns=["date"])
+    return min(first.column("date").to_pylist()), max(last.column("date").to_pylist())
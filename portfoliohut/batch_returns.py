@@ -0,0 +1,451 @@
+"""Recompute the returns of many profiles at once.
+
+`TransactionManager._recompute_returns` loads the price history of every ticker a profile holds,
+one profile at a time, so a nightly update reloads the same prices for every profile. Here the
+close prices of every ticker are loaded once into a days x tickers matrix and the transactions of a
+chunk of profiles into a `Ledger`, and `returns_engine.compute_returns` computes the returns of the
+whole chunk at once.
+
+The results match `_recompute_returns` exactly (it goes through the same engine one profile at a
+time), including which days are skipped. The money weighted return (`Profile.xirr`) of the whole
+chunk is solved at once as well.
+
+Every full recompute also stores the end of day state of each profile (`ReturnsState`). Once new
+prices come in, `roll_forward_returns` appends the returns of the new days from those states, so the
+nightly update reads a few rows per profile instead of its whole history.
+
+"""
+import functools
+import logging
+import operator
+from collections import namedtuple
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from django.db import models, transaction
+from django.db.models import F, Max, Q, QuerySet
+from django.db.models.functions import TruncDate
+
+from portfoliohut import returns_engine
+from portfoliohut.loaders import EpochDays, load_close_frame
+from portfoliohut.metrics import RECOMPUTE_DURATION
+from portfoliohut.models import (
+    FinancialActionType,
+    HistoricalEquity,
+    PortfolioReturn,
+    Profile,
+    ReturnsRecompute,
+    ReturnsState,
+    ReturnsWriteStats,
+    Transaction,
+)
+from portfoliohut.returns_engine import EodState, Ledger
+
+logger = logging.getLogger(__name__)
+
+# Bounds the profiles x days matrices of the engine (a few MiB for decades of prices)
+PROFILE_CHUNK_SIZE = 100
+
+PriceMatrix = namedtuple("PriceMatrix", ["closes", "day_numbers", "dates", "tickers"])
+RollForwardStats = namedtuple("RollForwardStats", ["rolled", "recomputed"])
+
+EPOCH = date(1970, 1, 1)
+
+LEDGER_KINDS = {
+    FinancialActionType.EQUITY: returns_engine.EQUITY,
+    FinancialActionType.INTERNAL_CASH: returns_engine.INTERNAL_CASH,
+    FinancialActionType.EXTERNAL_CASH: returns_engine.EXTERNAL_CASH,
+}
+
+
+def ledger_rows(transactions: QuerySet) -> QuerySet:
+    """The `(id, profile, type, ticker, day, quantity, value)` of each transaction."""
+    return (
+        transactions.annotate(
+            _day=EpochDays(TruncDate("date_time")),
+            _value=Transaction._meta.get_field("price").to_float(
+                F("price") * F("quantity")
+            ),
+        )
+        .order_by("profile_id", "id")
+        .values_list("id", "profile_id", "type", "ticker", "_day", "quantity", "_value")
+    )
+
+
+def to_ledger(rows: list, tickers: List[str]) -> Ledger:
+    """Turn `ledger_rows` into a `Ledger` with the columns of `tickers`.
+
+    Raises:
+        ValueError: An equity transaction is in a ticker that is not in `tickers`
+
+    """
+    if not rows:
+        return returns_engine.empty_ledger()
+
+    ticker_index = {ticker: i for i, ticker in enumerate(tickers)}
+    _, profile, types, row_tickers, days, quantities, values = zip(*rows)
+    missing = {
+        ticker
+        for kind, ticker in zip(types, row_tickers)
+        if kind == FinancialActionType.EQUITY and ticker not in ticker_index
+    }
+    if missing:
+        raise ValueError(f"No price column for {', '.join(sorted(missing))}")
+    return Ledger(
+        profile=np.array(profile, dtype="int64"),
+        kind=np.array([LEDGER_KINDS[t] for t in types], dtype="int64"),
+        # The engine ignores the ticker column of cash
+        ticker=np.array(
+            [
+                ticker_index[t] if kind == FinancialActionType.EQUITY else 0
+                for kind, t in zip(types, row_tickers)
+            ],
+            dtype="int64",
+        ),
+        day=np.array(days, dtype="int64"),
+        quantity=np.array(quantities, dtype="int64"),
+        value=np.array(values, dtype="float64"),
+    )
+
+
+def load_ledger(
+    profile_ids: Iterable[int], tickers: List[str], max_id: Optional[int] = None
+) -> Ledger:
+    """Load the transactions of `profile_ids` as a `Ledger`, sorted by profile and id.
+
+    Args:
+        profile_ids: The profiles to load
+        tickers: The tickers of the price matrix columns (every traded ticker must be in it)
+        max_id: Leave out the transactions added after the one with this id
+
+    """
+    transactions = Transaction.objects.filter(profile_id__in=list(profile_ids))
+    if max_id is not None:
+        transactions = transactions.filter(id__lte=max_id)
+    return to_ledger(list(ledger_rows(transactions).iterator()), tickers)
+
+
+def last_transaction_id() -> int:
+    return Transaction.objects.aggregate(last=Max("id"))["last"] or 0
+
+
+def write_twr(profile_ids: np.ndarray, dates, twr: np.ndarray) -> ReturnsWriteStats:
+    """Store the profiles x days returns computed by the engine (NaN days have no row)."""
+    returns = {}
+    for profile_id, row in zip(profile_ids.tolist(), twr):
+        has_return = ~np.isnan(row)
+        returns[profile_id] = dict(zip(dates[has_return], row[has_return].tolist()))
+    return PortfolioReturn.objects.write_returns(returns)
+
+
+def write_xirr(profile_ids: np.ndarray, xirr: np.ndarray):
+    """Store the XIRR computed by the engine on each profile (NaN is stored as None)."""
+    profiles = [
+        Profile(id=profile_id, xirr=None if np.isnan(value) else value)
+        for profile_id, value in zip(profile_ids.tolist(), xirr.tolist())
+    ]
+    Profile.objects.bulk_update(profiles, ["xirr"], batch_size=PROFILE_CHUNK_SIZE)
+
+
+def _save_states(
+    state: EodState,
+    tickers: List[str],
+    last_transaction_ids: Dict[int, int],
+    replaced_profile_ids: Iterable[int],
+):
+    """Replace the `ReturnsState` of `replaced_profile_ids` with the ones in `state`."""
+    holdings = {row: {} for row in range(len(state.profile_ids))}
+    for row, column, quantity in zip(
+        state.holding_profiles.tolist(),
+        state.holding_tickers.tolist(),
+        state.holdings.tolist(),
+    ):
+        holdings[row][tickers[column]] = int(round(quantity))
+
+    states = [
+        ReturnsState(
+            profile_id=profile_id,
+            date=EPOCH + timedelta(days=day),
+            value=state.value[row],
+            cash_flows=state.cash_flows[row],
+            internal_cash=state.internal_cash[row],
+            cumulative_return=state.growth[row] - 1,
+            holdings=holdings[row],
+            last_transaction_id=last_transaction_ids[profile_id],
+        )
+        for row, (profile_id, day) in enumerate(
+            zip(state.profile_ids.tolist(), state.day.tolist())
+        )
+    ]
+    with transaction.atomic():
+        ReturnsState.objects.filter(profile_id__in=list(replaced_profile_ids)).delete()
+        ReturnsState.objects.bulk_create(states, batch_size=PROFILE_CHUNK_SIZE)
+
+
+def write_states(
+    ledger: Ledger,
+    result: returns_engine.EngineResult,
+    prices: PriceMatrix,
+    max_id: int,
+):
+    """Store the end of day state of every profile in `result` (see `ReturnsState`).
+
+    Args:
+        ledger: The transactions the returns were computed from
+        result: The results of `compute_returns`
+        prices: The prices the returns were computed from
+        max_id: The id of the last transaction in `ledger` (`load_ledger`'s `max_id`)
+
+    """
+    state = returns_engine.end_of_day_state(
+        ledger, result, prices.closes, prices.day_numbers
+    )
+    _save_states(
+        state,
+        prices.tickers,
+        {profile_id: max_id for profile_id in state.profile_ids.tolist()},
+        result.profile_ids.tolist(),
+    )
+
+
+def equity_profile_ids(profile_ids: Optional[Iterable[int]] = None) -> List[int]:
+    """The sorted ids of the profiles (out of `profile_ids`) that have equity transactions."""
+    equity_qset = Transaction.objects.filter(type=FinancialActionType.EQUITY)
+    if profile_ids is not None:
+        equity_qset = equity_qset.filter(profile_id__in=list(profile_ids))
+    return sorted(set(equity_qset.values_list("profile_id", flat=True)))
+
+
+def load_price_matrix(
+    profile_ids: Optional[Iterable[int]] = None, refresh_prices: bool = True
+) -> PriceMatrix:
+    """Load the close prices of every ticker traded by `profile_ids` (default all profiles).
+
+    Args:
+        profile_ids: The profiles whose tickers are loaded
+        refresh_prices: Download missing prices for every ticker first
+
+    """
+    equity_qset = Transaction.objects.filter(type=FinancialActionType.EQUITY)
+    transaction_qset = Transaction.objects.all()
+    if profile_ids is not None:
+        equity_qset = equity_qset.filter(profile_id__in=list(profile_ids))
+        transaction_qset = transaction_qset.filter(profile_id__in=list(profile_ids))
+
+    tickers = sorted(set(equity_qset.values_list("ticker", flat=True)))
+    if refresh_prices:
+        for ticker in tickers:
+            HistoricalEquity.objects.get_ticker(ticker)
+    start = transaction_qset.annotate(_date=TruncDate("date_time")).aggregate(
+        start=models.Min("_date")
+    )["start"]
+    return price_matrix(tickers, start)
+
+
+def price_matrix(tickers: List[str], start_date: Optional[date] = None) -> PriceMatrix:
+    """Load the cached close prices of `tickers` from `start_date` on."""
+    closes = load_close_frame(tickers, start_date=start_date).reindex(columns=tickers)
+    logger.info("Loaded %s x %s close matrix", *closes.shape)
+
+    return PriceMatrix(
+        closes=closes.values,
+        day_numbers=closes.index.values.astype("datetime64[D]").astype("int64"),
+        dates=closes.index.date,
+        tickers=tickers,
+    )
+
+
+def recompute_profiles(
+    profile_ids: Iterable[int], prices: PriceMatrix, max_id: int
+) -> int:
+    """Recompute and store the returns of one chunk of profiles.
+
+    Args:
+        profile_ids: The profiles to recompute
+        prices: The close prices of every ticker the profiles traded up to `max_id`
+        max_id: The `last_transaction_id` read before loading `prices` (later transactions may be
+            in tickers that `prices` lacks)
+
+    Returns:
+        int: The number of profiles whose returns were written
+
+    """
+    ledger = load_ledger(profile_ids, prices.tickers, max_id=max_id)
+    result = returns_engine.compute_returns(ledger, prices.closes, prices.day_numbers)
+    write_twr(result.profile_ids, prices.dates, result.twr)
+    write_states(ledger, result, prices, max_id)
+    write_xirr(
+        result.profile_ids,
+        returns_engine.compute_xirr(ledger, result, prices.day_numbers),
+    )
+    return len(result.profile_ids)
+
+
+def recompute_all_returns(
+    profile_ids: Optional[Iterable[int]] = None,
+    chunk_size: int = PROFILE_CHUNK_SIZE,
+    refresh_prices: bool = True,
+) -> int:
+    """Recompute and store the returns of many profiles.
+
+    Args:
+        profile_ids: The profiles to recompute (defaults to every profile with equity transactions)
+        chunk_size: The number of profiles whose arrays are held in memory at once
+        refresh_prices: Download missing prices for every ticker first
+
+    Returns:
+        int: The number of profiles whose returns were written
+
+    """
+    profile_ids = equity_profile_ids(profile_ids)
+    if not profile_ids:
+        return 0
+
+    with RECOMPUTE_DURATION.time(engine="batch"):
+        max_id = last_transaction_id()
+        prices = load_price_matrix(profile_ids, refresh_prices=refresh_prices)
+        written = 0
+        for i in range(0, len(profile_ids), chunk_size):
+            written += recompute_profiles(
+                profile_ids[i : i + chunk_size], prices, max_id
+            )
+
+    return written
+
+
+def _roll_forward_chunk(states: List[ReturnsState]) -> Tuple[int, List[int]]:
+    """Append the new returns of a chunk of profiles from their `ReturnsState`.
+
+    Returns:
+        The number of profiles rolled forward and the ids of the ones that need a full recompute
+
+    """
+    # The transactions added since each state and the ones after its day (e.g. a trade on a
+    # weekend that the state could not include yet)
+    new_transactions = Transaction.objects.filter(
+        functools.reduce(
+            operator.or_,
+            (
+                Q(profile_id=state.profile_id)
+                & (
+                    Q(id__gt=state.last_transaction_id)
+                    | Q(date_time__date__gt=state.date)
+                )
+                for state in states
+            ),
+        )
+    )
+    rows = list(ledger_rows(new_transactions).iterator())
+
+    by_profile = {state.profile_id: state for state in states}
+    last_ids = {state.profile_id: state.last_transaction_id for state in states}
+    recompute = set()
+    for pk, profile_id, kind, ticker, day, *_ in rows:
+        state = by_profile[profile_id]
+        last_ids[profile_id] = max(last_ids[profile_id], pk)
+        backdated = EPOCH + timedelta(days=day) <= state.date
+        new_ticker = kind == FinancialActionType.EQUITY and ticker not in state.holdings
+        if backdated or new_ticker:
+            recompute.add(profile_id)
+
+    states = [state for state in states if state.profile_id not in recompute]
+    if not states:
+        return 0, sorted(recompute)
+
+    tickers = sorted({ticker for state in states for ticker in state.holdings})
+    start = min(state.date for state in states) + timedelta(days=1)
+    prices = price_matrix(tickers, start)
+
+    ticker_index = {ticker: i for i, ticker in enumerate(tickers)}
+    holdings = [
+        (row, ticker_index[ticker], quantity)
+        for row, state in enumerate(states)
+        for ticker, quantity in sorted(state.holdings.items())
+    ]
+    holding_profiles, holding_tickers, quantities = (
+        np.array(column, dtype="int64") for column in zip(*holdings)
+    )
+    eod = EodState(
+        profile_ids=np.array([state.profile_id for state in states]),
+        day=np.array([(state.date - EPOCH).days for state in states]),
+        value=np.array([state.value for state in states]),
+        cash_flows=np.array([state.cash_flows for state in states]),
+        internal_cash=np.array([state.internal_cash for state in states]),
+        growth=np.array([state.cumulative_return + 1 for state in states]),
+        holding_profiles=holding_profiles,
+        holding_tickers=holding_tickers,
+        holdings=quantities.astype("float64"),
+    )
+    ledger = to_ledger(
+        [row for row in rows if row[1] not in recompute],
+        tickers,
+    )
+
+    twr, new_eod = returns_engine.roll_forward(
+        eod, ledger, prices.closes, prices.day_numbers
+    )
+    returns = {}
+    for profile_id, row in zip(eod.profile_ids.tolist(), twr):
+        has_return = ~np.isnan(row)
+        returns[profile_id] = dict(
+            zip(prices.dates[has_return], row[has_return].tolist())
+        )
+    with transaction.atomic():
+        PortfolioReturn.objects.append_returns(
+            returns, dict(zip(eod.profile_ids.tolist(), eod.growth.tolist()))
+        )
+        _save_states(new_eod, tickers, last_ids, new_eod.profile_ids.tolist())
+
+    return len(states), sorted(recompute)
+
+
+def roll_forward_returns(
+    profile_ids: Optional[Iterable[int]] = None,
+    chunk_size: int = PROFILE_CHUNK_SIZE,
+    refresh_prices: bool = True,
+) -> RollForwardStats:
+    """Append the returns of the days since each profile's `ReturnsState`.
+
+    Only the profiles with a state are rolled forward (a profile gets one with its first
+    recompute). Profiles whose new transactions are backdated (on or before the day of their
+    state) or in a ticker they never traded get a full recompute instead. Profiles with a pending
+    `ReturnsRecompute` are skipped, it recomputes them anyway.
+
+    Args:
+        profile_ids: The profiles to roll forward (defaults to every profile with a state)
+        chunk_size: The number of profiles whose states are held in memory at once
+        refresh_prices: Download missing prices for every ticker first
+
+    Returns:
+        RollForwardStats: The number of profiles rolled forward and recomputed
+
+    """
+    states = ReturnsState.objects.exclude(
+        profile_id__in=ReturnsRecompute.objects.values("profile_id")
+    ).order_by("profile_id")
+    if profile_ids is not None:
+        states = states.filter(profile_id__in=list(profile_ids))
+    states = list(states)
+
+    if refresh_prices:
+        for ticker in sorted({ticker for state in states for ticker in state.holdings}):
+            HistoricalEquity.objects.get_ticker(ticker)
+
+    rolled, recompute = 0, []
+    with RECOMPUTE_DURATION.time(engine="roll_forward"):
+        for i in range(0, len(states), chunk_size):
+            chunk_rolled, chunk_recompute = _roll_forward_chunk(
+                states[i : i + chunk_size]
+            )
+            rolled += chunk_rolled
+            recompute.extend(chunk_recompute)
+    logger.info(
+        "Rolled %s profile(s) forward, %s need a full recompute", rolled, len(recompute)
+    )
+
+    if recompute:
+        recompute_all_returns(
+            recompute, chunk_size=chunk_size, refresh_prices=refresh_prices
+        )
+    return RollForwardStats(rolled=rolled, recomputed=len(recompute))
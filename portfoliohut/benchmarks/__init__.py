@@ -0,0 +1,55 @@
+"""Benchmark suites run with `python manage.py benchmark <suite>`.
+
+A suite is a function registered with `@suite` that returns a list of `Measurement`s. Suites that
+need data create it inside `synthetic_data()`, which rolls everything back once the suite ends.
+
+"""
+import time
+import tracemalloc
+from collections import namedtuple
+from contextlib import contextmanager
+from typing import Callable, Dict
+
+from django.db import transaction
+
+# `size_bytes` is the size on disk of the measured table and its indexes, where a suite reports it
+Measurement = namedtuple(
+    "Measurement",
+    ["name", "rows", "seconds", "peak_bytes", "size_bytes"],
+    defaults=[None],
+)
+
+SUITES: Dict[str, Callable] = {}
+
+
+def suite(func: Callable) -> Callable:
+    """Register a benchmark suite under its module name (e.g. `loaders`)."""
+    SUITES[func.__module__.rsplit(".", 1)[-1]] = func
+    return func
+
+
+def measure(name: str, func: Callable, rows: int = 0, repeat: int = 5) -> Measurement:
+    """Time `func` (best of `repeat` runs) and record its peak traced memory allocation."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    # Memory is traced in a separate run since tracing slows everything down
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return Measurement(name, rows, min(timings), peak)
+
+
+@contextmanager
+def synthetic_data():
+    """Run a block in a transaction that is always rolled back."""
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
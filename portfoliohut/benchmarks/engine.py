@@ -0,0 +1,109 @@
+"""Time the returns engine on synthetic arrays (no database involved).
+
+Fails unless computing the profiles in chunks is `MIN_SPEEDUP` times as fast as one at a time.
+
+"""
+import numpy as np
+
+from portfoliohut import returns_engine
+from portfoliohut.batch_returns import PROFILE_CHUNK_SIZE
+from portfoliohut.benchmarks import measure, suite
+from portfoliohut.returns_engine import Ledger
+
+# The batch engine must be at least this much faster than computing one profile at a time
+MIN_SPEEDUP = 2
+
+
+def _synthetic_ledger(profiles: int, tickers: int, days: int, trades: int) -> Ledger:
+    """A deposit and `trades` buys per profile, each paid for in cash.
+
+    Profiles sign up over the whole history in the order of their ids, like real ones do.
+
+    """
+    rng = np.random.default_rng(0)
+    n_trades = profiles * trades
+    profile = np.repeat(np.arange(1, profiles + 1), trades)
+    signup = np.sort(rng.integers(0, days, profiles))
+    day = np.sort(
+        rng.integers(np.repeat(signup, trades), days).reshape(profiles, trades), axis=1
+    )
+    quantity = rng.integers(1, 10, n_trades)
+    value = quantity * rng.uniform(50, 150, n_trades)
+
+    # Every trade is an equity row followed by the internal cash that paid for it
+    kind = np.tile([returns_engine.EQUITY, returns_engine.INTERNAL_CASH], n_trades)
+    return Ledger(
+        profile=np.r_[np.arange(1, profiles + 1), np.repeat(profile, 2)],
+        kind=np.r_[np.full(profiles, returns_engine.EXTERNAL_CASH), kind],
+        ticker=np.r_[
+            np.full(profiles, -1),
+            np.repeat(rng.integers(0, tickers, n_trades), 2),
+        ],
+        day=np.r_[signup, np.repeat(day.ravel(), 2)],
+        quantity=np.r_[np.ones(profiles, dtype="int64"), np.repeat(quantity, 2)],
+        value=np.r_[
+            np.full(profiles, 1e6),
+            np.column_stack([value, -value]).ravel(),
+        ],
+    )
+
+
+def _chunks(ledger, chunk_size):
+    profile_ids = np.unique(ledger.profile)
+    for i in range(0, len(profile_ids), chunk_size):
+        rows = np.isin(ledger.profile, profile_ids[i : i + chunk_size])
+        yield Ledger(*(column[rows] for column in ledger))
+
+
+def _one_profile_at_a_time(ledger, closes, day_numbers):
+    # What `TransactionManager._recompute_returns` runs for every profile
+    for profile_ledger in _chunks(ledger, 1):
+        returns_engine.compute_returns(profile_ledger, closes, day_numbers)
+
+
+def _in_chunks(ledger, closes, day_numbers):
+    # What `batch_returns.recompute_all_returns` runs
+    for chunk in _chunks(ledger, PROFILE_CHUNK_SIZE):
+        returns_engine.compute_returns(chunk, closes, day_numbers)
+
+
+@suite
+def engine(profiles=500, tickers=10, days=2500, trades=20, repeat=5):
+    rng = np.random.default_rng(1)
+    closes = 100 * np.cumprod(1 + rng.normal(0, 0.01, (days, tickers)), axis=0)
+    # Weekends and holidays have no prices
+    closes[rng.random(days) < 0.3] = np.nan
+    day_numbers = np.arange(days, dtype="int64")
+    ledger = _synthetic_ledger(profiles, tickers, days, trades)
+    rows = profiles * days
+    result = returns_engine.compute_returns(ledger, closes, day_numbers)
+
+    one_at_a_time = measure(
+        "compute_returns (one profile at a time)",
+        lambda: _one_profile_at_a_time(ledger, closes, day_numbers),
+        rows,
+        repeat,
+    )
+    batch = measure(
+        f"compute_returns ({PROFILE_CHUNK_SIZE} profiles at a time)",
+        lambda: _in_chunks(ledger, closes, day_numbers),
+        rows,
+        repeat,
+    )
+    speedup = one_at_a_time.seconds / batch.seconds
+    if speedup < MIN_SPEEDUP:
+        raise AssertionError(
+            f"computing the returns in chunks is only {speedup:.1f}x as fast as one "
+            f"profile at a time (expected at least {MIN_SPEEDUP}x)"
+        )
+
+    return [
+        one_at_a_time,
+        batch,
+        measure(
+            "compute_xirr (all profiles)",
+            lambda: returns_engine.compute_xirr(ledger, result, day_numbers),
+            profiles,
+            repeat,
+        ),
+    ]
@@ -0,0 +1,199 @@
+"""Compare the legacy `numeric` price columns against the fixed point (bigint cents) ones.
+
+Both layouts are created as scratch tables from models in a registry of their own (so migrations
+never see them) and dropped again when the suite ends.
+
+"""
+from contextlib import contextmanager
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Optional
+
+import numpy as np
+from django.apps.registry import Apps
+from django.db import connection, models
+from django.db.models import F, Sum
+
+from portfoliohut.benchmarks import measure, suite, synthetic_data
+from portfoliohut.models.fields import FixedPointField
+
+BENCH_TICKERS = [f"BENCH{i}" for i in range(5)]
+PRICE_COLUMNS = ["open", "high", "low", "close", "dividends"]
+
+
+def _numeric_field(**kwargs):
+    # The price columns before they were stored as cents
+    return models.DecimalField(max_digits=100, decimal_places=2, **kwargs)
+
+
+def _scratch_models(layout: str, price_field):
+    """A `HistoricalEquity` and a `Transaction` like model with `price_field` columns."""
+    apps = Apps()
+
+    def model(name, table, fields, **meta):
+        meta = type(
+            "Meta",
+            (),
+            {"apps": apps, "app_label": "portfoliohut", "db_table": table, **meta},
+        )
+        return type(
+            f"Benchmark{name}{layout.title()}",
+            (models.Model,),
+            {"__module__": __name__, "Meta": meta, **fields},
+        )
+
+    prices = model(
+        "Price",
+        f"benchmark_price_{layout}",
+        {
+            "ticker": models.CharField(max_length=20),
+            "date": models.DateField(),
+            "volume": models.BigIntegerField(),
+            **{column: price_field() for column in PRICE_COLUMNS},
+        },
+        unique_together=(("ticker", "date"),),
+    )
+    trades = model(
+        "Trade",
+        f"benchmark_trade_{layout}",
+        {
+            "profile_id": models.IntegerField(db_index=True),
+            "ticker": models.CharField(max_length=20),
+            "quantity": models.IntegerField(),
+            "price": price_field(),
+        },
+    )
+    return prices, trades
+
+
+@contextmanager
+def _scratch_tables(*scratch_models):
+    # Created outside of `synthetic_data()`, SQLite can't alter its schema in a transaction
+    with connection.schema_editor() as editor:
+        for model in scratch_models:
+            editor.create_model(model)
+    try:
+        yield
+    finally:
+        with connection.schema_editor() as editor:
+            for model in scratch_models:
+                editor.delete_model(model)
+
+
+def _size_bytes(model) -> Optional[int]:
+    """The bytes on disk of a table and its indexes (None if the database can't tell)."""
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute("SELECT pg_total_relation_size(%s)", [table])
+        elif connection.vendor == "sqlite":
+            try:
+                cursor.execute(
+                    "SELECT SUM(pgsize) FROM dbstat WHERE name IN "
+                    "(SELECT name FROM sqlite_master WHERE tbl_name = %s)",
+                    [table],
+                )
+            except Exception:  # noqa: B902 (SQLite built without dbstat)
+                return None
+        else:
+            return None
+        return cursor.fetchone()[0]
+
+
+def _create_rows(prices, trades, days: int, trade_count: int):
+    rng = np.random.default_rng(0)
+    start = date(2000, 1, 3)
+    price_rows = []
+    for ticker in BENCH_TICKERS:
+        closes = 100 * np.cumprod(1 + rng.normal(0, 0.01, days))
+        price_rows.extend(
+            (ticker, start + timedelta(days=i), Decimal(f"{close:.2f}"))
+            for i, close in enumerate(closes)
+        )
+    # The same values in both layouts
+    trade_rows = list(
+        zip(
+            rng.integers(0, max(trade_count // 50, 1), trade_count).tolist(),
+            rng.choice(BENCH_TICKERS, trade_count).tolist(),
+            rng.integers(1, 100, trade_count).tolist(),
+            [Decimal(f"{p:.2f}") for p in rng.uniform(1, 1000, trade_count)],
+        )
+    )
+
+    for layout_prices, layout_trades in zip(prices, trades):
+        layout_prices.objects.bulk_create(
+            [
+                layout_prices(
+                    ticker=ticker,
+                    date=day,
+                    volume=1000,
+                    dividends=Decimal("0.00"),
+                    **{column: close for column in PRICE_COLUMNS[:-1]},
+                )
+                for ticker, day, close in price_rows
+            ],
+            batch_size=1000,
+        )
+        layout_trades.objects.bulk_create(
+            [
+                layout_trades(
+                    profile_id=profile_id, ticker=ticker, quantity=quantity, price=price
+                )
+                for profile_id, ticker, quantity, price in trade_rows
+            ],
+            batch_size=1000,
+        )
+
+
+def _decode(model):
+    return list(model.objects.values_list(*PRICE_COLUMNS))
+
+
+def _portfolio_totals(model, output_field):
+    # The grouped sum of `TransactionManager._reset_portfolio_cache` (for every profile at once)
+    return list(
+        model.objects.values("profile_id", "ticker")
+        .order_by("profile_id", "ticker")
+        .annotate(
+            total_quantity=Sum("quantity"),
+            total_price=Sum(F("quantity") * F("price"), output_field=output_field),
+        )
+    )
+
+
+@suite
+def fixed_point(days=5000, trades=50000, repeat=5):
+    numeric_prices, numeric_trades = _scratch_models("numeric", _numeric_field)
+    fixed_prices, fixed_trades = _scratch_models("fixed", FixedPointField)
+    layouts = [
+        ("numeric", numeric_prices, numeric_trades, _numeric_field()),
+        ("fixed point", fixed_prices, fixed_trades, FixedPointField()),
+    ]
+
+    results = []
+    with _scratch_tables(numeric_prices, numeric_trades, fixed_prices, fixed_trades):
+        with synthetic_data():
+            _create_rows(
+                (numeric_prices, fixed_prices),
+                (numeric_trades, fixed_trades),
+                days,
+                trades,
+            )
+            rows = len(BENCH_TICKERS) * days
+            for name, prices, _, _ in layouts:
+                results.append(
+                    measure(
+                        f"decode prices ({name})", lambda: _decode(prices), rows, repeat
+                    )._replace(size_bytes=_size_bytes(prices))
+                )
+            for name, _, layout_trades, output_field in layouts:
+                results.append(
+                    measure(
+                        f"portfolio totals ({name})",
+                        lambda: _portfolio_totals(layout_trades, output_field),
+                        trades,
+                        repeat,
+                    )._replace(size_bytes=_size_bytes(layout_trades))
+                )
+
+    return results
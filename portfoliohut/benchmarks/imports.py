@@ -0,0 +1,72 @@
+"""Measure the cold start import time of the web app with `python -X importtime`.
+
+The suite fails if importing the URL configuration (i.e. what every gunicorn worker and
+`manage.py` command does at startup) loads any of the heavy libraries in `LAZY_MODULES`. Those
+must only be imported inside the functions that use them.
+
+"""
+import os
+import subprocess
+import sys
+
+from portfoliohut.benchmarks import Measurement, suite
+
+LAZY_MODULES = (
+    "numpy",
+    "pandas",
+    "pandas_market_calendars",
+    "plotly",
+    "yfinance",
+    "bootstrap_datepicker_plus.widgets",
+)
+
+STARTUP_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+import django
+django.setup()
+import webapps.urls
+print(time.perf_counter() - start)
+print(",".join(m for m in {lazy_modules!r} if m in sys.modules))
+"""
+
+
+def _parse_importtime(stderr: str):
+    """Yield `(module, cumulative seconds)` for the top level imports of an importtime report."""
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line.split("|")
+        if not module.startswith("  "):
+            yield module.strip(), int(cumulative) / 1e6
+
+
+@suite
+def imports(repeat=5, top=10):
+    env = {**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    wall_times = []
+    for _ in range(repeat):
+        result = subprocess.run(
+            [
+                sys.executable,
+                "-X",
+                "importtime",
+                "-c",
+                STARTUP_SCRIPT.format(lazy_modules=LAZY_MODULES),
+            ],
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        wall, loaded = result.stdout.splitlines()[-2:]
+        wall_times.append(float(wall))
+
+    if loaded:
+        raise RuntimeError(f"startup imports heavy modules: {loaded}")
+
+    modules = sorted(_parse_importtime(result.stderr), key=lambda m: -m[1])
+    return [Measurement("startup (django.setup + urls)", 0, min(wall_times), 0)] + [
+        Measurement(f"import {module}", 0, seconds, 0)
+        for module, seconds in modules[:top]
+    ]
@@ -0,0 +1,95 @@
+"""Compare `bulk_create` against the raw SQL price ingestion (`COPY` only runs on Postgres)."""
+import numpy as np
+import pandas as pd
+from django.db import connection
+
+from portfoliohut.benchmarks import measure, suite, synthetic_data
+from portfoliohut.ingest import ingest_prices
+from portfoliohut.models import FinancialActionType, HistoricalEquity
+
+BENCH_TICKER = "BENCHINGEST"
+
+
+def _history(days: int) -> pd.DataFrame:
+    """A frame shaped like `yf.Ticker(ticker).history(period="max")`."""
+    rng = np.random.default_rng(0)
+    closes = 100 * np.cumprod(1 + rng.normal(0, 0.01, days))
+    return pd.DataFrame(
+        {
+            "Open": closes * 0.99,
+            "High": closes * 1.01,
+            "Low": closes * 0.98,
+            "Close": closes,
+            "Volume": rng.integers(1000, 10 ** 7, days),
+            "Dividends": 0.0,
+            "Stock Splits": 0,
+        },
+        index=pd.bdate_range("1980-01-02", periods=days, name="Date"),
+    )
+
+
+def _legacy_ingest(df: pd.DataFrame):
+    df = df.reset_index()
+    df = df.dropna(subset=["Open", "Close"])
+    df = df.where(pd.notnull(df), None)
+    HistoricalEquity.objects.bulk_create(
+        [
+            HistoricalEquity(
+                type=FinancialActionType.EQUITY,
+                ticker=BENCH_TICKER,
+                date=record["Date"],
+                open=record["Open"],
+                high=record["High"],
+                low=record["Low"],
+                close=record["Close"],
+                volume=record["Volume"],
+                dividends=record["Dividends"],
+                stock_splits=record["Stock Splits"],
+            )
+            for record in df.to_dict("records")
+        ]
+    )
+
+
+def _fresh(func):
+    def run():
+        HistoricalEquity.objects.filter(ticker=BENCH_TICKER).delete()
+        func()
+
+    return run
+
+
+@suite
+def ingest(days=10000, repeat=5):
+    df = _history(days)
+    methods = ["executemany"]
+    if connection.vendor == "postgresql":
+        methods.append("copy")
+
+    results = []
+    with synthetic_data():
+        results.append(
+            measure(
+                "bulk_create", _fresh(lambda: _legacy_ingest(df)), days, repeat=repeat
+            )
+        )
+        for method in methods:
+            results.append(
+                measure(
+                    method,
+                    _fresh(lambda: ingest_prices(BENCH_TICKER, df, method=method)),
+                    days,
+                    repeat=repeat,
+                )
+            )
+            # Every row conflicts with an existing one and is overwritten
+            results.append(
+                measure(
+                    f"{method} (re-ingest)",
+                    lambda: ingest_prices(BENCH_TICKER, df, method=method),
+                    days,
+                    repeat=repeat,
+                )
+            )
+
+    return results
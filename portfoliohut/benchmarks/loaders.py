@@ -0,0 +1,133 @@
+"""Compare `values_list` + `Decimal` reads against the NumPy loaders."""
+from datetime import date, timedelta
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+from django.contrib.auth.models import User
+
+from portfoliohut.benchmarks import measure, suite, synthetic_data
+from portfoliohut.loaders import load_close_frame, load_cumulative_returns, load_series
+from portfoliohut.models import (
+    FinancialActionType,
+    HistoricalEquity,
+    PortfolioReturn,
+    Profile,
+)
+
+BENCH_TICKERS = [f"BENCH{i}" for i in range(5)]
+
+
+def _create_prices(days: int):
+    rng = np.random.default_rng(0)
+    start = date(2000, 1, 3)
+    for ticker in BENCH_TICKERS:
+        closes = 100 * np.cumprod(1 + rng.normal(0, 0.01, days))
+        HistoricalEquity.objects.bulk_create(
+            [
+                HistoricalEquity(
+                    type=FinancialActionType.EQUITY,
+                    ticker=ticker,
+                    date=start + timedelta(days=i),
+                    open=Decimal(f"{close:.2f}"),
+                    high=Decimal(f"{close:.2f}"),
+                    low=Decimal(f"{close:.2f}"),
+                    close=Decimal(f"{close:.2f}"),
+                    volume=1000,
+                    dividends=Decimal("0.00"),
+                    stock_splits=0,
+                )
+                for i, close in enumerate(closes)
+            ],
+            batch_size=1000,
+        )
+
+
+def _create_returns(days: int) -> Profile:
+    user = User.objects.create_user("benchmark-loaders", "bench@example.com", "bench")
+    profile = Profile.objects.create(user=user)
+    rng = np.random.default_rng(1)
+    PortfolioReturn.objects.bulk_create(
+        [
+            PortfolioReturn(
+                profile=profile, date=date(2000, 1, 3) + timedelta(days=i), returns=r
+            )
+            for i, r in enumerate(rng.normal(0, 0.01, days))
+        ],
+        batch_size=1000,
+    )
+    return profile
+
+
+def _legacy_series(qset):
+    dates, closes = zip(*qset.values_list("date", "close"))
+    return pd.Series(closes, index=dates).sort_index().astype(float)
+
+
+def _legacy_frame(tickers):
+    return pd.concat(
+        [
+            _legacy_series(HistoricalEquity.objects.filter(ticker=ticker)).rename(
+                ticker
+            )
+            for ticker in tickers
+        ],
+        axis=1,
+    )
+
+
+def _legacy_returns(profile):
+    dates, returns = zip(
+        *profile.get_cumulative_returns()
+        .order_by("date")
+        .values_list("date", "cumprod")
+    )
+    return pd.Series(returns, index=dates, name="returns")
+
+
+@suite
+def loaders(days=5000, repeat=5):
+    results = []
+    with synthetic_data():
+        _create_prices(days)
+        profile = _create_returns(days)
+        qset = HistoricalEquity.objects.filter(ticker=BENCH_TICKERS[0])
+        rows = len(BENCH_TICKERS) * days
+
+        results.append(
+            measure("prices (values_list)", lambda: _legacy_series(qset), days, repeat)
+        )
+        results.append(
+            measure("prices (load_series)", lambda: load_series(qset), days, repeat)
+        )
+        results.append(
+            measure(
+                "price frame (values_list)",
+                lambda: _legacy_frame(BENCH_TICKERS),
+                rows,
+                repeat,
+            )
+        )
+        results.append(
+            measure(
+                "price frame (load_close_frame)",
+                lambda: load_close_frame(BENCH_TICKERS),
+                rows,
+                repeat,
+            )
+        )
+        results.append(
+            measure(
+                "returns (values_list)", lambda: _legacy_returns(profile), days, repeat
+            )
+        )
+        results.append(
+            measure(
+                "returns (load_cumulative_returns)",
+                lambda: load_cumulative_returns(profile.get_cumulative_returns()),
+                days,
+                repeat,
+            )
+        )
+
+    return results
@@ -0,0 +1,334 @@
+"""Scripted user journeys against a running server, run with `python manage.py loadtest`.
+
+Unlike the suites, the load test talks HTTP to a separate server process (`runserver` or gunicorn
+as in the Procfile) sharing this database. Every virtual user registers, logs in, deposits cash,
+adds trades, uploads a CSV, looks at its portfolio and then polls the leaderboards and graphs until
+the test ends. Each request is timed and grouped by its URL name from `portfoliohut/urls.py`.
+
+Trades are priced from the cached `HistoricalEquity` rows, so the server has to use the
+`OfflineProvider` (otherwise every new ticker would be downloaded from Yahoo Finance).
+
+"""
+import csv
+import http.cookiejar
+import io
+import logging
+import math
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from collections import defaultdict, namedtuple
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from django.urls import reverse
+
+from portfoliohut.models import HistoricalEquity
+
+logger = logging.getLogger(__name__)
+
+Sample = namedtuple("Sample", ["url_name", "seconds", "ok"])
+UrlStats = namedtuple(
+    "UrlStats", ["url_name", "requests", "errors", "p50", "p95", "p99", "throughput"]
+)
+Trade = namedtuple("Trade", ["ticker", "date_time", "price"])
+
+TICKERS = ["AAPL", "MSFT", "NVDA", "V", "MA"]
+# Seconds before a request counts as failed
+TIMEOUT = 60
+# The time of day (ET) of every trade, when the market is always open
+TRADE_TIME = "11:00:00"
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Time the redirect itself instead of the page it points to."""
+
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class Client:
+    """A browser session (cookies and CSRF token) that records a `Sample` per request."""
+
+    def __init__(self, base_url: str, samples: List[Sample]):
+        self.base_url = base_url.rstrip("/")
+        self.samples = samples
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(self.cookies), _NoRedirect
+        )
+
+    def _csrf_token(self) -> str:
+        for cookie in self.cookies:
+            if cookie.name == "csrftoken":
+                return cookie.value
+        return ""
+
+    def request(
+        self,
+        url_name: str,
+        *args,
+        data: Optional[Dict[str, str]] = None,
+        files: Optional[Dict[str, Tuple[str, bytes]]] = None,
+        expect: Optional[str] = None,
+    ) -> str:
+        """GET (or POST when there is `data`) a URL by name and return the page.
+
+        Args:
+            url_name: The name of the URL pattern
+            *args: The arguments of the URL pattern
+            data: The form fields to POST
+            files: The files to upload as `{field: (file name, content)}`
+            expect: Text the page must contain for the request to count as successful (e.g. the
+                message shown after a valid form)
+
+        """
+        url = self.base_url + reverse(url_name, args=args)
+
+        body, headers = None, {}
+        if data is not None:
+            headers["X-CSRFToken"] = self._csrf_token()
+            if files:
+                body, headers["Content-Type"] = _multipart(data, files)
+            else:
+                body = urllib.parse.urlencode(data).encode()
+                headers["Content-Type"] = "application/x-www-form-urlencoded"
+
+        start = time.perf_counter()
+        try:
+            with self.opener.open(
+                urllib.request.Request(url, data=body, headers=headers),
+                timeout=TIMEOUT,
+            ) as response:
+                status, page = response.status, response.read()
+        except urllib.error.HTTPError as e:
+            # Includes the redirects that are not followed
+            status, page = e.code, e.read()
+        except OSError:
+            status, page = None, b""
+        seconds = time.perf_counter() - start
+
+        page = page.decode(errors="replace")
+        ok = status is not None and status < 400 and (expect is None or expect in page)
+        self.samples.append(Sample(url_name, seconds, ok))
+        return page
+
+
+def _multipart(data: Dict[str, str], files: Dict[str, Tuple[str, bytes]]):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in data.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n'
+            f"{value}\r\n".encode()
+        )
+    for name, (file_name, content) in files.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; '
+            f'filename="{file_name}"\r\nContent-Type: text/csv\r\n\r\n'.encode()
+            + content
+            + b"\r\n"
+        )
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+def trade_universe(days: int = 365) -> List[Trade]:
+    """Every buy a journey can make: each ticker on each NYSE session of the last `days` days.
+
+    This fetches the prices of `TICKERS` into the database first, like the server would.
+
+    """
+    import pandas_market_calendars as mcal
+
+    end = date.today() - timedelta(days=1)
+    sessions = set(
+        mcal.get_calendar("NYSE")
+        .schedule(start_date=end - timedelta(days=days), end_date=end)
+        .index.date
+    )
+    trades = []
+    for ticker in TICKERS:
+        closes = HistoricalEquity.objects.get_ticker(ticker).filter(date__in=sessions)
+        trades.extend(
+            Trade(ticker, f"{day} {TRADE_TIME}", close)
+            for day, close in closes.values_list("date", "close")
+        )
+    return trades
+
+
+def user_journey(
+    client: Client,
+    username: str,
+    trades: List[Trade],
+    csv_trades: List[Trade],
+    deadline: float,
+    think_time: float,
+):
+    """Sign up, add transactions and then browse until `deadline` (a `time.monotonic()`)."""
+    password = uuid.uuid4().hex
+    client.request("register")
+    client.request(
+        "register",
+        data={
+            "first_name": "Load",
+            "last_name": "Test",
+            "email": f"{username}@example.com",
+            "username": username,
+            "password": password,
+            "confirm_password": password,
+        },
+    )
+    client.request("login")
+    client.request("login", data={"username": username, "password": password})
+
+    # Deposit before the first trade, then buy
+    first_day = min(trade.date_time for trade in trades + csv_trades)[:10]
+    client.request("add-transaction")
+    client.request(
+        "add-transaction",
+        data={
+            "action": "deposit",
+            "date_time": f"{first_day} 10:00:00",
+            "price": "1000000",
+            "submit_cash": "",
+        },
+        expect="successfully saved",
+    )
+    for trade in trades:
+        client.request(
+            "add-transaction",
+            data={
+                "action": "buy",
+                "date_time": trade.date_time,
+                "ticker": trade.ticker,
+                "quantity": "1",
+                "price": str(trade.price),
+                "submit_stock": "",
+            },
+            expect="successfully saved",
+        )
+
+    rows = io.StringIO()
+    writer = csv.writer(rows)
+    writer.writerow(["action", "date_time", "price", "ticker", "quantity"])
+    for trade in csv_trades:
+        writer.writerow(["buy", trade.date_time, trade.price, trade.ticker, 1])
+    client.request(
+        "add-transaction",
+        data={"submit_csv": ""},
+        files={"csv_file": ("trades.csv", rows.getvalue().encode())},
+        expect="Successfully saved CSV",
+    )
+
+    client.request("portfolio")
+    client.request("transaction-history")
+    # Polled like the pages do (returns recompute in the background, so they may lag). Every
+    # user browses at least once, even if signing up took longer than the test.
+    while True:
+        client.request("global-competition")
+        client.request("display-global-table")
+        page = client.request("friends-competition")
+        client.request("display-friends-table")
+        # The page only draws the friends graph for users with friends
+        if reverse("friends-returns-graph") in page:
+            client.request("friends-returns-graph")
+        client.request("portfolio")
+        client.request("returns-graph")
+        client.request("profile", username)
+        client.request("profile-returns", username)
+        if time.monotonic() >= deadline:
+            break
+        time.sleep(think_time)
+
+
+def _percentile(sorted_values: List[float], percentile: float) -> float:
+    """The nearest-rank percentile of sorted values."""
+    rank = max(math.ceil(percentile / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+def summarize(samples: List[Sample], seconds: float) -> List[UrlStats]:
+    """The latency percentiles (in seconds) and throughput of each URL name."""
+    by_name = defaultdict(list)
+    for sample in samples:
+        by_name[sample.url_name].append(sample)
+
+    stats = []
+    for url_name, url_samples in sorted(by_name.items()):
+        latencies = sorted(sample.seconds for sample in url_samples)
+        stats.append(
+            UrlStats(
+                url_name=url_name,
+                requests=len(url_samples),
+                errors=sum(not sample.ok for sample in url_samples),
+                p50=_percentile(latencies, 50),
+                p95=_percentile(latencies, 95),
+                p99=_percentile(latencies, 99),
+                throughput=len(url_samples) / seconds,
+            )
+        )
+    return stats
+
+
+def run_load_test(
+    base_url: str,
+    users: int,
+    duration: float,
+    trades: int = 5,
+    csv_trades: int = 5,
+    ramp_up: float = 0,
+    think_time: float = 1,
+    seed: int = 0,
+) -> Tuple[List[Sample], float]:
+    """Run `users` concurrent journeys for `duration` seconds.
+
+    Args:
+        base_url: The server, e.g. `http://localhost:8000`
+        users: The number of virtual users (one thread each)
+        duration: Seconds until the users stop browsing
+        trades: Trades each user adds with the form
+        csv_trades: Trades each user uploads in a CSV
+        ramp_up: Seconds over which the users are started
+        think_time: Seconds each user waits between two rounds of browsing
+        seed: Seeds the trades picked by each user
+
+    Returns:
+        The samples of every request and the seconds the test took
+
+    """
+    universe = trade_universe()
+    run_id = uuid.uuid4().hex[:8]
+    samples: List[Sample] = []
+
+    def run_user(i):
+        time.sleep(i * ramp_up / users)
+        # A trade per day and ticker at most, so none look like duplicates
+        picked = sorted(
+            random.Random(seed + i).sample(universe, trades + csv_trades),
+            key=lambda trade: trade.date_time,
+        )
+        try:
+            user_journey(
+                Client(base_url, samples),
+                f"loadtest-{run_id}-{i}",
+                picked[:trades],
+                picked[trades:],
+                deadline,
+                think_time,
+            )
+        except Exception:  # noqa: B902
+            logger.exception("Virtual user %s stopped", i)
+
+    start = time.monotonic()
+    deadline = start + ramp_up + duration
+    threads = [threading.Thread(target=run_user, args=(i,)) for i in range(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, time.monotonic() - start
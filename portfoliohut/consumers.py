@@ -0,0 +1,84 @@
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from django.utils import timezone
+
+from portfoliohut.models import FinancialActionType, PortfolioItem
+from portfoliohut.quotes import QUOTES_GROUP, poller
+
+
+class PortfolioValuationConsumer(AsyncJsonWebsocketConsumer):
+    """Push the market value of the user's holdings whenever the shared poller has new quotes."""
+
+    async def connect(self):
+        user = self.scope.get("user")
+        if user is None or not user.is_authenticated:
+            await self.close()
+            return
+
+        await self.accept()
+        await self.channel_layer.group_add(QUOTES_GROUP, self.channel_name)
+        await self.load_holdings()
+
+    async def disconnect(self, code):
+        poller.unsubscribe(self.channel_name)
+        await self.channel_layer.group_discard(QUOTES_GROUP, self.channel_name)
+
+    async def load_holdings(self):
+        """(Re)load the holdings, subscribe to their tickers and send their valuation."""
+        profile_id, version, self.holdings, self.cash = await self._load_holdings(
+            self.scope["user"]
+        )
+        await poller.subscribe(self.channel_name, self.holdings)
+        poller.watch(self.channel_name, profile_id, version)
+        await self.send_valuation()
+
+    @database_sync_to_async
+    def _load_holdings(self, user):
+        items = list(PortfolioItem.objects.filter(profile__user=user))
+        holdings = {}
+        cash = 0.0
+        for item in items:
+            if item.type == FinancialActionType.EQUITY:
+                if item.quantity != 0:
+                    holdings[item.ticker] = (item.quantity, float(item.price))
+            else:
+                cash += float(item.price) * (1 if item.quantity > 0 else -1)
+        # The same version as `portfolio_versions` (the items are rebuilt, never updated)
+        version = max((item.created for item in items), default=None)
+        return user.profile.pk, version, holdings, cash
+
+    async def portfolio_changed(self, event):
+        # Sent by the poller once a transaction rebuilt the holdings (in any process)
+        await self.load_holdings()
+
+    async def quotes_update(self, event):
+        # Every consumer gets every broadcast, only answer if one of our tickers moved
+        if self.holdings.keys() & event["quotes"].keys():
+            await self.send_valuation()
+
+    async def send_valuation(self):
+        positions = []
+        total = self.cash
+        for ticker, (quantity, cost) in sorted(self.holdings.items()):
+            price = poller.quotes.get(ticker)
+            value = None if price is None else price * quantity
+            positions.append(
+                {
+                    "ticker": ticker,
+                    "quantity": quantity,
+                    "cost": cost,
+                    "price": price,
+                    "value": value,
+                }
+            )
+            # Fall back to the cost basis until there is a quote
+            total += value if value is not None else cost * quantity
+
+        await self.send_json(
+            {
+                "positions": positions,
+                "cash": self.cash,
+                "total": total,
+                "as_of": timezone.now().isoformat(),
+            }
+        )
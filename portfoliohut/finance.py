@@ -2,8 +2,6 @@
 from collections import namedtuple
 from typing import Dict, List, Tuple
 
-import yfinance as yf
-
 TickerDetail = namedtuple(
     "TickerDetail", ["ticker", "prices", "total_value", "website"]
 )
@@ -20,6 +18,8 @@ def get_current_prices(stock_map: Dict[str, float]) -> Tuple[List[TickerDetail],
             all stocks in the portfolio.
 
     """
+    import yfinance as yf
+
     total = 0
     result = []
     for ticker, quantity in stock_map.items():
@@ -1,8 +1,9 @@
 """PortfolioHut Forms"""
 
 from .account_management import LoginForm, RegisterForm
+from .graph import GraphRangeForm
 from .profile import ProfileForm
-from .transactions import CashForm, CSVForm, StockForm
+from .transactions import CashForm, CSVForm, SimulatedTransactionForm, StockForm
 
 __all__ = [
     "LoginForm",
@@ -10,5 +11,7 @@ __all__ = [
     "CashForm",
     "CSVForm",
     "StockForm",
+    "SimulatedTransactionForm",
     "ProfileForm",
+    "GraphRangeForm",
 ]
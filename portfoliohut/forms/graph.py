@@ -0,0 +1,47 @@
+from datetime import timedelta
+
+from django import forms
+from django.utils import timezone
+
+from portfoliohut.models import Resolution
+
+# Spans (in days) above which the graphs switch to weekly and monthly points
+WEEKLY_AFTER_DAYS = 366
+MONTHLY_AFTER_DAYS = 3 * 366
+
+
+class GraphRangeForm(forms.Form):
+    """The optional date range and resolution of a returns graph (the query string)."""
+
+    start = forms.DateField(required=False)
+    end = forms.DateField(required=False)
+    resolution = forms.ChoiceField(choices=Resolution.choices, required=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start = cleaned_data.get("start")
+        end = cleaned_data.get("end")
+        if start is not None and end is not None and start > end:
+            raise forms.ValidationError("The start date must be before the end date")
+        return cleaned_data
+
+    def get_resolution(self, first_date) -> str:
+        """The requested resolution or the one that keeps the graph to a few hundred points.
+
+        Args:
+            first_date: The first date with data (used if there is no start date)
+
+        """
+        if self.cleaned_data.get("resolution"):
+            return self.cleaned_data["resolution"]
+
+        start = self.cleaned_data.get("start") or first_date
+        end = self.cleaned_data.get("end") or timezone.now().date()
+        if start is None:
+            return Resolution.DAILY
+        span = end - start
+        if span > timedelta(days=MONTHLY_AFTER_DAYS):
+            return Resolution.MONTHLY
+        if span > timedelta(days=WEEKLY_AFTER_DAYS):
+            return Resolution.WEEKLY
+        return Resolution.DAILY
@@ -1,12 +1,12 @@
-import pandas as pd
-import pandas_market_calendars as mcal
-from bootstrap_datepicker_plus import DateTimePickerInput
+import time
+
 from django import forms
 from django.core.validators import FileExtensionValidator
 from django.db import models, transaction
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
+from portfoliohut.metrics import CSV_IMPORT_THROUGHPUT
 from portfoliohut.models import (
     FinancialActionType,
     HistoricalEquity,
@@ -43,6 +43,8 @@ class BaseTransactionForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         self.profile: Profile = kwargs.pop("profile", None)
         super().__init__(*args, **kwargs)
+        from bootstrap_datepicker_plus import DateTimePickerInput
+
         self.fields["date_time"].widget = DateTimePickerInput(
             options={"maxDate": timezone.now().strftime("%Y-%m-%d 23:59:59")},
         )
@@ -56,6 +58,8 @@ class BaseTransactionForm(forms.ModelForm):
         if date_time > timezone.now():
             raise forms.ValidationError("Invalid date: Date cannot be in the future")
 
+        import pandas_market_calendars as mcal
+
         # Validate time: NYSE must be open at the given time of transaction
         nyse = mcal.get_calendar("NYSE")
         # The times are in UTC by default but incoming times are in ET
@@ -118,12 +122,14 @@ class StockForm(BaseTransactionForm):
         # Validate that the ticker exists in our historical cache
         date_time = cleaned_data.get("date_time")
         date = date_time.date()
-        ticker_date_qset = ticker_qset.filter(date=date_time.date())
-        if not ticker_date_qset.exists():
+        bar = HistoricalEquity.objects.get_bar(ticker, date)
+        if bar is None:
             raise forms.ValidationError(
                 "Invalid date: Could not find the ticker on the given date"
             )
 
+        import pandas_market_calendars as mcal
+
         # Validate time: NYSE must be open at the given time of transaction
         nyse = mcal.get_calendar("NYSE")
         # the times are in UTC by default but incoming times are in ET
@@ -144,8 +150,8 @@ class StockForm(BaseTransactionForm):
         # Validate price: Price must be between the lowest and highest prices for the ticker on the
         # given date
         price = cleaned_data.get("price")
-        high = ticker_date_qset.first().high
-        low = ticker_date_qset.first().low
+        high = bar.high
+        low = bar.low
         if not low <= price <= high:
             raise forms.ValidationError(
                 f"Invalid stock price: Price must be between ${low} and ${high} on "
@@ -287,6 +293,8 @@ class CSVForm(forms.Form):
         super().__init__(*args, **kwargs)
 
     def clean(self):
+        import pandas as pd
+
         cleaned_data = super().clean()
 
         try:
@@ -303,6 +311,7 @@ class CSVForm(forms.Form):
         ]:
             raise forms.ValidationError("Malformed CSV columns.")
 
+        start = time.perf_counter()
         with transaction.atomic():
             for idx, row in csv_df.iterrows():
                 FormClass = StockForm if row["action"] in StockAction else CashForm
@@ -315,4 +324,60 @@ class CSVForm(forms.Form):
 
                 row_form.save(skip_post_add_steps=True)
 
-            Transaction.objects.post_add_transaction_steps(profile=self.profile)
+            Transaction.objects.schedule_post_add_transaction_steps(
+                profile=self.profile
+            )
+        CSV_IMPORT_THROUGHPUT.observe(len(csv_df) / (time.perf_counter() - start))
+
+
+class SimulatedTransactionForm(forms.Form):
+    """A hypothetical transaction for the what-if simulator (it is never saved).
+
+    Unlike `StockForm` and `CashForm` the transaction isn't checked against the market hours or
+    the cash and shares available, it only has to have prices to be valued with.
+
+    Attributes:
+        action: a value from `StockAction` or `CashAction`
+        date_time: The date and time of the transaction
+        ticker: The ticker of the stock (stock actions only)
+        quantity: The number of shares (stock actions only)
+        price: The price of a share or the amount of cash
+
+    """
+
+    action = forms.ChoiceField(choices=StockAction.choices + CashAction.choices)
+    date_time = forms.DateTimeField()
+    ticker = forms.CharField(max_length=20, required=False)
+    quantity = forms.IntegerField(min_value=1, required=False)
+    price = forms.DecimalField(max_digits=100, decimal_places=2)
+
+    def clean_date_time(self):
+        date_time = self.cleaned_data.get("date_time")
+        if date_time > timezone.now():
+            raise forms.ValidationError("Invalid date: Date cannot be in the future")
+        return date_time
+
+    def clean_ticker(self):
+        return self.cleaned_data.get("ticker").upper()
+
+    def clean_price(self):
+        price = self.cleaned_data.get("price")
+        if price <= 0:
+            raise forms.ValidationError(
+                "Invalid price: Value must be strictly positive"
+            )
+        return price
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get("action") not in StockAction:
+            return cleaned_data
+
+        ticker = cleaned_data.get("ticker")
+        if not ticker or not cleaned_data.get("quantity"):
+            raise forms.ValidationError(
+                "Stock transactions need a ticker and a quantity"
+            )
+        if not HistoricalEquity.objects.get_ticker(ticker).exists():
+            raise forms.ValidationError("Invalid ticker: Ticker must be in the NYSE")
+        return cleaned_data
@@ -1,10 +1,12 @@
 # from datetime import datetime
 # import plotly.express as px
 
-import pandas as pd
-import plotly.graph_objects as go
+# pandas, plotly and the loaders are imported where they are used so that importing the views
+# doesn't load them (see `python manage.py benchmark imports`)
+from portfoliohut.models import EquityRollup, HistoricalEquity, Resolution
 
-from portfoliohut.models import HistoricalEquity
+# The ticker the returns are compared against
+INDEX_TICKER = "SPY"
 
 
 def combine_data(list_series, friends_list, user_returns, index_returns):
@@ -12,6 +14,8 @@ def combine_data(list_series, friends_list, user_returns, index_returns):
     Converts a list of dataframe into a formatted data frame for multi_plot to
     plot the returns data. Use the date time field as the index.
     """
+    import pandas as pd
+
     new_series_list = []
     for friends_returns, friends_name in zip(list_series, friends_list):
         new_df = friends_returns
@@ -25,6 +29,8 @@ def combine_data(list_series, friends_list, user_returns, index_returns):
 
 
 def multi_plot(df, addAll=True):
+    import plotly.graph_objects as go
+
     fig = go.Figure()
     fig.update_layout(legend_title_text="Time Weighted Cumulative Returns")
     fig.update_xaxes(title_text="Date")
@@ -88,26 +94,50 @@ def multi_plot(df, addAll=True):
 
 
 def combine_index_user(user_returns, index_returns):
+    import pandas as pd
+
     user_returns = user_returns.rename("My Returns")
     index_returns = index_returns.rename("S&P 500")
     merged_df = pd.concat([user_returns, index_returns], axis=1)
     return merged_df.dropna()
 
 
-def _get_sp_index(start_date=None):
-    if start_date is not None:
-        dates, closes = zip(
-            *HistoricalEquity.objects.get_ticker("SPY")
-            .filter(date__gte=start_date)
-            .values_list("date", "close")
-        )
+def _get_sp_index(base_date=None, start=None, end=None, resolution=Resolution.DAILY):
+    """Get the cumulative returns (in %) of the index since the first close on or after `base_date`.
 
+    Args:
+        base_date: The date the returns are relative to (defaults to the first close)
+        start: Only dates on or after this date
+        end: Only dates on or before this date
+        resolution: Every close or the last close of each week/month (`EquityRollup`)
+
+    """
+    from portfoliohut.loaders import load_close_frame, load_series
+
+    sp_qset = HistoricalEquity.objects.get_ticker(INDEX_TICKER)
+    if base_date is not None:
+        sp_qset = sp_qset.filter(date__gte=base_date)
+    base_close = HistoricalEquity.objects.first_close(INDEX_TICKER, base_date)
+    if base_close is None:
+        return load_series(sp_qset)
+
+    if resolution == Resolution.DAILY:
+        # Older daily closes may only be in the price archive
+        starts = [day for day in (base_date, start) if day is not None]
+        close_series = (
+            load_close_frame([INDEX_TICKER], max(starts, default=None), end)
+            .reindex(columns=[INDEX_TICKER])[INDEX_TICKER]
+            .rename(None)
+        )
     else:
-        dates, closes = zip(
-            *HistoricalEquity.objects.get_ticker("SPY").values_list("date", "close")
+        sp_qset = EquityRollup.objects.filter(
+            ticker=INDEX_TICKER, resolution=resolution
         )
-
-    close_series = pd.Series(closes, index=dates).sort_index().astype(float)
-    running_returns = close_series.dropna().pct_change()
-    cumulative_series = (((1 + running_returns).cumprod()) - 1) * 100
-    return cumulative_series
+        if base_date is not None:
+            sp_qset = sp_qset.filter(date__gte=base_date)
+        if start is not None:
+            sp_qset = sp_qset.filter(date__gte=start)
+        if end is not None:
+            sp_qset = sp_qset.filter(date__lte=end)
+        close_series = load_series(sp_qset)
+    return (close_series / float(base_close) - 1) * 100
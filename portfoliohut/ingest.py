@@ -0,0 +1,170 @@
+"""Write yfinance price history straight into the `HistoricalEquity` table.
+
+Building a model instance per row for `bulk_create` dominates a `period="max"` backfill (10k+ rows
+for an old ticker). Here the frame is converted column by column and written with raw SQL:
+
+* on Postgres the rows are streamed with `COPY` into a temporary table and merged with
+  `INSERT ... SELECT ... ON CONFLICT`
+* on other databases (SQLite) they are written with batched `executemany` upserts
+
+Rows that already exist for a `(ticker, date)` are overwritten, so ingesting the same frame twice is
+harmless. With the price archive enabled every price is also written to the archive and only the
+ones on or after `archive.cutoff()` to the database (see `portfoliohut/archive.py`).
+
+"""
+import io
+import uuid
+
+import numpy as np
+import pandas as pd
+from django.db import connections, transaction
+
+from portfoliohut import archive
+from portfoliohut.models import FinancialActionType, HistoricalEquity
+
+BATCH_SIZE = 1000
+
+# yfinance column for each `HistoricalEquity` field
+COLUMNS = {
+    "date": "Date",
+    "open": "Open",
+    "high": "High",
+    "low": "Low",
+    "close": "Close",
+    "volume": "Volume",
+    "dividends": "Dividends",
+    "stock_splits": "Stock Splits",
+}
+DECIMAL_FIELDS = ["open", "high", "low", "close", "dividends"]
+INTEGER_FIELDS = ["volume", "stock_splits"]
+
+
+def _price_frame(ticker: str, df: pd.DataFrame) -> pd.DataFrame:
+    """Convert a yfinance history frame to the column values of `HistoricalEquity` rows."""
+    df = df.reset_index().dropna(subset=["Open", "Close"])
+    rows = {
+        "type": FinancialActionType.EQUITY.value,
+        "ticker": ticker,
+        # Dates are converted in the exchange time zone (like `Timestamp.date()`)
+        "date": pd.to_datetime(df[COLUMNS["date"]]).dt.strftime("%Y-%m-%d").values,
+    }
+    for field in DECIMAL_FIELDS:
+        # Rounded the same way `FixedPointField` rounds a float
+        places = HistoricalEquity._meta.get_field(field).decimal_places
+        rows[field] = (
+            df[COLUMNS[field]].map(f"{{:.{places}f}}".format, na_action="ignore").values
+        )
+    for field in INTEGER_FIELDS:
+        # Truncated like `IntegerField` does with floats (e.g. a 0.5 stock split)
+        rows[field] = (
+            np.trunc(df[COLUMNS[field]].astype("float64")).astype("Int64").values
+        )
+    return pd.DataFrame(rows, index=range(len(df)))
+
+
+def _fixed_point(rows: pd.DataFrame) -> pd.DataFrame:
+    """Replace the formatted prices with the whole cents `FixedPointField` stores."""
+    rows = rows.copy()
+    for field in DECIMAL_FIELDS:
+        # The digits of "123.45" are 12345 cents
+        digits = rows[field].str.replace(".", "", regex=False)
+        rows[field] = pd.to_numeric(digits).astype("Int64").values
+    return rows
+
+
+def _upsert_sql(connection, source: str, columns) -> str:
+    qn = connection.ops.quote_name
+    table = qn(HistoricalEquity._meta.db_table)
+    names = ", ".join(qn(column) for column in columns)
+    updates = ", ".join(
+        f"{qn(column)} = excluded.{qn(column)}"
+        for column in columns
+        if column not in ("ticker", "date")
+    )
+    return (
+        f"INSERT INTO {table} ({names}) {source} "
+        f"ON CONFLICT ({qn('ticker')}, {qn('date')}) DO UPDATE SET {updates}"
+    )
+
+
+def _copy_rows(connection, rows: pd.DataFrame) -> int:
+    qn = connection.ops.quote_name
+    columns = list(rows.columns)
+    buffer = io.StringIO()
+    rows.to_csv(buffer, sep="\t", header=False, index=False, na_rep="\\N")
+    buffer.seek(0)
+
+    names = ", ".join(qn(column) for column in columns)
+    # Ingests can be nested in one transaction (e.g. every new ticker of a CSV upload), so each
+    # gets a table of its own and drops it right after the merge instead of at the commit
+    staging = qn(f"portfoliohut_ingest_{uuid.uuid4().hex}")
+
+    with connection.cursor() as cursor:
+        # Same column types as the target table, but without its id and constraints
+        cursor.execute(
+            f"CREATE TEMPORARY TABLE {staging} ON COMMIT DROP AS "
+            f"SELECT {names} FROM {qn(HistoricalEquity._meta.db_table)} WITH NO DATA"
+        )
+        cursor.copy_expert(f"COPY {staging} ({names}) FROM STDIN", buffer)
+        cursor.execute(
+            _upsert_sql(connection, f"SELECT {names} FROM {staging}", columns)
+        )
+        written = cursor.rowcount
+        cursor.execute(f"DROP TABLE {staging}")
+        return written
+
+
+def _executemany_rows(connection, rows: pd.DataFrame) -> int:
+    columns = list(rows.columns)
+    sql = _upsert_sql(
+        connection, f"VALUES ({', '.join(['%s'] * len(columns))})", columns
+    )
+    # `object` turns `pd.NA` and NumPy scalars into plain Python values the driver accepts
+    values = rows.astype(object).where(rows.notna(), None)
+    records = list(values.itertuples(index=False, name=None))
+    with connection.cursor() as cursor:
+        for i in range(0, len(records), BATCH_SIZE):
+            cursor.executemany(sql, records[i : i + BATCH_SIZE])
+    return len(records)
+
+
+def ingest_prices(
+    ticker: str, df: pd.DataFrame, using: str = "default", method: str = None
+) -> int:
+    """Insert (or overwrite) the price history of `ticker`.
+
+    Args:
+        ticker: The ticker the prices belong to
+        df: A `yf.Ticker(ticker).history()` frame (indexed by date)
+        using: The database alias to write to
+        method: "copy" or "executemany" (defaults to "copy" on Postgres)
+
+    Returns:
+        int: The number of prices written (to the database or the archive)
+
+    """
+    rows = _price_frame(ticker, df)
+    if rows.empty:
+        return 0
+
+    archived = 0
+    cutoff = archive.cutoff()
+    if cutoff is not None:
+        archived = archive.write(ticker, rows[archive.COLUMNS])
+        # ISO dates compare like the dates
+        rows = rows[rows["date"] >= cutoff.isoformat()]
+        if rows.empty:
+            return archived
+
+    rows = _fixed_point(rows)
+    connection = connections[using]
+    if method is None:
+        method = "copy" if connection.vendor == "postgresql" else "executemany"
+    # A failed merge leaves neither rows nor its temporary table behind
+    with transaction.atomic(using=using):
+        if method == "copy":
+            written = _copy_rows(connection, rows)
+        else:
+            written = _executemany_rows(connection, rows)
+    # The archived prices include the ones written to the database
+    return archived or written
@@ -0,0 +1,75 @@
+"""Background tasks for the database backed job queue.
+
+Tasks are plain functions registered with `@task`. Their keyword arguments are stored as the JSON
+payload of a `Job` and `python manage.py run_worker` runs them outside of the request cycle.
+
+"""
+from typing import Callable, Dict
+
+from django.conf import settings
+
+from portfoliohut.models import EquityInfo, HistoricalEquity, Job, ReturnsRecompute
+
+TASKS: Dict[str, Callable] = {}
+
+
+def task(func: Callable) -> Callable:
+    """Register `func` as a task under its own name."""
+    TASKS[func.__name__] = func
+    return func
+
+
+def get_task(name: str) -> Callable:
+    try:
+        return TASKS[name]
+    except KeyError:
+        raise LookupError(f"no task named '{name}' is registered")
+
+
+@task
+def recompute_returns(profile_id: int):
+    """Run the pending `ReturnsRecompute` for a profile (if it is still pending)."""
+    pending = (
+        ReturnsRecompute.objects.select_related("profile")
+        .filter(profile_id=profile_id)
+        .first()
+    )
+    if pending is None:
+        return
+
+    if not ReturnsRecompute.objects.run(pending):
+        # Another worker is recomputing this profile, check back once it is likely done
+        Job.objects.enqueue(
+            "recompute_returns",
+            {"profile_id": profile_id},
+            delay=settings.PORTFOLIOHUT_RECOMPUTE_DELAY,
+            dedup_key=f"recompute_returns:{profile_id}",
+        )
+
+
+@task
+def recompute_all_returns(profile_ids=None):
+    """Recompute the returns of many (default all) profiles with the batch engine."""
+    from portfoliohut.batch_returns import recompute_all_returns
+
+    recompute_all_returns(profile_ids)
+
+
+@task
+def roll_forward_returns(profile_ids=None):
+    """Append the returns of the new days of many (default all) profiles."""
+    from portfoliohut.batch_returns import roll_forward_returns
+
+    roll_forward_returns(profile_ids)
+
+
+@task
+def refresh_ticker(ticker: str):
+    """Download any missing price history for a ticker."""
+    HistoricalEquity.objects.get_ticker(ticker)
+
+
+@task
+def fetch_equity_info(ticker: str):
+    """Backfill the company information (and logo) for a ticker."""
+    EquityInfo.objects.get_ticker(ticker)
@@ -0,0 +1,214 @@
+"""Load price and returns history straight into NumPy arrays.
+
+Going through `values_list` builds a `datetime.date` and a `Decimal` for every row before pandas
+converts them to floats. These loaders instead have the database send dates as integer days since
+the epoch and prices as floats, and copy the cursor rows chunk by chunk into preallocated
+`int64`/`float64` arrays.
+
+"""
+from datetime import timedelta
+from typing import Iterable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connections, models
+from django.db.models import (
+    Case,
+    F,
+    FloatField,
+    Func,
+    IntegerField,
+    QuerySet,
+    Value,
+    When,
+)
+from django.db.models.functions import Cast
+
+from portfoliohut import archive
+from portfoliohut.models import HistoricalEquity
+from portfoliohut.models.fields import FixedPointField
+
+CHUNK_SIZE = 2000
+
+
+class EpochDays(Func):
+    """The number of days between a date column and 1970-01-01."""
+
+    output_field = models.IntegerField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler,
+            connection,
+            template="CAST(julianday(%(expressions)s) - 2440587.5 AS INTEGER)",
+            **extra_context,
+        )
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler,
+            connection,
+            template="(%(expressions)s - DATE '1970-01-01')",
+            **extra_context,
+        )
+
+
+def _fetch_arrays(qset: QuerySet, size: Optional[int] = None) -> Tuple[np.ndarray, ...]:
+    """Stream a `(day, value, ...)` queryset into an `int64` array and `float64` arrays.
+
+    Args:
+        qset: A `values_list` queryset of `(day, value, ...)` rows of numbers
+        size: The expected number of rows (the arrays double in size as needed if not given)
+
+    Returns:
+        The days as `int64` and every other column as `float64`
+
+    """
+    if size is None:
+        size = CHUNK_SIZE
+    table = np.empty((size, len(qset._fields)), dtype="float64")
+    sql, params = qset.query.sql_with_params()
+    filled = 0
+    # A chunked cursor is a server side cursor on Postgres, so only CHUNK_SIZE rows are in memory
+    with connections[qset.db].chunked_cursor() as cursor:
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(CHUNK_SIZE)
+            if not rows:
+                break
+            end = filled + len(rows)
+            if end > len(table):
+                grown = np.empty((max(end, 2 * len(table)), table.shape[1]))
+                grown[:filled] = table[:filled]
+                table = grown
+            table[filled:end] = rows
+            filled = end
+
+    days, *values = table[:filled].T
+    return (days.astype("int64"), *(np.ascontiguousarray(v) for v in values))
+
+
+def _float_value(qset: QuerySet, value_field: str):
+    try:
+        field = qset.model._meta.get_field(value_field)
+    except FieldDoesNotExist:
+        field = None
+    if isinstance(field, FixedPointField):
+        return field.to_float(F(value_field))
+    return Cast(F(value_field), output_field=FloatField())
+
+
+def _day_value_qset(
+    qset: QuerySet, date_field: str, value_field: str, order_by=None, **extra
+) -> QuerySet:
+    # The raw query selects the annotations in the order they are added, after the day and value
+    return (
+        qset.annotate(
+            _day=EpochDays(F(date_field)),
+            _value=_float_value(qset, value_field),
+            **extra,
+        )
+        .order_by(*(order_by or [date_field]))
+        .values_list("_day", "_value", *extra)
+    )
+
+
+def _to_index(days: np.ndarray) -> pd.DatetimeIndex:
+    return pd.DatetimeIndex(days.astype("datetime64[D]"))
+
+
+def load_series(
+    qset: QuerySet,
+    date_field: str = "date",
+    value_field: str = "close",
+    name: Optional[str] = None,
+) -> pd.Series:
+    """Load one numeric column of a queryset as a float `pd.Series` indexed by date.
+
+    Args:
+        qset: The queryset to read (filters and annotations are kept)
+        date_field: The date column to index by (rows are sorted by it)
+        value_field: The numeric column (or annotation) to load
+        name: The name of the returned series
+
+    Returns:
+        pd.Series: `float64` values with a `pd.DatetimeIndex`
+
+    """
+    # Counting is a cheap index scan for plain querysets but would evaluate annotations (e.g. the
+    # cumulative return window) twice
+    size = None if qset.query.annotations else qset.count()
+    days, values = _fetch_arrays(_day_value_qset(qset, date_field, value_field), size)
+    return pd.Series(values, index=_to_index(days), name=name, dtype="float64")
+
+
+def load_close_frame(
+    tickers: Iterable[str], start_date=None, end_date=None
+) -> pd.DataFrame:
+    """Load the close prices of several tickers as a dates x tickers `pd.DataFrame`.
+
+    The prices are read with a single query sorted by ticker and date. Each row carries the column
+    of its ticker as a small integer (computed by the database), so no ticker strings are
+    transferred per row and the rows place themselves even if prices change while they are
+    streamed. Prices before `archive.cutoff()` are read from the price archive (only
+    the close column). Missing prices are NaN.
+
+    Note:
+        This only reads the cached prices, use `HistoricalEquity.objects.get_ticker` first to
+        make sure that they are up to date.
+
+    """
+    tickers = sorted(set(tickers))
+    archived = None
+    cutoff = archive.cutoff()
+    if cutoff is not None and (start_date is None or start_date < cutoff):
+        archive_end = cutoff - timedelta(days=1)
+        archived = (
+            archive.read(
+                tickers,
+                ["close"],
+                start_date,
+                archive_end if end_date is None else min(end_date, archive_end),
+            )
+            .pivot(index="date", columns="ticker", values="close")
+            .rename_axis(index=None, columns=None)
+        )
+        start_date = cutoff
+
+    qset = HistoricalEquity.objects.filter(ticker__in=tickers)
+    if start_date is not None:
+        qset = qset.filter(date__gte=start_date)
+    if end_date is not None:
+        qset = qset.filter(date__lte=end_date)
+
+    if tickers:
+        column = Case(
+            *(When(ticker=ticker, then=Value(i)) for i, ticker in enumerate(tickers)),
+            output_field=IntegerField(),
+        )
+        days, closes, columns = _fetch_arrays(
+            _day_value_qset(
+                qset, "date", "close", order_by=["ticker", "date"], _column=column
+            )
+        )
+    else:
+        days, closes, columns = np.empty(0, dtype="int64"), np.empty(0), np.empty(0)
+
+    all_days = np.unique(days)
+    priced = np.unique(columns.astype("int64"))
+    matrix = np.full((len(all_days), len(priced)), np.nan)
+    matrix[np.searchsorted(all_days, days), np.searchsorted(priced, columns)] = closes
+
+    frame = pd.DataFrame(
+        matrix, index=_to_index(all_days), columns=[tickers[i] for i in priced]
+    )
+    if archived is None:
+        return frame
+    combined = pd.concat([archived, frame])
+    return combined.reindex(columns=sorted(combined.columns))
+
+
+def load_cumulative_returns(qset: QuerySet) -> pd.Series:
+    """Load a `Profile.get_cumulative_returns` queryset as a float `pd.Series`."""
+    return load_series(qset, "date", "cumprod", name="returns")
@@ -0,0 +1,39 @@
+from django.core.management import BaseCommand, CommandError
+
+from portfoliohut import archive
+from portfoliohut.models import HistoricalEquity
+
+
+class Command(BaseCommand):
+    help = (
+        "Move the prices older than PRICE_ARCHIVE_KEEP_DAYS from the database to the price "
+        "archive in PRICE_ARCHIVE_DIR (run once when enabling the archive and then e.g. weekly)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--tickers",
+            nargs="+",
+            help="Only these tickers (defaults to every ticker with prices to archive).",
+        )
+
+    def handle(self, *args, **options):
+        cutoff = archive.cutoff()
+        if cutoff is None:
+            raise CommandError("Set PRICE_ARCHIVE_DIR to enable the price archive")
+
+        tickers = options["tickers"] or sorted(
+            set(
+                HistoricalEquity.objects.filter(date__lt=cutoff).values_list(
+                    "ticker", flat=True
+                )
+            )
+        )
+        total = 0
+        for ticker in tickers:
+            moved = HistoricalEquity.objects.archive_old_prices(ticker)
+            total += moved
+            self.stdout.write(f"Archived {moved} prices of {ticker}")
+        self.stdout.write(
+            f"Archived {total} prices before {cutoff} of {len(tickers)} ticker(s)"
+        )
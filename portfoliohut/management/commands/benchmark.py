@@ -0,0 +1,47 @@
+from importlib import import_module
+
+from django.core.management import BaseCommand, CommandError
+
+from portfoliohut.benchmarks import SUITES
+
+# Every benchmark module registers its suite on import
+SUITE_MODULES = ["engine", "fixed_point", "imports", "ingest", "loaders"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Run a benchmark suite and report time, peak memory and (where measured) table size "
+        "per measurement."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("suite", choices=SUITE_MODULES)
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=5,
+            help="Number of timed runs per measurement (the best is reported).",
+        )
+
+    def handle(self, *args, **kwargs):
+        import_module(f"portfoliohut.benchmarks.{kwargs['suite']}")
+        try:
+            results = SUITES[kwargs["suite"]](repeat=kwargs["repeat"])
+        except Exception as e:  # noqa: B902
+            raise CommandError(f"benchmark '{kwargs['suite']}' failed: {e}")
+
+        width = max(len(result.name) for result in results)
+        self.stdout.write(
+            f"{'measurement':<{width}}  {'rows':>9}  {'ms':>10}  {'rows/s':>10}  "
+            f"{'peak KiB':>10}  {'size KiB':>10}"
+        )
+        for result in results:
+            rate = result.rows / result.seconds if result.rows else 0
+            size = (
+                "-" if result.size_bytes is None else f"{result.size_bytes / 1024:.1f}"
+            )
+            self.stdout.write(
+                f"{result.name:<{width}}  {result.rows:>9}  "
+                f"{result.seconds * 1000:>10.2f}  {rate:>10.0f}  "
+                f"{result.peak_bytes / 1024:>10.1f}  {size:>10}"
+            )
@@ -0,0 +1,90 @@
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+
+from portfoliohut.benchmarks.loadtest import run_load_test, summarize
+from portfoliohut.providers import OfflineProvider, get_provider
+
+
+class Command(BaseCommand):
+    help = (
+        "Run scripted user journeys against a running server and report latency percentiles "
+        "and throughput per URL name."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--base-url",
+            default="http://localhost:8000",
+            help="The server to load (it must share this database).",
+        )
+        parser.add_argument(
+            "--users", type=int, default=10, help="Number of concurrent users."
+        )
+        parser.add_argument(
+            "--duration",
+            type=float,
+            default=60,
+            help="Seconds the users keep browsing after they started.",
+        )
+        parser.add_argument(
+            "--ramp-up",
+            type=float,
+            default=0,
+            help="Seconds over which the users are started.",
+        )
+        parser.add_argument(
+            "--trades", type=int, default=5, help="Trades each user adds with the form."
+        )
+        parser.add_argument(
+            "--csv-trades",
+            type=int,
+            default=5,
+            help="Trades each user uploads in a CSV.",
+        )
+        parser.add_argument(
+            "--think-time",
+            type=float,
+            default=1,
+            help="Seconds each user waits between two rounds of browsing.",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **kwargs):
+        if not isinstance(get_provider(), OfflineProvider):
+            raise CommandError(
+                "load tests need the offline market data provider, start the server and this "
+                "command with MARKET_DATA_PROVIDER=portfoliohut.providers.OfflineProvider "
+                f"(not {settings.PORTFOLIOHUT_MARKET_DATA_PROVIDER})"
+            )
+
+        samples, seconds = run_load_test(
+            kwargs["base_url"],
+            users=kwargs["users"],
+            duration=kwargs["duration"],
+            trades=kwargs["trades"],
+            csv_trades=kwargs["csv_trades"],
+            ramp_up=kwargs["ramp_up"],
+            think_time=kwargs["think_time"],
+            seed=kwargs["seed"],
+        )
+        if not samples:
+            raise CommandError("no requests were made")
+
+        stats = summarize(samples, seconds)
+        width = max(len(url_stats.url_name) for url_stats in stats)
+        self.stdout.write(
+            f"{'url name':<{width}}  {'requests':>8}  {'errors':>6}  {'p50 ms':>8}  "
+            f"{'p95 ms':>8}  {'p99 ms':>8}  {'req/s':>7}"
+        )
+        for url_stats in stats:
+            self.stdout.write(
+                f"{url_stats.url_name:<{width}}  {url_stats.requests:>8}  "
+                f"{url_stats.errors:>6}  {url_stats.p50 * 1000:>8.1f}  "
+                f"{url_stats.p95 * 1000:>8.1f}  {url_stats.p99 * 1000:>8.1f}  "
+                f"{url_stats.throughput:>7.2f}"
+            )
+        errors = sum(url_stats.errors for url_stats in stats)
+        self.stdout.write(
+            f"{len(samples)} requests ({errors} errors) in {seconds:.1f}s, "
+            f"{len(samples) / seconds:.2f} req/s"
+        )
@@ -15,7 +15,7 @@ from django.db import transaction
 from tqdm import tqdm
 
 from portfoliohut.forms import CSVForm
-from portfoliohut.models import HistoricalEquity, Profile
+from portfoliohut.models import HistoricalEquity, Profile, ReturnsRecompute
 
 REPO_PATH = Path(__file__).parent / "../../.."
 
@@ -120,16 +120,14 @@ def create_complex_user(seed: int):
             .dt.to_pydatetime()
         )
         stock_actions = ["buy"] * unique_ticker_count + ["sell", "buy"] * sell_buy_count
-        # TODO: update this list comprehension to use `HistoricalEquity` for a speed increase
-        stock_prices = [
+        stock_prices = []
+        for ticker, date_time in zip(
+            stock_tickers + stock_tickers[: sell_buy_count * 2], stock_date_times
+        ):
             HistoricalEquity.objects.get_ticker(ticker)
-            .filter(date=date_time.date())
-            .first()
-            .close
-            for ticker, date_time in zip(
-                stock_tickers + stock_tickers[: sell_buy_count * 2], stock_date_times
+            stock_prices.append(
+                HistoricalEquity.objects.get_bar(ticker, date_time.date()).close
             )
-        ]
         initial_balance = Decimal(500_000.00)
         stock_quantities = [
             max(round(initial_balance / total_stocks / price), 1)
@@ -172,6 +170,9 @@ def load_demo_users():
     # number "4"
     create_simple_user(number_users + 1)
 
+    # The CSV uploads only queue the recomputes, run them now so the demo users have returns
+    ReturnsRecompute.objects.process_due(force=True)
+
 
 class Command(BaseCommand):
     help = "Create fake data for portfoliohut."
@@ -0,0 +1,18 @@
+from django.core.management import BaseCommand
+
+from portfoliohut.models import ReturnsRecompute
+
+
+class Command(BaseCommand):
+    help = "Run the pending (coalesced) portfolio returns recomputes."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Run every pending recompute, even if its debounce window has not passed.",
+        )
+
+    def handle(self, *args, **kwargs):
+        count = ReturnsRecompute.objects.process_due(force=kwargs["force"])
+        self.stdout.write(f"Ran {count} returns recompute(s)")
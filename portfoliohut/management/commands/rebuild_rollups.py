@@ -0,0 +1,39 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from portfoliohut.models import HistoricalEquity, PortfolioReturn, PortfolioReturnRollup
+
+DEFAULT_CHUNK_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the weekly and monthly rollups of every profile's returns and of the index "
+        "tickers (they are otherwise only updated when the returns or prices change)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        profile_ids = sorted(
+            set(PortfolioReturn.objects.values_list("profile_id", flat=True))
+        )
+        size = options["chunk_size"]
+        for i in range(0, len(profile_ids), size):
+            returns = defaultdict(dict)
+            rows = (
+                PortfolioReturn.objects.filter(profile_id__in=profile_ids[i : i + size])
+                .values_list("profile_id", "date", "returns")
+                .iterator()
+            )
+            for profile_id, day, daily_return in rows:
+                returns[profile_id][day] = daily_return
+            PortfolioReturnRollup.objects.rebuild(returns)
+        self.stdout.write(f"Rebuilt the rollups of {len(profile_ids)} profiles")
+
+        for ticker in settings.PORTFOLIOHUT_ROLLUP_TICKERS:
+            HistoricalEquity.objects.refresh_rollups(ticker)
+            self.stdout.write(f"Rebuilt the rollups of {ticker}")
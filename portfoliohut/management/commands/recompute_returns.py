@@ -0,0 +1,198 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date
+
+from django.core.management import BaseCommand, CommandError
+from django.db import connections
+
+from portfoliohut.batch_returns import (
+    PROFILE_CHUNK_SIZE,
+    last_transaction_id,
+    load_price_matrix,
+    recompute_profiles,
+)
+from portfoliohut.models import Profile, RecomputeCheckpoint, Transaction
+
+# Loaded once in the parent and shared with the forked workers (copy-on-write)
+_PRICES = None
+# The last transaction when _PRICES was loaded, later ones may be in tickers it lacks
+_MAX_ID = None
+
+
+def _init_worker():
+    # Forked workers must not reuse the parent's database connections
+    connections.close_all()
+
+
+def _recompute_chunk(profile_ids):
+    for profile in Profile.objects.filter(pk__in=profile_ids):
+        Transaction.objects._reset_portfolio_cache(profile=profile)
+    recompute_profiles(profile_ids, _PRICES, _MAX_ID)
+    return profile_ids
+
+
+def _parse_shard(value):
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise CommandError(f"--shard must look like i/n, got '{value}'")
+    if not 0 <= index < count:
+        raise CommandError(f"--shard index must be in [0, {count}), got {index}")
+    return index, count
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the PortfolioItem and PortfolioReturn rows of many profiles in parallel. "
+        "Rerunning an interrupted command with the same arguments resumes it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all", action="store_true", help="Every profile with transactions."
+        )
+        parser.add_argument(
+            "--profiles",
+            type=int,
+            nargs="+",
+            help="Only these profile ids.",
+        )
+        parser.add_argument(
+            "--since",
+            type=date.fromisoformat,
+            help="Only profiles with transactions or returns on or after this date "
+            "(YYYY-MM-DD), e.g. after correcting prices from that date on.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count(),
+            help="Number of worker processes (defaults to the number of cores).",
+        )
+        parser.add_argument(
+            "--shard",
+            type=_parse_shard,
+            default=(0, 1),
+            help="Only process profiles with id %% n == i (to split a run across machines).",
+        )
+        parser.add_argument("--chunk-size", type=int, default=PROFILE_CHUNK_SIZE)
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="Ignore the checkpoint of a previous run with the same arguments.",
+        )
+        parser.add_argument(
+            "--no-refresh",
+            action="store_true",
+            help="Don't download missing prices before recomputing.",
+        )
+
+    def _select_profiles(self, options):
+        if not (options["all"] or options["profiles"] or options["since"]):
+            raise CommandError("Pass --all, --profiles or --since")
+
+        qset = Profile.objects.filter(transaction__isnull=False)
+        if options["profiles"]:
+            qset = qset.filter(pk__in=options["profiles"])
+        if options["since"]:
+            qset = qset.filter(
+                pk__in=Transaction.objects.filter(
+                    date_time__date__gte=options["since"]
+                ).values("profile_id")
+            ) | qset.filter(portfolioreturn__date__gte=options["since"])
+
+        index, count = options["shard"]
+        return [
+            pk
+            for pk in sorted(set(qset.values_list("pk", flat=True)))
+            if pk % count == index
+        ]
+
+    def _checkpoint(self, options):
+        selection = {
+            name: str(options[name]) for name in ("all", "profiles", "since", "shard")
+        }
+        digest = hashlib.sha1(
+            json.dumps(selection, sort_keys=True).encode()
+        ).hexdigest()
+        key = f"recompute_returns:{digest[:16]}"
+        if options["restart"]:
+            RecomputeCheckpoint.objects.filter(key=key).delete()
+        checkpoint, created = RecomputeCheckpoint.objects.get_or_create(key=key)
+        if not created:
+            self.stdout.write(
+                f"Resuming {key} ({len(checkpoint.completed)} chunks done)"
+            )
+        return checkpoint
+
+    def handle(self, *args, **options):
+        global _PRICES, _MAX_ID
+
+        checkpoint = self._checkpoint(options)
+        profile_ids = [
+            pk
+            for pk in self._select_profiles(options)
+            if not checkpoint.is_completed(pk)
+        ]
+        if not profile_ids:
+            checkpoint.delete()
+            self.stdout.write("Nothing to recompute")
+            return
+
+        size = options["chunk_size"]
+        chunks = [profile_ids[i : i + size] for i in range(0, len(profile_ids), size)]
+        _MAX_ID = last_transaction_id()
+        _PRICES = load_price_matrix(
+            profile_ids, refresh_prices=not options["no_refresh"]
+        )
+        self.stdout.write(
+            f"Recomputing {len(profile_ids)} profiles in {len(chunks)} chunks "
+            f"with {options['workers']} workers"
+        )
+
+        start = time.perf_counter()
+        done = 0
+        failed = 0
+
+        def _progress(chunk):
+            nonlocal done
+            checkpoint.add_completed(chunk[0], chunk[-1])
+            done += len(chunk)
+            rate = done / (time.perf_counter() - start)
+            self.stdout.write(
+                f"{done}/{len(profile_ids)} profiles ({rate:.1f} profiles/s)"
+            )
+
+        if options["workers"] <= 1:
+            for chunk in chunks:
+                _progress(_recompute_chunk(chunk))
+        else:
+            # Close our connections so the forked workers don't inherit them
+            connections.close_all()
+            with ProcessPoolExecutor(
+                max_workers=options["workers"],
+                mp_context=multiprocessing.get_context("fork"),
+                initializer=_init_worker,
+            ) as pool:
+                futures = {pool.submit(_recompute_chunk, chunk) for chunk in chunks}
+                for future in as_completed(futures):
+                    try:
+                        _progress(future.result())
+                    except Exception as e:  # noqa: B902
+                        failed += 1
+                        self.stderr.write(f"Chunk failed: {e!r}")
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f"Recomputed {done} profiles in {elapsed:.1f}s "
+            f"({done / elapsed:.1f} profiles/s)"
+        )
+        if failed:
+            raise CommandError(
+                f"{failed} chunk(s) failed, rerun the same command to retry them"
+            )
+        checkpoint.delete()
@@ -0,0 +1,35 @@
+from django.core.management import BaseCommand
+
+from portfoliohut.batch_returns import PROFILE_CHUNK_SIZE, roll_forward_returns
+
+
+class Command(BaseCommand):
+    help = (
+        "Append the returns of the days since each profile's last return from its stored end of "
+        "day state (run nightly once the new prices are in). Profiles with backdated "
+        "transactions are recomputed in full."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--profiles",
+            type=int,
+            nargs="+",
+            help="Only these profile ids.",
+        )
+        parser.add_argument("--chunk-size", type=int, default=PROFILE_CHUNK_SIZE)
+        parser.add_argument(
+            "--no-refresh",
+            action="store_true",
+            help="Don't download missing prices first.",
+        )
+
+    def handle(self, *args, **options):
+        stats = roll_forward_returns(
+            options["profiles"],
+            chunk_size=options["chunk_size"],
+            refresh_prices=not options["no_refresh"],
+        )
+        self.stdout.write(
+            f"Rolled {stats.rolled} profile(s) forward, recomputed {stats.recomputed}"
+        )
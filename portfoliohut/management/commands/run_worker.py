@@ -0,0 +1,68 @@
+import os
+import signal
+import socket
+import time
+
+from django.core.management import BaseCommand
+from django.db import close_old_connections
+
+from portfoliohut.jobs import TASKS
+from portfoliohut.models import Job
+
+
+class Command(BaseCommand):
+    help = "Run the jobs in the database backed job queue."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--burst",
+            action="store_true",
+            help="Exit once there are no ready jobs instead of polling for new ones.",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=1.0,
+            help="Seconds to wait between polls when the queue is empty.",
+        )
+        parser.add_argument(
+            "--max-jobs",
+            type=int,
+            default=None,
+            help="Exit after running this many jobs (useful to recycle the process).",
+        )
+
+    def handle(self, *args, **kwargs):
+        worker = f"{socket.gethostname()}:{os.getpid()}"
+        self.stopping = False
+
+        def _stop(signum, frame):
+            # Finish the current job and then exit (Heroku sends SIGTERM on dyno restarts)
+            self.stopping = True
+
+        signal.signal(signal.SIGTERM, _stop)
+        signal.signal(signal.SIGINT, _stop)
+
+        self.stdout.write(f"Worker {worker} started with tasks: {', '.join(TASKS)}")
+        completed = 0
+        while not self.stopping:
+            close_old_connections()
+            job = Job.objects.claim(worker)
+            if job is None:
+                if kwargs["burst"]:
+                    break
+                time.sleep(kwargs["sleep"])
+                continue
+
+            start = time.perf_counter()
+            succeeded = job.run()
+            self.stdout.write(
+                f"{'Finished' if succeeded else 'Failed'} {job.task} {job.payload} "
+                f"(attempt {job.attempts}) in {time.perf_counter() - start:.2f}s"
+            )
+
+            completed += 1
+            if kwargs["max_jobs"] is not None and completed >= kwargs["max_jobs"]:
+                break
+
+        self.stdout.write(f"Worker {worker} stopped after {completed} job(s)")
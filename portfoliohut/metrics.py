@@ -0,0 +1,359 @@
+"""Application metrics in the Prometheus text format.
+
+Every process (gunicorn worker, `run_worker`) records into its own in-memory registry and
+writes it to a JSON file of its own in `PORTFOLIOHUT_METRICS_DIR` at most once every
+`FLUSH_INTERVAL` seconds. `/metrics` adds up the files of every process, so whichever worker
+answers the scrape reports the totals of the whole dyno. A scrape folds the files of processes that
+exited (e.g. recycled workers) into a single `EXITED_FILE`, so the counters never go down and the
+directory doesn't grow with every restart. The processes sharing the directory must share a PID
+namespace (true for the processes of a dyno), which is how exited processes are told apart.
+
+"""
+import atexit
+import fcntl
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+
+# Seconds between two writes of a process' metrics file
+FLUSH_INTERVAL = 1.0
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# The files of the running processes are "<pid>-<random hex>.json"
+PROCESS_FILES = "*-*.json"
+# The summed values of every process that exited
+EXITED_FILE = "exited.json"
+# Held while collecting, so that two scrapes never fold the same file twice
+LOCK_FILE = "collect.lock"
+
+Rows = List[list]
+
+
+def _is_running(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # It exists but belongs to another user
+        return True
+    return True
+
+
+def _read_rows(path: Path) -> Optional[Rows]:
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        # Removed (or not fully written by an older version) while we were reading
+        return None
+
+
+def _write_atomic(path: Path, data):
+    tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+    tmp_path.write_text(json.dumps(data))
+    # Readers only ever see complete files
+    os.replace(tmp_path, path)
+
+
+def _add_rows(totals: Dict[Tuple[str, Tuple[str, ...]], List[float]], rows: Rows):
+    for name, labels, values in rows:
+        total = totals[name, tuple(labels)]
+        for i, value in enumerate(values):
+            if i < len(total):
+                total[i] += value
+            else:
+                total.append(value)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, "Metric"] = {}
+        self._lock = threading.Lock()
+        self._pid = None
+        self._timer = None
+        self._flushed = 0.0
+        self._reset()
+
+    def _reset(self):
+        # A forked child starts over instead of reporting its parent's values a second time
+        self._pid = os.getpid()
+        self._file_name = f"{self._pid}-{uuid.uuid4().hex}.json"
+        # The value of each series by (metric name, label values)
+        self.values: Dict[Tuple[str, Tuple[str, ...]], List[float]] = {}
+        self._timer = None
+
+    def register(self, metric: "Metric") -> "Metric":
+        self.metrics[metric.name] = metric
+        return metric
+
+    def add(self, name: str, labels: Tuple[str, ...], increments: Iterable[float]):
+        """Add `increments` to the values of a series (a counter has one value)."""
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            values = self.values.setdefault((name, labels), [])
+            for i, increment in enumerate(increments):
+                if i < len(values):
+                    values[i] += increment
+                else:
+                    values.append(increment)
+            self._schedule_flush()
+
+    def _schedule_flush(self):
+        if self._timer is not None:
+            return
+        delay = max(0.0, self._flushed + FLUSH_INTERVAL - time.monotonic())
+        self._timer = threading.Timer(delay, self.flush)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def flush(self):
+        """Write the values of this process to its metrics file."""
+        with self._lock:
+            self._timer = None
+            self._flushed = time.monotonic()
+            if not self.values or self._pid != os.getpid():
+                return
+            rows = [
+                [name, list(labels), values]
+                for (name, labels), values in self.values.items()
+            ]
+
+        directory = Path(settings.PORTFOLIOHUT_METRICS_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        _write_atomic(directory / self._file_name, rows)
+
+    def collect(self) -> Dict[Tuple[str, Tuple[str, ...]], List[float]]:
+        """The values of every series summed over the files of all processes."""
+        self.flush()
+        directory = Path(settings.PORTFOLIOHUT_METRICS_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        with open(directory / LOCK_FILE, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                exited = self._fold_exited(directory)
+                totals = defaultdict(list)
+                _add_rows(totals, exited["rows"])
+                for path in directory.glob(PROCESS_FILES):
+                    _add_rows(totals, _read_rows(path) or [])
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        return totals
+
+    def _fold_exited(self, directory: Path) -> dict:
+        """Add the files of processes that exited to `EXITED_FILE` and remove them.
+
+        Returns:
+            The contents of `EXITED_FILE`: the summed `rows` and the names of the `merged` files
+
+        """
+        path = directory / EXITED_FILE
+        exited = {"rows": [], "merged": []}
+        if path.exists():
+            exited = json.loads(path.read_text())
+
+        exited_paths = [
+            process_path
+            for process_path in directory.glob(PROCESS_FILES)
+            if not _is_running(int(process_path.name.split("-")[0]))
+        ]
+        merged = set(exited["merged"])
+        totals = defaultdict(list)
+        _add_rows(totals, exited["rows"])
+        for process_path in exited_paths:
+            # Already added if we stopped between writing `EXITED_FILE` and the removal
+            if process_path.name not in merged:
+                _add_rows(totals, _read_rows(process_path) or [])
+
+        if exited_paths:
+            exited = {
+                "rows": [
+                    [name, list(labels), values]
+                    for (name, labels), values in totals.items()
+                ],
+                "merged": [process_path.name for process_path in exited_paths],
+            }
+            _write_atomic(path, exited)
+            for process_path in exited_paths:
+                process_path.unlink()
+        return exited
+
+    def render(self) -> str:
+        """Every registered metric in the Prometheus text exposition format."""
+        totals = self.collect()
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            series = sorted(
+                (labels, values)
+                for (name, labels), values in totals.items()
+                if name == metric.name
+            )
+            for labels, values in series:
+                lines.extend(metric.samples(labels, values))
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+atexit.register(REGISTRY.flush)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(
+            name,
+            str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\""),
+        )
+        for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class Metric:
+    type = ""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        registry: Registry = REGISTRY,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.registry = registry
+        registry.register(self)
+
+    def _labels(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                f"{self.name} takes the labels {self.labelnames}, got {tuple(labels)}"
+            )
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self, labels: Tuple[str, ...], values: List[float]) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """A value that only goes up."""
+
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        self.registry.add(self.name, self._labels(labels), [amount])
+
+    def samples(self, labels, values):
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(values[0])}"
+        ]
+
+
+class Histogram(Metric):
+    """The distribution of observed values in cumulative buckets, with their sum and count."""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+        registry: Registry = REGISTRY,
+    ):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        # The values are [count per bucket (not cumulative)..., sum, count]
+        increments = [0.0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                increments[i] = 1.0
+                break
+        increments[-2] = value
+        increments[-1] = 1.0
+        self.registry.add(self.name, self._labels(labels), increments)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the seconds spent in the `with` block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self, labels, values):
+        names = self.labelnames + ("le",)
+        lines = []
+        cumulative = 0.0
+        for bound, count in zip(self.buckets, values):
+            cumulative += count
+            lines.append(
+                f"{self.name}_bucket{_format_labels(names, labels + (_format_value(bound),))} "
+                f"{_format_value(cumulative)}"
+            )
+        label_text = _format_labels(self.labelnames, labels)
+        lines.append(f"{self.name}_sum{label_text} {_format_value(values[-2])}")
+        lines.append(f"{self.name}_count{label_text} {_format_value(values[-1])}")
+        return lines
+
+
+RECOMPUTE_DURATION = Histogram(
+    "portfoliohut_recompute_duration_seconds",
+    "Time spent recomputing portfolio returns.",
+    labelnames=("engine",),
+)
+RETURNS_ROWS_WRITTEN = Histogram(
+    "portfoliohut_returns_rows_written",
+    "PortfolioReturn rows touched by one write of recomputed returns.",
+    labelnames=("operation",),
+    buckets=(0, 1, 10, 100, 1000, 10000, 100000),
+)
+CSV_IMPORT_THROUGHPUT = Histogram(
+    "portfoliohut_csv_import_rows_per_second",
+    "Transactions validated and saved per second by a CSV upload.",
+    buckets=(10, 50, 100, 500, 1000, 5000, 10000, 50000),
+)
+PROVIDER_LATENCY = Histogram(
+    "portfoliohut_provider_request_duration_seconds",
+    "Time spent waiting on the market data provider.",
+    labelnames=("provider", "method"),
+)
+PROVIDER_ERRORS = Counter(
+    "portfoliohut_provider_errors_total",
+    "Market data provider requests that raised.",
+    labelnames=("provider", "method"),
+)
+CACHE_HITS = Counter(
+    "portfoliohut_cache_hits_total",
+    "Requests answered from a cache.",
+    labelnames=("cache",),
+)
+CACHE_MISSES = Counter(
+    "portfoliohut_cache_misses_total",
+    "Requests that could not be answered from a cache.",
+    labelnames=("cache",),
+)
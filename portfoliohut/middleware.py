@@ -0,0 +1,40 @@
+from django.conf import settings
+
+from portfoliohut.routers import use_replicas
+
+# Set by requests that change data, reads stay on the primary while it's there
+PIN_COOKIE = "read_primary"
+
+READ_ONLY_METHODS = ("GET", "HEAD")
+
+
+class ReplicaMiddleware:
+    """Serve GET/HEAD requests from the read replicas, with "read your own writes".
+
+    Any other request (adding a transaction, uploading a CSV, logging in) sets a cookie that keeps
+    the browser's requests on the primary for `PORTFOLIOHUT_REPLICA_PIN_SECONDS`, longer than the
+    replicas should lag behind, so the user sees their new data on the next page instead of an
+    older copy. Bookkeeping writes of GET requests (price cache, job queue) don't pin the user, so
+    views that change the user's data have to require POST (e.g. `require_POST`).
+
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.method in READ_ONLY_METHODS:
+            if PIN_COOKIE in request.COOKIES:
+                return self.get_response(request)
+            with use_replicas():
+                return self.get_response(request)
+
+        response = self.get_response(request)
+        response.set_cookie(
+            PIN_COOKIE,
+            "1",
+            max_age=settings.PORTFOLIOHUT_REPLICA_PIN_SECONDS,
+            httponly=True,
+            samesite="Lax",
+        )
+        return response
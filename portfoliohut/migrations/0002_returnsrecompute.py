@@ -0,0 +1,40 @@
+# Generated by Django 3.1.7 on 2026-10-19 06:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("portfoliohut", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ReturnsRecompute",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("first_requested_at", models.DateTimeField()),
+                ("run_after", models.DateTimeField(db_index=True)),
+                ("generation", models.PositiveIntegerField(default=0)),
+                ("locked_until", models.DateTimeField(blank=True, null=True)),
+                (
+                    "profile",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="returns_recompute",
+                        to="portfoliohut.profile",
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 3.1.7 on 2026-10-19 06:53
+
+from django.db import migrations, models
+from django.db.models import Max, Min
+
+
+def backfill_metadata(apps, schema_editor):
+    HistoricalEquity = apps.get_model("portfoliohut", "HistoricalEquity")
+    TickerMetadata = apps.get_model("portfoliohut", "TickerMetadata")
+    TickerMetadata.objects.bulk_create(
+        [
+            TickerMetadata(
+                ticker=row["ticker"],
+                first_date=row["first_date"],
+                last_date=row["last_date"],
+            )
+            for row in HistoricalEquity.objects.order_by("ticker")
+            .values("ticker")
+            .annotate(first_date=Min("date"), last_date=Max("date"))
+        ]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("portfoliohut", "0004_recomputecheckpoint"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TickerMetadata",
+            fields=[
+                (
+                    "ticker",
+                    models.CharField(max_length=20, primary_key=True, serialize=False),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[("ok", "OK"), ("not_found", "Not Found")],
+                        default="ok",
+                        max_length=10,
+                    ),
+                ),
+                ("first_date", models.DateField(blank=True, null=True)),
+                ("last_date", models.DateField(blank=True, null=True)),
+                ("last_fetch_attempt", models.DateTimeField(blank=True, null=True)),
+                ("not_found_until", models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RunPython(backfill_metadata, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 3.1.7 on 2026-10-19 06:57
+
+from django.db import migrations
+from django.db.models import Max
+
+
+def delete_duplicate_returns(apps, schema_editor):
+    # Keep the newest row of each (profile, date) so that the unique constraint can be added
+    PortfolioReturn = apps.get_model("portfoliohut", "PortfolioReturn")
+    keep = (
+        PortfolioReturn.objects.order_by()
+        .values("profile", "date")
+        .annotate(keep_id=Max("id"))
+        .values("keep_id")
+    )
+    PortfolioReturn.objects.exclude(id__in=keep).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("portfoliohut", "0005_tickermetadata"),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_returns, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name="portfolioreturn",
+            unique_together={("profile", "date")},
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.1.7 on 2026-10-19 06:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("portfoliohut", "0006_portfolioreturn_unique_date"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="profile",
+            name="returns_updated",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="profile",
+            name="returns_version",
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 3.1.7 on 2026-10-19 07:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("portfoliohut", "0007_profile_returns_version"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="EquityRollup",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("ticker", models.CharField(max_length=20)),
+                (
+                    "resolution",
+                    models.CharField(
+                        choices=[("D", "Daily"), ("W", "Weekly"), ("M", "Monthly")],
+                        max_length=1,
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("close", models.DecimalField(decimal_places=2, max_digits=100)),
+            ],
+            options={
+                "unique_together": {("ticker", "resolution", "date")},
+            },
+        ),
+        migrations.CreateModel(
+            name="PortfolioReturnRollup",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "resolution",
+                    models.CharField(
+                        choices=[("D", "Daily"), ("W", "Weekly"), ("M", "Monthly")],
+                        max_length=1,
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("cumulative", models.FloatField()),
+                (
+                    "profile",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        to="portfoliohut.profile",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("profile", "resolution", "date")},
+            },
+        ),
+    ]
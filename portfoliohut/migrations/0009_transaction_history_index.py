@@ -0,0 +1,19 @@
+# Generated by Django 3.1.7 on 2026-10-19 07:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("portfoliohut", "0008_returns_rollups"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(
+                fields=["profile", "date_time", "id"], name="transaction_history_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.7 on 2026-10-19 07:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("portfoliohut", "0009_transaction_history_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="profile",
+            name="xirr",
+            field=models.FloatField(blank=True, null=True, verbose_name="XIRR"),
+        ),
+    ]
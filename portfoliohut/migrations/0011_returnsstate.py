@@ -0,0 +1,44 @@
+# Generated by Django 3.1.7 on 2026-10-19 07:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("portfoliohut", "0010_profile_xirr"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ReturnsState",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("value", models.FloatField()),
+                ("cash_flows", models.FloatField()),
+                ("internal_cash", models.FloatField()),
+                ("cumulative_return", models.FloatField()),
+                ("holdings", models.JSONField(default=dict)),
+                ("last_transaction_id", models.IntegerField()),
+                ("updated", models.DateTimeField(auto_now=True)),
+                (
+                    "profile",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="returns_state",
+                        to="portfoliohut.profile",
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,110 @@
+# Generated by Django 3.1.7 on 2026-10-19 08:10
+
+from decimal import Decimal
+
+import django.core.validators
+from django.db import migrations, models
+from django.db.models import BigIntegerField, DecimalField, ExpressionWrapper, F
+from django.db.models.functions import Cast, Round
+
+import portfoliohut.models.fields
+
+# The `DecimalField(max_digits=100, decimal_places=2)` columns stored as whole cents
+PRICE_FIELDS = {
+    "transaction": ["price"],
+    "portfolioitem": ["price"],
+    "historicalequity": ["open", "high", "low", "close", "dividends"],
+    "equityrollup": ["close"],
+}
+
+
+def _model(apps, model_name):
+    return apps.get_model("portfoliohut", model_name)
+
+
+def to_cents(apps, schema_editor):
+    # One UPDATE per table
+    for model_name, fields in PRICE_FIELDS.items():
+        _model(apps, model_name).objects.update(
+            **{
+                f"{field}_cents": Cast(
+                    Round(
+                        ExpressionWrapper(F(field) * 100, output_field=DecimalField())
+                    ),
+                    BigIntegerField(),
+                )
+                for field in fields
+            }
+        )
+
+
+def from_cents(apps, schema_editor):
+    for model_name, fields in PRICE_FIELDS.items():
+        model = _model(apps, model_name)
+        model.objects.update(
+            **{
+                field: model._meta.get_field(f"{field}_cents").to_float(
+                    F(f"{field}_cents")
+                )
+                for field in fields
+            }
+        )
+
+
+def _final_field(model_name, field):
+    if model_name == "transaction":
+        return portfoliohut.models.fields.FixedPointField(
+            validators=[django.core.validators.MinValueValidator(Decimal("0.01"))]
+        )
+    return portfoliohut.models.fields.FixedPointField()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("portfoliohut", "0011_returnsstate"),
+    ]
+
+    operations = [
+        *(
+            migrations.AddField(
+                model_name=model_name,
+                name=f"{field}_cents",
+                field=portfoliohut.models.fields.FixedPointField(null=True),
+            )
+            for model_name, fields in PRICE_FIELDS.items()
+            for field in fields
+        ),
+        # Nullable so that migrating backwards can add the columns back before filling them
+        *(
+            migrations.AlterField(
+                model_name=model_name,
+                name=field,
+                field=models.DecimalField(max_digits=100, decimal_places=2, null=True),
+            )
+            for model_name, fields in PRICE_FIELDS.items()
+            for field in fields
+        ),
+        migrations.RunPython(to_cents, from_cents),
+        *(
+            migrations.RemoveField(model_name=model_name, name=field)
+            for model_name, fields in PRICE_FIELDS.items()
+            for field in fields
+        ),
+        *(
+            migrations.RenameField(
+                model_name=model_name, old_name=f"{field}_cents", new_name=field
+            )
+            for model_name, fields in PRICE_FIELDS.items()
+            for field in fields
+        ),
+        *(
+            migrations.AlterField(
+                model_name=model_name,
+                name=field,
+                field=_final_field(model_name, field),
+            )
+            for model_name, fields in PRICE_FIELDS.items()
+            for field in fields
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.7 on 2026-10-19 08:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("portfoliohut", "0012_fixed_point_prices"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="tickermetadata",
+            name="fetching_until",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
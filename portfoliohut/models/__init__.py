@@ -1,6 +1,9 @@
 """PortfolioHut models"""
 
+from .jobs import Job, JobStatus
 from .profile import Profile
+from .recompute import RecomputeCheckpoint, ReturnsRecompute, ReturnsState
+from .rollups import EquityRollup, PortfolioReturnRollup, Resolution
 from .transactions import (
     CashActions,
     EquityInfo,
@@ -8,6 +11,9 @@ from .transactions import (
     HistoricalEquity,
     PortfolioItem,
     PortfolioReturn,
+    ReturnsWriteStats,
+    TickerMetadata,
+    TickerStatus,
     Transaction,
 )
 
@@ -18,6 +24,17 @@ __all__ = [
     "HistoricalEquity",
     "EquityInfo",
     "PortfolioReturn",
+    "ReturnsWriteStats",
     "FinancialActionType",
     "CashActions",
+    "TickerMetadata",
+    "TickerStatus",
+    "ReturnsRecompute",
+    "RecomputeCheckpoint",
+    "ReturnsState",
+    "Job",
+    "JobStatus",
+    "Resolution",
+    "PortfolioReturnRollup",
+    "EquityRollup",
 ]
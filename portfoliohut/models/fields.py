@@ -0,0 +1,91 @@
+from decimal import ROUND_HALF_EVEN, Decimal, InvalidOperation
+
+from django import forms
+from django.core import exceptions
+from django.db import models
+from django.db.models import FloatField, Value
+from django.db.models.functions import Cast
+from django.utils.translation import gettext_lazy as _
+
+# The most digits a `bigint` holds whatever they are
+MAX_DIGITS = 18
+
+
+class FixedPointField(models.Field):
+    """A decimal stored as a whole number of `10 ** -decimal_places` units (cents) in a bigint.
+
+    Python code gets and sets `Decimal`s, they are converted when they are read from and written to
+    the database. A bigint is 8 bytes and adds up with integer arithmetic, a `numeric` is variable
+    length and decoded into a `Decimal` on every read.
+
+    SQL sees the integer: an expression that is still a number of units (e.g.
+    `Sum(F("quantity") * F("price"))`) needs `output_field=FixedPointField()` and one that is cast
+    to a float goes through `to_float`.
+
+    """
+
+    description = _("Fixed point decimal number")
+    default_error_messages = {
+        "invalid": _("“%(value)s” value must be a decimal number."),
+    }
+
+    def __init__(self, *args, decimal_places=2, **kwargs):
+        self.decimal_places = decimal_places
+        super().__init__(*args, **kwargs)
+
+    @property
+    def scale(self) -> int:
+        return 10 ** self.decimal_places
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.decimal_places != 2:
+            kwargs["decimal_places"] = self.decimal_places
+        return name, path, args, kwargs
+
+    def to_float(self, expression):
+        """An expression in units of this field (e.g. `F("price") * F("quantity")`) as a float."""
+        # The integer is exact as a float, so this is the float nearest to the decimal
+        return Cast(expression, output_field=FloatField()) / Value(float(self.scale))
+
+    def get_internal_type(self):
+        return "BigIntegerField"
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return Decimal(int(value)).scaleb(-self.decimal_places)
+
+    def to_python(self, value):
+        if value is None or isinstance(value, Decimal):
+            return value
+        try:
+            # Floats keep their exact binary value like `DecimalField` (rounded when saved)
+            return Decimal(value) if isinstance(value, float) else Decimal(str(value))
+        except (InvalidOperation, ValueError):
+            raise exceptions.ValidationError(
+                self.error_messages["invalid"],
+                code="invalid",
+                params={"value": value},
+            )
+
+    def get_prep_value(self, value):
+        value = super().get_prep_value(value)
+        if value is None:
+            return None
+        # Rounded half to even like `DecimalField` rounds to its decimal places
+        return int(
+            self.to_python(value)
+            .scaleb(self.decimal_places)
+            .to_integral_value(ROUND_HALF_EVEN)
+        )
+
+    def formfield(self, **kwargs):
+        return super().formfield(
+            **{
+                "form_class": forms.DecimalField,
+                "max_digits": MAX_DIGITS,
+                "decimal_places": self.decimal_places,
+                **kwargs,
+            }
+        )
@@ -0,0 +1,212 @@
+import logging
+import traceback
+from datetime import timedelta
+from typing import Optional
+
+from django.conf import settings
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+logger = logging.getLogger(__name__)
+
+
+class JobStatus(models.TextChoices):
+    QUEUED = "queued", _("Queued")
+    RUNNING = "running", _("Running")
+    FAILED = "failed", _("Failed")
+
+
+class JobManager(models.Manager):
+    def enqueue(
+        self,
+        task: str,
+        payload: Optional[dict] = None,
+        *,
+        priority: int = 0,
+        run_at=None,
+        delay: float = 0,
+        dedup_key: Optional[str] = None,
+        max_attempts: Optional[int] = None,
+    ):
+        """Add a job to the queue.
+
+        If `dedup_key` matches a job that is still queued, no new job is created. The queued job
+        takes the newer `run_at` and the higher priority instead, so repeated enqueues debounce.
+
+        Args:
+            task: The name of a task registered in `portfoliohut.jobs`
+            payload: The keyword arguments for the task (must be JSON serializable)
+            priority: Higher priorities are claimed first
+            run_at: The earliest time that the job can run (defaults to now + `delay`)
+            delay: Seconds from now until the job can run (ignored if `run_at` is given)
+            dedup_key: Collapse this job into a queued job with the same key
+            max_attempts: The number of tries before the job is marked as failed
+
+        """
+        if run_at is None:
+            run_at = timezone.now() + timedelta(seconds=delay)
+        if max_attempts is None:
+            max_attempts = settings.PORTFOLIOHUT_JOB_MAX_ATTEMPTS
+
+        if settings.PORTFOLIOHUT_JOBS_EAGER:
+            # No worker is running, so run the task as soon as the caller's data is committed
+            job = self.model(task=task, payload=payload or {})
+            transaction.on_commit(job.run_task)
+            return job
+
+        fields = dict(
+            task=task,
+            payload=payload or {},
+            priority=priority,
+            run_at=run_at,
+            max_attempts=max_attempts,
+            dedup_key=dedup_key,
+        )
+        if dedup_key is None:
+            return self.create(**fields)
+
+        with transaction.atomic():
+            existing = (
+                self.select_for_update()
+                .filter(dedup_key=dedup_key, status=JobStatus.QUEUED)
+                .first()
+            )
+            if existing is None:
+                try:
+                    # The savepoint lets us recover if another process inserted the same key first
+                    with transaction.atomic():
+                        return self.create(**fields)
+                except IntegrityError:
+                    existing = self.select_for_update().get(
+                        dedup_key=dedup_key, status=JobStatus.QUEUED
+                    )
+
+            existing.run_at = run_at
+            existing.priority = max(existing.priority, priority)
+            existing.save(update_fields=["run_at", "priority"])
+            return existing
+
+    def _ready(self, now):
+        # Queued jobs that are due as well as running jobs whose worker let the lease expire
+        return self.filter(
+            Q(status=JobStatus.QUEUED, run_at__lte=now)
+            | Q(status=JobStatus.RUNNING, locked_until__lt=now)
+        ).order_by("-priority", "run_at", "id")
+
+    def claim(self, worker: str) -> Optional["Job"]:
+        """Lease the next ready job to `worker`.
+
+        On databases with `SELECT ... FOR UPDATE SKIP LOCKED` (Postgres) concurrent workers skip
+        over each other's candidate rows. Otherwise (SQLite) the claim is a compare-and-set
+        `UPDATE` that only one worker can win.
+
+        Returns:
+            The claimed `Job` or `None` if no job is ready
+
+        """
+        now = timezone.now()
+        lease = dict(
+            status=JobStatus.RUNNING,
+            locked_by=worker,
+            locked_until=now + timedelta(seconds=settings.PORTFOLIOHUT_JOB_LEASE),
+            attempts=F("attempts") + 1,
+        )
+
+        if connection.features.has_select_for_update_skip_locked:
+            with transaction.atomic():
+                job = self._ready(now).select_for_update(skip_locked=True).first()
+                if job is None:
+                    return None
+                self.filter(pk=job.pk).update(**lease)
+        else:
+            for job in self._ready(now)[:10]:
+                if self._ready(now).filter(pk=job.pk).update(**lease):
+                    break
+            else:
+                return None
+
+        job.refresh_from_db()
+        return job
+
+
+class Job(models.Model):
+    """A unit of work for the `run_worker` management command.
+
+    Successful jobs are deleted, failed jobs are retried with exponential backoff and kept with
+    their last traceback once they run out of attempts.
+
+    """
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "run_at"])]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["dedup_key"],
+                condition=Q(status="queued"),
+                name="unique_queued_job_dedup_key",
+            )
+        ]
+
+    objects = JobManager()
+    task = models.CharField(max_length=100, blank=False)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(
+        max_length=10, choices=JobStatus.choices, default=JobStatus.QUEUED
+    )
+    priority = models.SmallIntegerField(default=0)
+    run_at = models.DateTimeField(default=timezone.now)
+    dedup_key = models.CharField(max_length=255, null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    # The lease on a running job, once it expires another worker can claim the job again
+    locked_by = models.CharField(max_length=255, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def run_task(self):
+        from portfoliohut.jobs import get_task
+
+        get_task(self.task)(**self.payload)
+
+    def run(self) -> bool:
+        """Run a claimed job and record the outcome.
+
+        Returns:
+            bool: Whether the task succeeded
+
+        """
+        try:
+            self.run_task()
+        except Exception:  # noqa: B902
+            logger.exception("Job %s (%s) failed", self.pk, self.task)
+            self._retry_or_fail(traceback.format_exc())
+            return False
+
+        Job.objects.filter(pk=self.pk, locked_by=self.locked_by).delete()
+        return True
+
+    def _retry_or_fail(self, error: str):
+        if self.attempts >= self.max_attempts:
+            Job.objects.filter(pk=self.pk).update(
+                status=JobStatus.FAILED, locked_until=None, last_error=error
+            )
+            return
+
+        backoff = settings.PORTFOLIOHUT_JOB_BACKOFF * 2 ** (self.attempts - 1)
+        try:
+            with transaction.atomic():
+                Job.objects.filter(pk=self.pk).update(
+                    status=JobStatus.QUEUED,
+                    run_at=timezone.now() + timedelta(seconds=backoff),
+                    locked_until=None,
+                    last_error=error,
+                )
+        except IntegrityError:
+            # An identical job was queued while this one ran, that job will do the work
+            Job.objects.filter(pk=self.pk).delete()
+
+    def __str__(self):
+        return f"task={self.task}, status={self.status}, run_at={self.run_at}"
@@ -1,18 +1,29 @@
 from datetime import datetime
 from decimal import Decimal
+from typing import TYPE_CHECKING
 
-import pandas as pd
 from django.contrib.auth.models import User
 from django.db import models
-from django.db.models import F, QuerySet, Sum, Window
+from django.db.models import (
+    Exists,
+    F,
+    FloatField,
+    Min,
+    OuterRef,
+    QuerySet,
+    Sum,
+    Value,
+    Window,
+)
 from django.db.models.functions import Abs, Exp, Ln
 
-from .transactions import (
-    CashActions,
-    FinancialActionType,
-    HistoricalEquity,
-    Transaction,
-)
+from .fields import FixedPointField
+from .recompute import ReturnsRecompute
+from .rollups import Resolution
+from .transactions import CashActions
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 PROFILE_TYPE_ACTIONS = (
     ("public", "PUBLIC"),
@@ -20,118 +31,44 @@ PROFILE_TYPE_ACTIONS = (
 )
 
 
-def _calc_returns(transaction_qset: "QuerySet[Transaction]"):
-    """Compute the returns for a given query set of of stock transactions.
-
-    Assumes that the qset is ordered by increasing dates.
-
-    Args:
-        transaction_qset: A queryset of stock transactions
+class ProfileQuerySet(models.QuerySet):
+    def with_relationship(self, viewer: User) -> "QuerySet[Profile]":
+        """Annotate how each profile relates to the profile of `viewer`.
 
-    Returns:
-        pd.Series: returns percentages with `pd.DateTimeIndex` as indices
+        The membership tests are `EXISTS` lookups on the through tables, so they cost the same
+        however many friends or requests a profile has. The annotations are:
 
-    """
+        * `viewer_is_friend`: `viewer` is in the profile's friends
+        * `viewer_requested`: `viewer` sent the profile a friend request
+        * `requested_viewer`: the profile sent `viewer` a friend request
 
-    # TODO: This won't work for multiple stock transactions of a single stock on the same day. I
-    #       need to find a solution for this case. This will likely involve a step where I combine
-    #       all stocks actions from a single day into a single row. (@adithysbk)
-
-    # Filter for just internal cash transactions and equity transactions, then make sure to filter
-    # out all of the buy actions. This is NOT actually your portfolio value but respects the
-    # "locked" in gains
-    relevant_transaction_qset = transaction_qset.filter(
-        type__in=[
-            FinancialActionType.EQUITY,
-            FinancialActionType.INTERNAL_CASH,
-        ]
-    ).exclude(type=FinancialActionType.INTERNAL_CASH, quantity__lt=0)
-
-    # Abort if there were no relevant transactions
-    empty_series = pd.Series([], name="Returns")
-    if not relevant_transaction_qset.exists():
-        return empty_series
-
-    start_date = relevant_transaction_qset.first().date_time.date()
-    # Remove cash balance ticker
-    distinct_tickers = set(
-        relevant_transaction_qset.filter(type=FinancialActionType.EQUITY).values_list(
-            "ticker", flat=True
-        )
-    )
-
-    # Abort if there were not any stock transactions
-    if not distinct_tickers:
-        return empty_series
-
-    # Build a list of stock prices across all relevant dates
-    price_series_list = []
-    for ticker in distinct_tickers:
-        dates, closes = zip(
-            *HistoricalEquity.objects.get_ticker(ticker)
-            .filter(date__gte=start_date)
-            .values_list("date", "close")
-        )
-        price_series_list.append(pd.Series(closes, index=dates, name=ticker))
-    stocks_df = pd.concat(price_series_list, axis=1).sort_index()
-
-    # Build a DataFrame similar to previous with the cumulative quantities at each date.
-    # TODO: There is another bug here where the first day of returns may be calculated incorrectly
-    #       since we use the close price to compute returns rather than the price that a user paid
-    #       for the equity.
-    quantity_series_list = []
-    for ticker in distinct_tickers:
-        dates, quantities = zip(
-            *relevant_transaction_qset.filter(ticker=ticker).values_list(
-                "date_time__date", "quantity"
-            )
-        )
-        # Note: this is where the bug is
-        # Sum the stocks bought on the same day
-        quantity_series = pd.Series(quantities, index=dates, dtype="int64", name=ticker)
-        quantity_series_list.append(
-            quantity_series.groupby(quantity_series.index).sum()
-        )
-    quantities_df = (
-        pd.concat(quantity_series_list, axis=1)
-        .sort_index()
-        .fillna(0)
-        .cumsum()
-        .reindex(stocks_df.index, method="ffill")
-        .astype("int64")
-    )
+        Args:
+            viewer: The logged in user looking at the profiles
 
-    # Also build the cumulative sale cash balance at each date.
-    sale_cash_qset = relevant_transaction_qset.filter(
-        type=FinancialActionType.INTERNAL_CASH
-    ).values_list("date_time__date", "price")
-    if sale_cash_qset.exists():
-        sale_dates, sale_prices = zip(*sale_cash_qset)
-        sale_cash_series = pd.Series(sale_prices, index=sale_dates, name="Cash")
-        # Handle multiple sales on a single day (note this doesn't have the
-        # same potential bug as above)
-        sale_cash_series = (
-            sale_cash_series.groupby(sale_cash_series.index)
-            .sum()
-            .cumsum()
-            .reindex(stocks_df.index, method="ffill")
-            .fillna(0)
-            .astype(float)
-        )
-    else:
-        sale_cash_series = pd.Series(
-            [0] * len(quantities_df), index=stocks_df.index, name="Cash"
+        """
+        friends = Profile.friends.through.objects
+        friend_requests = Profile.friend_requests.through.objects
+        return self.annotate(
+            viewer_is_friend=Exists(
+                friends.filter(
+                    from_profile=OuterRef("pk"), to_profile__user_id=viewer.pk
+                )
+            ),
+            viewer_requested=Exists(
+                friend_requests.filter(
+                    from_profile=OuterRef("pk"), to_profile__user_id=viewer.pk
+                )
+            ),
+            requested_viewer=Exists(
+                friend_requests.filter(
+                    from_profile__user_id=viewer.pk, to_profile=OuterRef("pk")
+                )
+            ),
         )
 
-    # Now, we simply multiply stocks_df by quantities_df and add sale_cash_df
-    returns_series = stocks_df.multiply(quantities_df).sum(axis=1).add(sale_cash_series)
-    returns_series.name = "Returns"
-    returns_series = returns_series.dropna().pct_change()
-
-    return returns_series
-
 
 class Profile(models.Model):
+    objects = ProfileQuerySet.as_manager()
     user = models.OneToOneField(User, on_delete=models.PROTECT, related_name="profile")
     bio = models.CharField(max_length=240, default="Hello! I'm new to Portfolio Hut.")
     profile_type = models.CharField(
@@ -141,30 +78,71 @@ class Profile(models.Model):
     friend_requests = models.ManyToManyField(
         "Profile", blank=True, related_name="friend_requests_list"
     )
+    # Bumped whenever the `PortfolioReturn` rows change (used for ETags)
+    returns_version = models.PositiveIntegerField(default=0)
+    returns_updated = models.DateTimeField(null=True, blank=True)
+    # Money weighted return of the deposits and withdrawals (set with the returns)
+    xirr = models.FloatField("XIRR", null=True, blank=True)
 
     # https://www.sqlservercentral.com/forums/topic/aggregate-function-product#post-1442921
-    def get_cumulative_returns(self):
-        """Get the most recent portfolio return.
+    def get_cumulative_returns(self, start=None, end=None):
+        """Get the cumulative portfolio return on each day.
 
         Args:
-            as_fraction: Whether to output as a decimal or as "* 100"
+            start: Only days on or after this date (the returns still compound from the first day)
+            end: Only days on or before this date
 
         """
+        qset = self.portfolioreturn_set.all()
+        # Log-sum-exp trick reversed to get the cumulative product (https://en.wikipedia.org/wiki/LogSumExp)
+        # Day to day returns cannot be lower than zero when you add 1 (i.e. gains are infinite losses are capped)
+        # This is why we don't need to account for the sign here
+        growth = Exp(Window(Sum(Ln(Abs(F("returns") + 1))), order_by=F("date").asc()))
+        if start is not None:
+            qset = qset.filter(date__gte=start)
+            # The window only sees the rows in the range, so add the growth before `start`
+            previous_growth = self.portfolioreturn_set.filter(date__lt=start).aggregate(
+                growth=Exp(Sum(Ln(Abs(F("returns") + 1))))
+            )["growth"]
+            if previous_growth is not None:
+                growth = Value(previous_growth, output_field=FloatField()) * growth
+        if end is not None:
+            qset = qset.filter(date__lte=end)
+
         # Original Pandas: (1 + self.get_returns_df()).cumprod() - 1
         return (
-            self.portfolioreturn_set.values("date", "returns")
-            .annotate(
-                # Log-sum-exp trick reversed to get the cumulative product (https://en.wikipedia.org/wiki/LogSumExp)
-                # Day to day returns cannot be lower than zero when you add 1 (i.e. gains are infinite losses are capped)
-                # This is why we don't need to account for the sign here
-                cumprod=Exp(
-                    Window(Sum(Ln(Abs(F("returns") + 1))), order_by=F("date").asc())
-                )
-                - 1
-            )
+            qset.values("date", "returns")
+            .annotate(cumprod=growth - 1)
             .values("date", "cumprod")
         )
 
+    def get_returns_series(
+        self, start=None, end=None, resolution=Resolution.DAILY
+    ) -> "pd.Series":
+        """Get the cumulative returns (in %) between `start` and `end` (inclusive).
+
+        Args:
+            start: The first date (defaults to the first return)
+            end: The last date (defaults to the most recent return)
+            resolution: Daily returns or the last return of each week/month (`PortfolioReturnRollup`)
+
+        """
+        from portfoliohut.loaders import load_series
+
+        if resolution == Resolution.DAILY:
+            return self.get_cumulative_returns(start, end).to_series()
+
+        qset = self.portfolioreturnrollup_set.filter(resolution=resolution)
+        if start is not None:
+            qset = qset.filter(date__gte=start)
+        if end is not None:
+            qset = qset.filter(date__lte=end)
+        return load_series(qset, value_field="cumulative", name="returns") * 100
+
+    def get_first_return_date(self):
+        """The date of the first `PortfolioReturn` (None if there are no returns yet)."""
+        return self.portfolioreturn_set.aggregate(first=Min("date"))["first"]
+
     def get_most_recent_return(self, as_fraction=False) -> float:
         """Get the most recent portfolio return.
 
@@ -179,6 +157,10 @@ class Profile(models.Model):
         else:
             return 0
 
+    def is_returns_updating(self) -> bool:
+        """Whether a queued recompute of the returns has not finished yet."""
+        return ReturnsRecompute.objects.filter(profile=self).exists()
+
     def is_cash_available(self, date_time: datetime, value: Decimal) -> bool:
         """Validate if `Profile` contains enough balance to fund a transaction on a particular date.
 
@@ -197,7 +179,7 @@ class Profile(models.Model):
 
         cash_at_time = cash_transactions.aggregate(
             available_cash=Sum(
-                F("price") * F("quantity"), output_field=models.DecimalField()
+                F("price") * F("quantity"), output_field=FixedPointField()
             )
         )["available_cash"]
 
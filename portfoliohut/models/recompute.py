@@ -0,0 +1,192 @@
+import logging
+from datetime import timedelta
+from typing import TYPE_CHECKING, Optional
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .jobs import Job
+
+if TYPE_CHECKING:
+    from .profile import Profile
+
+logger = logging.getLogger(__name__)
+
+
+class ReturnsRecomputeManager(models.Manager):
+    def schedule(self, profile: "Profile", delay: Optional[float] = None):
+        """Queue (or coalesce into) a pending recompute for `profile`.
+
+        Each call pushes the run time `delay` seconds into the future so that a burst of writes
+        results in a single recompute, but never past `PORTFOLIOHUT_RECOMPUTE_MAX_DELAY` seconds
+        from the first pending request.
+
+        Args:
+            profile: The profile whose holdings and returns are stale
+            delay: The debounce window in seconds (defaults to `PORTFOLIOHUT_RECOMPUTE_DELAY`)
+
+        """
+        if delay is None:
+            delay = settings.PORTFOLIOHUT_RECOMPUTE_DELAY
+        now = timezone.now()
+        run_after = now + timedelta(seconds=delay)
+        with transaction.atomic():
+            pending, created = self.get_or_create(
+                profile=profile,
+                defaults={"first_requested_at": now, "run_after": run_after},
+            )
+            if not created:
+                latest_run = pending.first_requested_at + timedelta(
+                    seconds=settings.PORTFOLIOHUT_RECOMPUTE_MAX_DELAY
+                )
+                run_after = min(run_after, max(latest_run, now))
+                self.filter(pk=pending.pk).update(
+                    run_after=run_after, generation=F("generation") + 1
+                )
+            Job.objects.enqueue(
+                "recompute_returns",
+                {"profile_id": profile.pk},
+                run_at=run_after,
+                dedup_key=f"recompute_returns:{profile.pk}",
+            )
+
+    def _claim(self, pk: int, now) -> bool:
+        """Take the per-profile lock using an atomic compare-and-set on `locked_until`."""
+        lease = timedelta(seconds=settings.PORTFOLIOHUT_RECOMPUTE_LEASE)
+        return bool(
+            self.filter(pk=pk)
+            .filter(Q(locked_until__isnull=True) | Q(locked_until__lt=now))
+            .update(locked_until=now + lease)
+        )
+
+    def run(self, pending: "ReturnsRecompute") -> bool:
+        """Run the post transaction steps for a single pending entry.
+
+        Returns:
+            bool: Whether the recompute ran (`False` if another process holds the lock)
+
+        """
+        from .transactions import Transaction
+
+        if not self._claim(pending.pk, timezone.now()):
+            return False
+
+        # Any schedule() call after this point bumps the generation and keeps the entry queued
+        generation = self.filter(pk=pending.pk).values_list("generation", flat=True)[0]
+        try:
+            Transaction.objects.post_add_transaction_steps(profile=pending.profile)
+        except Exception:
+            # Leave the entry queued so that it is retried once the lock is released
+            self.filter(pk=pending.pk).update(locked_until=None)
+            raise
+
+        if not self.filter(pk=pending.pk, generation=generation).delete()[0]:
+            self.filter(pk=pending.pk).update(locked_until=None)
+
+        return True
+
+    def process_due(self, force=False) -> int:
+        """Run every pending recompute whose debounce window has passed.
+
+        Args:
+            force: Ignore the debounce window and run every pending entry
+
+        Returns:
+            int: The number of recomputes that ran
+
+        """
+        now = timezone.now()
+        pending_qset = self.select_related("profile")
+        if not force:
+            pending_qset = pending_qset.filter(run_after__lte=now)
+
+        count = 0
+        for pending in pending_qset.order_by("run_after"):
+            try:
+                if self.run(pending):
+                    count += 1
+            except Exception:  # noqa: B902
+                logger.exception("Returns recompute failed for %s", pending.profile)
+
+        return count
+
+
+class ReturnsRecompute(models.Model):
+    """A pending recompute of a profile's `PortfolioItem` and `PortfolioReturn` rows.
+
+    There is at most one row per profile, so any number of writes in a short window collapse into a
+    single recompute. The row is removed once the recompute finishes, so its existence means the
+    profile's returns are out of date.
+
+    """
+
+    objects = ReturnsRecomputeManager()
+    profile = models.OneToOneField(
+        "portfoliohut.Profile",
+        on_delete=models.CASCADE,
+        related_name="returns_recompute",
+    )
+    first_requested_at = models.DateTimeField(blank=False)
+    run_after = models.DateTimeField(blank=False, db_index=True)
+    # Bumped on every coalesced request so a running recompute knows it has gone stale
+    generation = models.PositiveIntegerField(default=0)
+    # Set while a recompute is running, acts as the per-profile lock
+    locked_until = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"profile={self.profile}, run_after={self.run_after}"
+
+
+class RecomputeCheckpoint(models.Model):
+    """The progress of a `recompute_returns` management command run.
+
+    A run is identified by its arguments. Finished chunks are stored as inclusive profile id ranges
+    so that rerunning the same command skips them, even if new profiles were added in between.
+
+    """
+
+    key = models.CharField(max_length=255, unique=True)
+    completed = models.JSONField(default=list, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    def is_completed(self, profile_id: int) -> bool:
+        return any(first <= profile_id <= last for first, last in self.completed)
+
+    def add_completed(self, first: int, last: int):
+        self.completed.append([first, last])
+        self.save(update_fields=["completed", "updated"])
+
+    def __str__(self):
+        return f"key={self.key}, chunks={len(self.completed)}"
+
+
+class ReturnsState(models.Model):
+    """The end of day state of a profile's portfolio on its last day with a return.
+
+    Every full recompute of the profile's returns stores it, `roll_forward_returns` then adds the
+    returns of the following days from it and the new prices alone (see
+    `returns_engine.roll_forward`). The fields are those of `returns_engine.EodState`.
+
+    """
+
+    profile = models.OneToOneField(
+        "portfoliohut.Profile",
+        on_delete=models.CASCADE,
+        related_name="returns_state",
+    )
+    date = models.DateField()
+    value = models.FloatField()
+    cash_flows = models.FloatField()
+    internal_cash = models.FloatField()
+    cumulative_return = models.FloatField()
+    # The shares of every ticker the profile ever traded (including the ones it sold)
+    holdings = models.JSONField(default=dict)
+    # Transactions with a higher id were added after the state was computed
+    last_transaction_id = models.IntegerField()
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"profile={self.profile}, date={self.date}"
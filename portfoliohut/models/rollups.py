@@ -0,0 +1,179 @@
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Dict, List, Tuple
+
+from django.db import models, transaction
+from django.db.models import Q
+from django.utils.translation import gettext_lazy as _
+
+from .fields import FixedPointField
+
+
+class Resolution(models.TextChoices):
+    DAILY = "D", _("Daily")
+    WEEKLY = "W", _("Weekly")
+    MONTHLY = "M", _("Monthly")
+
+
+# The resolutions that are stored as rollups (daily values are read from the source tables)
+ROLLUP_RESOLUTIONS = [Resolution.WEEKLY, Resolution.MONTHLY]
+
+
+def _period(day: date, resolution: str) -> Tuple[int, int]:
+    if resolution == Resolution.WEEKLY:
+        return day.isocalendar()[:2]
+    return day.year, day.month
+
+
+def period_start(day: date, resolution: str) -> date:
+    """The first day of the week/month of `day`."""
+    if resolution == Resolution.WEEKLY:
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def period_ends(days: List[date], resolution: str) -> List[int]:
+    """The indices of the last day of each week/month in the sorted `days`."""
+    return [
+        i
+        for i, day in enumerate(days)
+        if i + 1 == len(days)
+        or _period(day, resolution) != _period(days[i + 1], resolution)
+    ]
+
+
+class PortfolioReturnRollupManager(models.Manager):
+    def rebuild(self, returns: Dict[int, Dict[date, float]]):
+        """Replace the rollups of each profile in `returns` with ones built from its daily returns.
+
+        Args:
+            returns: The complete daily returns of each profile id by date
+
+        """
+        rollups = []
+        for profile_id, profile_returns in returns.items():
+            days = sorted(profile_returns)
+            # Same as `Profile.get_cumulative_returns`
+            cumulative = []
+            growth = 1.0
+            for day in days:
+                growth *= abs(profile_returns[day] + 1)
+                cumulative.append(growth - 1)
+            for resolution in ROLLUP_RESOLUTIONS:
+                rollups.extend(
+                    self.model(
+                        profile_id=profile_id,
+                        resolution=resolution,
+                        date=days[i],
+                        cumulative=cumulative[i],
+                    )
+                    for i in period_ends(days, resolution)
+                )
+
+        # A few hundred rows per profile, so rewriting them is cheaper than diffing
+        with transaction.atomic(using=self.db):
+            self.filter(profile_id__in=list(returns)).delete()
+            self.bulk_create(rollups, batch_size=1000)
+
+    def append(self, cumulative: Dict[int, Dict[date, float]]):
+        """Add the cumulative returns of the days after the last rollup of each profile.
+
+        Only the rollups of the periods the new days fall in are rewritten, so the cost does not
+        depend on the length of the history.
+
+        Args:
+            cumulative: The cumulative returns of each profile id by date (after its last rollup)
+
+        """
+        rollups = []
+        replaced = Q()
+        for profile_id, profile_cumulative in cumulative.items():
+            days = sorted(profile_cumulative)
+            if not days:
+                continue
+            for resolution in ROLLUP_RESOLUTIONS:
+                # The last rollup no longer ends its period if the new days are in it
+                replaced |= Q(
+                    profile_id=profile_id,
+                    resolution=resolution,
+                    date__gte=period_start(days[0], resolution),
+                )
+                rollups.extend(
+                    self.model(
+                        profile_id=profile_id,
+                        resolution=resolution,
+                        date=days[i],
+                        cumulative=profile_cumulative[days[i]],
+                    )
+                    for i in period_ends(days, resolution)
+                )
+
+        if not rollups:
+            return
+        with transaction.atomic(using=self.db):
+            self.filter(replaced).delete()
+            self.bulk_create(rollups, batch_size=1000)
+
+
+class PortfolioReturnRollup(models.Model):
+    """The cumulative return of a portfolio on the last day (with a return) of a week or month."""
+
+    class Meta:
+        unique_together = (
+            "profile",
+            "resolution",
+            "date",
+        )
+
+    objects = PortfolioReturnRollupManager()
+    profile = models.ForeignKey(
+        "portfoliohut.Profile", blank=False, on_delete=models.PROTECT
+    )
+    resolution = models.CharField(max_length=1, choices=Resolution.choices)
+    date = models.DateField(blank=False)
+    cumulative = models.FloatField(blank=False)
+
+    def __str__(self):
+        return f"profile={self.profile}, resolution={self.resolution}, date={self.date}"
+
+
+class EquityRollupManager(models.Manager):
+    def rebuild(self, ticker: str, closes: List[Tuple[date, Decimal]]):
+        """Replace the rollups of `ticker` with the last close of each week and month.
+
+        Args:
+            ticker: The ticker of the prices
+            closes: Every `(date, close)` of the ticker sorted by date
+
+        """
+        days, prices = zip(*closes) if closes else ((), ())
+        rollups = [
+            self.model(
+                ticker=ticker, resolution=resolution, date=days[i], close=prices[i]
+            )
+            for resolution in ROLLUP_RESOLUTIONS
+            for i in period_ends(list(days), resolution)
+        ]
+        with transaction.atomic(using=self.db):
+            self.filter(ticker=ticker).delete()
+            self.bulk_create(rollups, batch_size=1000)
+
+
+class EquityRollup(models.Model):
+    """The close price of an equity on the last trading day of a week or month."""
+
+    class Meta:
+        unique_together = (
+            "ticker",
+            "resolution",
+            "date",
+        )
+
+    objects = EquityRollupManager()
+    ticker = models.CharField(max_length=20, blank=False)
+    resolution = models.CharField(max_length=1, choices=Resolution.choices)
+    date = models.DateField(blank=False)
+    close = FixedPointField(blank=False)
+
+    def __str__(self):
+        return f"ticker={self.ticker}, resolution={self.resolution}, date={self.date}"
@@ -1,21 +1,41 @@
-from datetime import timedelta
+import logging
+import math
+import threading
+import time
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date, timedelta
 from decimal import Decimal
-from typing import TYPE_CHECKING, List
+from typing import TYPE_CHECKING, Dict, List, Optional
 
-import numpy as np
-import pandas as pd
-import pandas_market_calendars as mcal
-import yfinance as yf
+from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
 from django.core.validators import MinValueValidator
-from django.db import models, transaction
-from django.db.models import ExpressionWrapper, F, Sum
+from django.db import connections, models, transaction
+from django.db.models import F, Max, Min, Q, Sum
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
+from portfoliohut import archive
+from portfoliohut.metrics import (
+    CACHE_HITS,
+    CACHE_MISSES,
+    RECOMPUTE_DURATION,
+    RETURNS_ROWS_WRITTEN,
+)
+
+from .fields import FixedPointField
+from .recompute import ReturnsRecompute
+from .rollups import EquityRollup, PortfolioReturnRollup
+
 if TYPE_CHECKING:
+    import pandas as pd
+
     from .profile import Profile
 
+logger = logging.getLogger(__name__)
+
 
 class FinancialActionType(models.TextChoices):
     EQUITY = "EQ", _("Equity")
@@ -44,12 +64,12 @@ class TransactionManager(models.Manager):
                 .order_by("ticker")
                 .annotate(
                     total_quantity=Sum("quantity"),
-                    average_price=Sum(
-                        (F("quantity") * F("price")), output_field=models.DecimalField()
-                    )
-                    / Sum("quantity", output_field=models.DecimalField()),
+                    total_price=Sum(
+                        (F("quantity") * F("price")), output_field=FixedPointField()
+                    ),
                 )
             )
+            # The average is divided here, SQL would divide the integer cents as integers
             PortfolioItem.objects.bulk_create(
                 [
                     PortfolioItem(
@@ -57,9 +77,11 @@ class TransactionManager(models.Manager):
                         type=FinancialActionType.EQUITY,
                         ticker=d.get("ticker"),
                         quantity=d.get("total_quantity"),
-                        price=d.get("average_price"),
+                        price=d.get("total_price") / d.get("total_quantity"),
                     )
                     for d in item_dicts
+                    # Positions that were sold off are no longer held
+                    if d.get("total_quantity")
                 ]
             )
             total_price = (
@@ -67,7 +89,7 @@ class TransactionManager(models.Manager):
                 .values("quantity", "price")
                 .aggregate(
                     total_price=Sum(
-                        (F("quantity") * F("price")), output_field=models.DecimalField()
+                        (F("quantity") * F("price")), output_field=FixedPointField()
                     )
                 )["total_price"]
             )
@@ -80,181 +102,50 @@ class TransactionManager(models.Manager):
             ).save()
 
     def _recompute_returns(self, profile: "Profile"):
-        """Compute the returns for a given query set of of stock transactions.
+        """Recompute and store the daily returns, the XIRR and the `ReturnsState` of a profile.
 
-        Assumes that the qset is ordered by increasing dates.
+        This only loads the profile's transactions and prices, the returns are computed by
+        `returns_engine.compute_returns`. Profiles without equity transactions have no returns
+        and their stored returns are left as is.
 
         Args:
             profile: The profile for which to recompute the returns
 
         Returns:
-            QuerySet[ReturnItem]
+            ReturnsWriteStats: The number of `PortfolioReturn` rows touched
 
         """
+        from portfoliohut import returns_engine
+        from portfoliohut.batch_returns import (
+            equity_profile_ids,
+            last_transaction_id,
+            load_ledger,
+            load_price_matrix,
+            write_states,
+            write_twr,
+            write_xirr,
+        )
 
         # TODO: We really don't need to recompute all returns every time a transaction is added, we
         #       recompute returns from that point in time. (@adithyabsk)
+        if not equity_profile_ids([profile.id]):
+            return ReturnsWriteStats(inserted=0, updated=0, deleted=0, unchanged=0)
 
-        # Filter for just internal cash transactions and equity transactions, then make sure to filter
-        # out all of the buy actions. This is NOT actually your portfolio value but respects the
-        # "locked" in gains
-        profile_transactions = self.filter(profile=profile)
-
-        # Abort if there were no relevant transactions
-        empty_series = pd.Series([], name="Returns")
-        if not profile_transactions.exists():
-            return empty_series
-
-        start_date = profile_transactions.first().date_time.date()
-        # Remove cash balance ticker
-        distinct_tickers = set(
-            profile_transactions.filter(type=FinancialActionType.EQUITY).values_list(
-                "ticker", flat=True
-            )
-        )
-
-        # Abort if there were not any stock transactions
-        if not distinct_tickers:
-            return empty_series
-
-        # Build a list of stock prices across all relevant dates
-        price_series_list = []
-        for ticker in distinct_tickers:
-            dates, closes = zip(
-                *HistoricalEquity.objects.get_ticker(ticker)
-                .filter(date__gte=start_date)
-                .values_list("date", "close")
-            )
-            price_series_list.append(pd.Series(closes, index=dates, name=ticker))
-        stocks_df = pd.concat(price_series_list, axis=1).sort_index()
-
-        # Build a DataFrame similar to previous with the cumulative quantities at each date.
         # TODO: There is another bug here where the first day of returns may be calculated incorrectly
         #       since we use the close price to compute returns rather than the price that a user paid
         #       for the equity.
-        quantity_series_list = []
-        for ticker in distinct_tickers:
-            dates, quantities = zip(
-                *profile_transactions.filter(ticker=ticker).values_list(
-                    "date_time__date", "quantity"
-                )
-            )
-            # Note: this is where the bug is
-            # Sum the stocks bought on the same day
-            quantity_series = pd.Series(
-                quantities, index=dates, dtype="int64", name=ticker
-            )
-            quantity_series_list.append(
-                quantity_series.groupby(quantity_series.index).sum()
-            )
-        quantities_df = (
-            pd.concat(quantity_series_list, axis=1)
-            .sort_index()
-            .fillna(0)
-            .cumsum()
-            .reindex(stocks_df.index, method="ffill")
-            .fillna(0)
-            .astype("int64")
+        max_id = last_transaction_id()
+        prices = load_price_matrix([profile.id])
+        ledger = load_ledger([profile.id], prices.tickers, max_id=max_id)
+        result = returns_engine.compute_returns(
+            ledger, prices.closes, prices.day_numbers
         )
-
-        # Build the cumulative internal cash at each date (buy/sell)
-        internal_cash_qset = profile_transactions.filter(
-            type=FinancialActionType.INTERNAL_CASH
-        ).values_list(
-            "date_time__date",
-            ExpressionWrapper(
-                F("price") * F("quantity"),
-                output_field=models.DecimalField(decimal_places=2, max_digits=100),
-            ),
+        write_xirr(
+            result.profile_ids,
+            returns_engine.compute_xirr(ledger, result, prices.day_numbers),
         )
-        if internal_cash_qset.exists():
-            sale_dates, sale_prices = zip(*internal_cash_qset)
-            internal_cash_series = pd.Series(sale_prices, index=sale_dates, name="Cash")
-            internal_cash_series = (
-                internal_cash_series.groupby(internal_cash_series.index)
-                .sum()
-                .cumsum()
-                .reindex(stocks_df.index, method="ffill")
-                .fillna(0)
-            )
-        else:
-            internal_cash_series = pd.Series(
-                [0] * len(quantities_df), index=stocks_df.index, name="Cash"
-            )
-
-        # Build the discrete cash flows at each date (cash deposits and withdrawals)
-        external_cash_qset = profile_transactions.filter(
-            type=FinancialActionType.EXTERNAL_CASH
-        ).values_list(
-            "date_time__date",
-            ExpressionWrapper(
-                F("price") * F("quantity"),
-                output_field=models.DecimalField(decimal_places=2, max_digits=100),
-            ),
-        )
-        if external_cash_qset.exists():
-            sale_dates, sale_prices = zip(*external_cash_qset)
-            external_cash_series = pd.Series(sale_prices, index=sale_dates, name="Cash")
-            external_cash_series = (
-                external_cash_series.groupby(external_cash_series.index)
-                .sum()
-                .reindex(stocks_df.index, method=None)
-                .fillna(0)
-                # .astype(float)
-            )
-        else:
-            external_cash_series = pd.Series(
-                [0] * len(quantities_df), index=stocks_df.index, name="Cash"
-            )
-
-        # Compute time-weighted returns
-        # https://rodgers-associates.com/blog/why-is-time-weighted-return-a-good-way-to-track-performance-in-retirement/
-        # Now, we multiply stocks_df by quantities_df and add internal cash management
-        partial_portval = (
-            stocks_df.multiply(quantities_df)
-            .sum(axis=1)
-            .add(internal_cash_series.astype(float))
-        )
-        # TODO: The reason that comp_df does not have the day of the initial transaction (i.e. returns as pushed
-        #       forward 2 days) is because cash flow is factored in on the next day as part of your portfolio value.
-        #       This results in incorrect returns computations so we have a lazy trick which results in that day being
-        #       nan in the shifted external_cash_series which causes comp_df to drop it as a nan row. This is a bug that
-        #       needs to be fixed.
-        complete_portval = partial_portval + external_cash_series.cumsum().shift(
-            1
-        ).astype(float)
-        comp_df = (
-            pd.DataFrame(
-                {
-                    "bpv": complete_portval.shift(1),  # yesterday portfolio value
-                    "epv": complete_portval,  # today portfolio value
-                    "cf": external_cash_series,  # cash flow
-                }
-            )
-            .dropna()
-            .astype(float)
-        )
-        twr_series = comp_df.apply(
-            lambda row: (row.epv - (row.bpv + row.cf)) / (row.bpv + row.cf), axis=1
-        )
-        twr_series.name = "returns"
-        twr_series.replace([np.inf, -np.inf], np.nan, inplace=True)
-        twr_series = twr_series.dropna()
-
-        with transaction.atomic():
-            profile.portfolioreturn_set.all().delete()
-            prs = PortfolioReturn.objects.bulk_create(
-                [
-                    PortfolioReturn(
-                        profile=profile,
-                        date=date,
-                        returns=returns,
-                    )
-                    for date, returns in twr_series.iteritems()  # noqa: B301
-                ]
-            )
-
-            return prs
+        write_states(ledger, result, prices, max_id)
+        return write_twr(result.profile_ids, prices.dates, result.twr)
 
     def _create_equity_transaction(self, **kwargs):
         # stock action
@@ -278,18 +169,23 @@ class TransactionManager(models.Manager):
         self.model(**kwargs).save()
 
     def post_add_transaction_steps(self, profile: "Profile"):
-        self._reset_portfolio_cache(profile=profile)
-        self._recompute_returns(profile=profile)
+        with RECOMPUTE_DURATION.time(engine="profile"):
+            self._reset_portfolio_cache(profile=profile)
+            self._recompute_returns(profile=profile)
+
+    def schedule_post_add_transaction_steps(self, profile: "Profile"):
+        """Queue `post_add_transaction_steps` so that a burst of writes only recomputes once."""
+        ReturnsRecompute.objects.schedule(profile)
 
     def create_equity_transaction(self, only_create=False, **kwargs):
         self._create_equity_transaction(**kwargs)
         if not only_create:
-            self.post_add_transaction_steps(profile=kwargs.get("profile"))
+            self.schedule_post_add_transaction_steps(profile=kwargs.get("profile"))
 
     def create_cash_transaction(self, only_create=False, **kwargs):
         self._create_cash_transaction(**kwargs)
         if not only_create:
-            self.post_add_transaction_steps(profile=kwargs.get("profile"))
+            self.schedule_post_add_transaction_steps(profile=kwargs.get("profile"))
 
     def bulk_create(self, objs, batch_size=None, ignore_conflicts=False, profile=None):
         objs: List[Transaction] = super().bulk_create(
@@ -311,7 +207,7 @@ class Transaction(models.Model):
     """An individual transaction.
 
     You must use `Transaction.objects.create_equity_transaction` or `Transaction.objects.create_cash_transaction`
-    so that the related `PortfolioItem` will be updated. Use bulk create along with the helper method
+    so that the related `PortfolioItem` will be updated (the update is queued, see `ReturnsRecompute`). Use bulk create along with the helper method
     `Transaction.objects._create_equity_transaction` to skip `PortfolioItem` after each `Transaction`
     creation.
 
@@ -319,6 +215,12 @@ class Transaction(models.Model):
 
     class Meta:
         unique_together = ("profile", "ticker", "date_time")
+        indexes = [
+            # Keyset pagination of the transaction history (see `portfoliohut.pagination`)
+            models.Index(
+                fields=["profile", "date_time", "id"], name="transaction_history_idx"
+            ),
+        ]
 
     objects = TransactionManager()
     type = models.CharField(
@@ -332,9 +234,7 @@ class Transaction(models.Model):
     quantity = models.IntegerField(
         blank=False
     )  # positive for buy/deposit negative for sell/withdraw
-    price = models.DecimalField(
-        max_digits=100,
-        decimal_places=2,
+    price = FixedPointField(
         blank=False,
         validators=[MinValueValidator(Decimal("0.01"))],
     )  # always greater than zero
@@ -387,11 +287,7 @@ class PortfolioItem(models.Model):
     quantity = models.IntegerField(
         blank=False
     )  # positive for buy/deposit negative for sell/withdraw
-    price = models.DecimalField(
-        max_digits=100,
-        decimal_places=2,
-        blank=False,
-    )  # always greater than zero
+    price = FixedPointField(blank=False)  # always greater than zero
 
     def viewable_type(self):
         if self.type == FinancialActionType.EXTERNAL_CASH:
@@ -420,64 +316,259 @@ class PortfolioItem(models.Model):
         return ", ".join(self.display_items())
 
 
+# One lock per ticker (the number of tickers is small enough to never evict them)
+_ticker_locks = defaultdict(threading.Lock)
+_ticker_locks_guard = threading.Lock()
+
+
+@contextmanager
+def _single_flight(ticker: str):
+    with _ticker_locks_guard:
+        lock = _ticker_locks[ticker]
+    with lock:
+        yield
+
+
 class HistoricalEquityManager(models.Manager):
-    def _add_historical_ticker_data(self, ticker: str, df: pd.DataFrame):
-        if not df.empty:
-            df = df.reset_index()
-            df = df.dropna(subset=["Open", "Close"])
-            df = df.where(pd.notnull(df), None)
-            self.bulk_create(
-                [
-                    self.model(
-                        type=FinancialActionType.EQUITY,
-                        ticker=ticker,
-                        date=record["Date"],
-                        open=record["Open"],
-                        high=record["High"],
-                        low=record["Low"],
-                        close=record["Close"],
-                        volume=record["Volume"],
-                        dividends=record["Dividends"],
-                        stock_splits=record["Stock Splits"],
-                    )
-                    for record in df.to_dict("records")
-                ]
+    def _add_historical_ticker_data(self, ticker: str, df: "pd.DataFrame"):
+        from portfoliohut.ingest import ingest_prices
+
+        if ingest_prices(ticker, df, using=self.db) and (
+            ticker in settings.PORTFOLIOHUT_ROLLUP_TICKERS
+        ):
+            self.refresh_rollups(ticker)
+
+    def refresh_rollups(self, ticker: str):
+        """Rebuild the weekly and monthly `EquityRollup` rows of a ticker."""
+        EquityRollup.objects.rebuild(ticker, self.price_history(ticker))
+
+    def price_history(
+        self, ticker: str, fields=("close",), start_date=None, end_date=None
+    ) -> List[tuple]:
+        """The `(date, *fields)` of a ticker's prices sorted by date, including archived ones.
+
+        Prices before `archive.cutoff()` are read from the price archive (only `fields` and the
+        files of the years in range are read).
+
+        """
+        rows = []
+        qset = self.filter(ticker=ticker)
+        cutoff = archive.cutoff()
+        if cutoff is not None and (start_date is None or start_date < cutoff):
+            archive_end = cutoff - timedelta(days=1)
+            rows = archive.read_records(
+                ticker,
+                fields,
+                start_date,
+                archive_end if end_date is None else min(end_date, archive_end),
             )
+            start_date = cutoff
+        if start_date is not None:
+            qset = qset.filter(date__gte=start_date)
+        if end_date is not None:
+            qset = qset.filter(date__lte=end_date)
+        return rows + list(qset.order_by("date").values_list("date", *fields))
+
+    def first_close(self, ticker: str, start_date=None) -> Optional[Decimal]:
+        """The first close of a ticker on or after `start_date` (including archived prices)."""
+        cutoff = archive.cutoff()
+        if cutoff is not None and (start_date is None or start_date < cutoff):
+            archived = archive.read_records(
+                ticker, ["close"], start_date, cutoff - timedelta(days=1)
+            )
+            if archived:
+                return archived[0][1]
+            start_date = cutoff
+        qset = self.filter(ticker=ticker)
+        if start_date is not None:
+            qset = qset.filter(date__gte=start_date)
+        return qset.order_by("date").values_list("close", flat=True).first()
+
+    def get_bar(self, ticker: str, day: date) -> Optional["HistoricalEquity"]:
+        """The prices of a ticker on a day (an unsaved instance if they were archived)."""
+        cutoff = archive.cutoff()
+        if cutoff is None or day >= cutoff:
+            return self.filter(ticker=ticker, date=day).first()
+        records = archive.read_records(ticker, archive.COLUMNS[1:], day, day)
+        if not records:
+            return None
+        return self.model(
+            type=FinancialActionType.EQUITY,
+            ticker=ticker,
+            **dict(zip(archive.COLUMNS, records[0])),
+        )
 
-    def get_ticker(self, ticker):
-        # First check if the ticker exists
-        ticker_qset = self.filter(ticker=ticker)
-        if ticker_qset.exists():
-            # Check if we need to update the data in the table (default ordering is ascending dates)
-            most_recent_date = ticker_qset.last().date
-            today = timezone.now()
-            if today.date() > most_recent_date:
-                # Assume NYSE exchange (for now)
-                nyse = mcal.get_calendar("NYSE")
-                # The schedule is on the range [start_date, end_date] (inclusive)
-                nyse_schedule = nyse.schedule(
-                    start_date=today.date() - timedelta(days=1),
-                    end_date=today.date() + timedelta(days=1),
+    def archive_old_prices(self, ticker: str) -> int:
+        """Move the prices of a ticker before `archive.cutoff()` to the price archive.
+
+        Returns:
+            int: The number of prices moved
+
+        """
+        old = self.filter(ticker=ticker, date__lt=archive.cutoff())
+        rows = list(old.values_list(*archive.COLUMNS))
+        if not rows:
+            return 0
+        # Only deleted once they are in the archive
+        archive.write(ticker, rows)
+        with transaction.atomic(using=self.db):
+            old.delete()
+            self._update_metadata(ticker)
+        return len(rows)
+
+    def _update_metadata(self, ticker: str, **fields) -> "TickerMetadata":
+        dates = self.filter(ticker=ticker).aggregate(
+            first_date=Min("date"), last_date=Max("date")
+        )
+        if archive.enabled():
+            archived = archive.date_range(ticker)
+            dates = {
+                "first_date": min(
+                    filter(None, [archived[0], dates["first_date"]]), default=None
+                ),
+                "last_date": max(
+                    filter(None, [archived[1], dates["last_date"]]), default=None
+                ),
+            }
+        metadata, _ = TickerMetadata.objects.update_or_create(
+            ticker=ticker, defaults={**dates, **fields}
+        )
+        return metadata
+
+    def _get_metadata(self, ticker: str) -> Optional["TickerMetadata"]:
+        # Freshness and "not found" checks only need a primary key lookup
+        metadata = TickerMetadata.objects.filter(ticker=ticker).first()
+        if metadata is None and self.filter(ticker=ticker).exists():
+            # Prices that were loaded without going through `get_ticker`
+            metadata = self._update_metadata(ticker, status=TickerStatus.OK)
+        return metadata
+
+    @staticmethod
+    def needs_fetch(metadata: Optional["TickerMetadata"], now) -> bool:
+        if metadata is None:
+            return True
+        if metadata.is_known_missing(now):
+            return False
+        if metadata.last_date is None:
+            return True
+        return now.date() > metadata.last_date and metadata.should_refresh(now)
+
+    def _fetch(self, ticker: str, metadata: "TickerMetadata", now) -> "TickerMetadata":
+        import pandas_market_calendars as mcal
+
+        from portfoliohut.providers import get_provider
+
+        if metadata.last_date is None:
+            df = get_provider().get_history(ticker)
+            if df.empty:
+                metadata.status = TickerStatus.NOT_FOUND
+                metadata.last_fetch_attempt = now
+                metadata.not_found_until = now + timedelta(
+                    seconds=settings.PORTFOLIOHUT_TICKER_NOT_FOUND_TTL
                 )
-                if nyse.open_at_time(nyse_schedule, today):
-                    # Get the most recent ticker prices
-                    df = yf.Ticker(ticker).history(
-                        start=most_recent_date + timedelta(days=1)
+                metadata.save()
+                return metadata
+
+            self._add_historical_ticker_data(ticker, df)
+            return self._update_metadata(
+                ticker,
+                status=TickerStatus.OK,
+                last_fetch_attempt=now,
+                not_found_until=None,
+            )
+
+        # Assume NYSE exchange (for now)
+        nyse = mcal.get_calendar("NYSE")
+        # The schedule is on the range [start_date, end_date] (inclusive)
+        nyse_schedule = nyse.schedule(
+            start_date=now.date() - timedelta(days=1),
+            end_date=now.date() + timedelta(days=1),
+        )
+        if nyse.open_at_time(nyse_schedule, now):
+            # Get the most recent ticker prices
+            df = get_provider().get_history(
+                ticker, start=metadata.last_date + timedelta(days=1)
+            )
+            self._add_historical_ticker_data(ticker, df)
+        return self._update_metadata(
+            ticker, status=TickerStatus.OK, last_fetch_attempt=now
+        )
+
+    def _fetch_once(self, ticker: str):
+        """Fetch the prices of a ticker unless another process is already fetching them.
+
+        The fetching process holds a lease on the ticker (`TickerMetadata.fetching_until`), which
+        is claimed with a single UPDATE, so no transaction or row lock is held while the prices
+        are downloaded. Other processes poll the metadata until the prices are in, or take over
+        once the lease runs out (e.g. the process died). They give up waiting after
+        `TICKER_FETCH_WAIT` seconds (before their request times out) and keep the prices cached
+        so far.
+
+        Returns:
+            The metadata after the fetch and the time it was checked at
+
+        """
+        lease = timedelta(seconds=settings.PORTFOLIOHUT_TICKER_FETCH_LEASE)
+        give_up_at = time.monotonic() + settings.PORTFOLIOHUT_TICKER_FETCH_WAIT
+        while True:
+            metadata, _ = TickerMetadata.objects.get_or_create(ticker=ticker)
+            now = timezone.now()
+            # The prices may have been fetched while we were waiting
+            if not self.needs_fetch(metadata, now):
+                return metadata, now
+            claimed = TickerMetadata.objects.filter(
+                Q(fetching_until__isnull=True) | Q(fetching_until__lte=now),
+                ticker=ticker,
+            ).update(fetching_until=now + lease)
+            if claimed:
+                try:
+                    return self._fetch(ticker, metadata, now), now
+                finally:
+                    TickerMetadata.objects.filter(ticker=ticker).update(
+                        fetching_until=None
                     )
-                    self._add_historical_ticker_data(ticker, df)
+            if time.monotonic() >= give_up_at:
+                return metadata, now
+            time.sleep(settings.PORTFOLIOHUT_TICKER_FETCH_POLL)
 
-                    # return updated qset
-                    return self.filter(ticker=ticker)
+    def _outside_transaction(self, func, *args):
+        """Call `func` on a connection of its own (in autocommit mode) if a transaction is open.
 
-            # return original qset
-            return ticker_qset
+        A fetch inside e.g. the transaction of a CSV import would otherwise hold the lock on the
+        metadata row, and hide the lease and the prices from other processes, until the import
+        commits. SQLite only has one writer at a time, so there `func` joins the transaction (a
+        second connection would wait for it).
+
+        """
+        connection = connections[self.db]
+        if not connection.in_atomic_block or connection.vendor == "sqlite":
+            return func(*args)
+
+        def run():
+            try:
+                return func(*args)
+            finally:
+                # The connection of the worker thread
+                connections[self.db].close()
+
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            return pool.submit(run).result()
+
+    def get_ticker(self, ticker):
+        metadata = self._get_metadata(ticker)
+        now = timezone.now()
+        if not self.needs_fetch(metadata, now):
+            CACHE_HITS.inc(cache="prices")
         else:
-            df = yf.Ticker(ticker).history(period="max")
-            if not df.empty:
-                self._add_historical_ticker_data(ticker, df)
-                return self.filter(ticker=ticker)
-            else:
-                return HistoricalEquity.objects.none()
+            CACHE_MISSES.inc(cache="prices")
+            # Only one caller per ticker downloads the prices: threads of this process wait on
+            # the ticker's lock and other processes for the lease on its metadata row
+            with _single_flight(ticker):
+                metadata, now = self._outside_transaction(self._fetch_once, ticker)
+
+        if metadata.is_known_missing(now):
+            return self.none()
+        return self.filter(ticker=ticker)
 
 
 class HistoricalEquity(models.Model):
@@ -496,12 +587,12 @@ class HistoricalEquity(models.Model):
     )
     ticker = models.CharField(max_length=20, blank=False)  # For cash actions use "-"
     date = models.DateField(blank=False)
-    open = models.DecimalField(max_digits=100, decimal_places=2, blank=False)
-    high = models.DecimalField(max_digits=100, decimal_places=2, blank=False)
-    low = models.DecimalField(max_digits=100, decimal_places=2, blank=False)
-    close = models.DecimalField(max_digits=100, decimal_places=2, blank=False)
+    open = FixedPointField(blank=False)
+    high = FixedPointField(blank=False)
+    low = FixedPointField(blank=False)
+    close = FixedPointField(blank=False)
     volume = models.PositiveBigIntegerField()
-    dividends = models.DecimalField(max_digits=100, decimal_places=2)
+    dividends = FixedPointField()
     stock_splits = models.IntegerField()
 
     def display_items(self):
@@ -515,11 +606,52 @@ class HistoricalEquity(models.Model):
         return ", ".join(self.display_items())
 
 
+class TickerStatus(models.TextChoices):
+    OK = "ok", _("OK")
+    NOT_FOUND = "not_found", _("Not Found")
+
+
+class TickerMetadata(models.Model):
+    """What we know about the cached `HistoricalEquity` rows of a ticker.
+
+    `HistoricalEquityManager.get_ticker` reads this single row to decide if the prices need to be
+    refreshed, and to reject tickers that yfinance didn't know about (until `not_found_until`)
+    without a network call.
+
+    """
+
+    ticker = models.CharField(max_length=20, primary_key=True)
+    status = models.CharField(
+        max_length=10, choices=TickerStatus.choices, default=TickerStatus.OK
+    )
+    first_date = models.DateField(null=True, blank=True)
+    last_date = models.DateField(null=True, blank=True)
+    last_fetch_attempt = models.DateTimeField(null=True, blank=True)
+    not_found_until = models.DateTimeField(null=True, blank=True)
+    # The lease of the process downloading the prices, others wait for it until it expires
+    fetching_until = models.DateTimeField(null=True, blank=True)
+
+    def is_known_missing(self, now) -> bool:
+        return self.status == TickerStatus.NOT_FOUND and (
+            self.not_found_until is not None and now < self.not_found_until
+        )
+
+    def should_refresh(self, now) -> bool:
+        return self.last_fetch_attempt is None or now - self.last_fetch_attempt >= (
+            timedelta(seconds=settings.PORTFOLIOHUT_PRICE_REFRESH_INTERVAL)
+        )
+
+    def __str__(self):
+        return f"ticker={self.ticker}, status={self.status}, last_date={self.last_date}"
+
+
 class EquityInfoManager(models.Manager):
     def get_ticker(self, ticker):
         try:
             return self.get(ticker=ticker)
         except ObjectDoesNotExist:
+            import yfinance as yf
+
             ticker_info = yf.Ticker(ticker).info
             if "symbol" not in ticker_info:
                 raise ObjectDoesNotExist(
@@ -560,7 +692,139 @@ class EquityInfo(models.Model):
         return f"ticker={self.ticker}"
 
 
+ReturnsWriteStats = namedtuple(
+    "ReturnsWriteStats", ["inserted", "updated", "deleted", "unchanged"]
+)
+
+
 class PortfolioReturnQuerySet(models.QuerySet):
+    # Recomputed returns closer than this to the stored ones are left alone (floating point noise)
+    RETURNS_TOLERANCE = 1e-12
+    BATCH_SIZE = 1000
+
+    def write_returns(self, returns: Dict[int, Dict[date, float]]) -> ReturnsWriteStats:
+        """Store newly computed returns, only touching the rows that changed.
+
+        Rows on dates that are missing from a profile's new returns are deleted, new dates are
+        inserted and dates whose return changed are updated.
+
+        Args:
+            returns: The new returns of each profile id by date
+
+        Returns:
+            ReturnsWriteStats: The number of rows inserted, updated, deleted and left as is
+
+        """
+        to_insert, to_update, to_delete = [], [], []
+        changed_profile_ids = set()
+        stored_rows = self.filter(profile_id__in=list(returns)).values_list(
+            "id", "profile_id", "date", "returns"
+        )
+        seen = set()
+        for pk, profile_id, day, stored in stored_rows.iterator():
+            new = returns[profile_id].get(day)
+            seen.add((profile_id, day))
+            if new is None:
+                to_delete.append(pk)
+                changed_profile_ids.add(profile_id)
+            elif not math.isclose(
+                new,
+                stored,
+                rel_tol=self.RETURNS_TOLERANCE,
+                abs_tol=self.RETURNS_TOLERANCE,
+            ):
+                to_update.append(self.model(id=pk, returns=new))
+                changed_profile_ids.add(profile_id)
+        for profile_id, profile_returns in returns.items():
+            for day, new in profile_returns.items():
+                if (profile_id, day) not in seen:
+                    to_insert.append(
+                        self.model(profile_id=profile_id, date=day, returns=new)
+                    )
+                    changed_profile_ids.add(profile_id)
+
+        with transaction.atomic(using=self.db):
+            for i in range(0, len(to_delete), self.BATCH_SIZE):
+                self.filter(id__in=to_delete[i : i + self.BATCH_SIZE]).delete()
+            self.bulk_update(to_update, ["returns"], batch_size=self.BATCH_SIZE)
+            self.bulk_create(to_insert, batch_size=self.BATCH_SIZE)
+            # Invalidates the ETags of the returns endpoints
+            self.model.profile.field.related_model.objects.filter(
+                pk__in=changed_profile_ids
+            ).update(
+                returns_version=F("returns_version") + 1,
+                returns_updated=timezone.now(),
+            )
+            PortfolioReturnRollup.objects.rebuild(
+                {profile_id: returns[profile_id] for profile_id in changed_profile_ids}
+            )
+
+        stats = ReturnsWriteStats(
+            inserted=len(to_insert),
+            updated=len(to_update),
+            deleted=len(to_delete),
+            unchanged=len(seen) - len(to_update) - len(to_delete),
+        )
+        logger.info("Wrote returns of %s profile(s): %s", len(returns), stats)
+        for operation in ("inserted", "updated", "deleted"):
+            RETURNS_ROWS_WRITTEN.observe(getattr(stats, operation), operation=operation)
+        return stats
+
+    def append_returns(
+        self, returns: Dict[int, Dict[date, float]], growth: Dict[int, float]
+    ) -> int:
+        """Store the returns of days after the last stored return of each profile.
+
+        Unlike `write_returns` this never reads the stored returns, the rollups are updated from
+        the cumulative growth of each profile before the new days.
+
+        Args:
+            returns: The new returns of each profile id by date
+            growth: The cumulative growth (`1 + cumulative return`) of each profile id before them
+
+        Returns:
+            int: The number of rows inserted
+
+        """
+        rows = []
+        cumulative = {}
+        for profile_id, profile_returns in returns.items():
+            profile_growth = growth[profile_id]
+            cumulative[profile_id] = {}
+            for day in sorted(profile_returns):
+                rows.append(
+                    self.model(
+                        profile_id=profile_id, date=day, returns=profile_returns[day]
+                    )
+                )
+                # Same as `Profile.get_cumulative_returns`
+                profile_growth *= abs(profile_returns[day] + 1)
+                cumulative[profile_id][day] = profile_growth - 1
+        changed_profile_ids = [
+            profile_id
+            for profile_id, profile_returns in returns.items()
+            if profile_returns
+        ]
+
+        with transaction.atomic(using=self.db):
+            self.bulk_create(rows, batch_size=self.BATCH_SIZE)
+            # Invalidates the ETags of the returns endpoints
+            self.model.profile.field.related_model.objects.filter(
+                pk__in=changed_profile_ids
+            ).update(
+                returns_version=F("returns_version") + 1,
+                returns_updated=timezone.now(),
+            )
+            PortfolioReturnRollup.objects.append(cumulative)
+
+        logger.info(
+            "Appended %s return(s) of %s profile(s)",
+            len(rows),
+            len(changed_profile_ids),
+        )
+        RETURNS_ROWS_WRITTEN.observe(len(rows), operation="inserted")
+        return len(rows)
+
     def to_series(self, as_fraction=False):
         """Build a returns `pd.Series` for a select `PortfolioReturnQuerySet`
 
@@ -568,18 +832,21 @@ class PortfolioReturnQuerySet(models.QuerySet):
             as_fraction: Whether to output as a decimal or as "* 100"
 
         """
-        qset = self.order_by("date").values_list("date", "cumprod")
+        from portfoliohut.loaders import load_cumulative_returns
+
         multiplier = 1 if as_fraction else 100
-        if qset.exists():
-            dates, returns = zip(*self.order_by("date").values_list("date", "cumprod"))
-            return pd.Series(returns, index=dates, name="returns") * multiplier
-        else:
-            return pd.Series([], name="returns")
+        return load_cumulative_returns(self) * multiplier
 
 
 class PortfolioReturn(models.Model):
     """The rolling return on a particular day for a portfolio"""
 
+    class Meta:
+        unique_together = (
+            "profile",
+            "date",
+        )
+
     profile = models.ForeignKey(
         "portfoliohut.Profile", blank=False, on_delete=models.PROTECT
     )
@@ -0,0 +1,143 @@
+"""Market data providers.
+
+Everything that needs prices from outside of the database goes through `get_provider()`, which
+returns the provider configured by `PORTFOLIOHUT_MARKET_DATA_PROVIDER`:
+
+* `YFinanceProvider` downloads prices from Yahoo Finance
+* `OfflineProvider` never touches the network. It makes up a deterministic price history for any
+  ticker and quotes the last cached close, which makes it useful for development, tests and load
+  tests
+
+"""
+import zlib
+from datetime import date
+from functools import lru_cache, wraps
+from typing import TYPE_CHECKING, Dict, Iterable, Optional
+
+from django.conf import settings
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from portfoliohut.metrics import PROVIDER_ERRORS, PROVIDER_LATENCY
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+def instrumented(method):
+    """Record the latency and errors of a provider method."""
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        labels = {"provider": type(self).__name__, "method": method.__name__}
+        with PROVIDER_LATENCY.time(**labels):
+            try:
+                return method(self, *args, **kwargs)
+            except Exception:  # noqa: B902
+                PROVIDER_ERRORS.inc(**labels)
+                raise
+
+    return wrapper
+
+
+class MarketDataProvider:
+    def get_history(self, ticker: str, start: Optional[date] = None) -> "pd.DataFrame":
+        """Get the daily price history of a ticker.
+
+        Args:
+            ticker: The ticker to look up
+            start: The first date (defaults to the full history)
+
+        Returns:
+            pd.DataFrame: Open, High, Low, Close, Volume, Dividends and Stock Splits indexed by
+                date (empty if the ticker doesn't exist), like `yf.Ticker(ticker).history()`
+
+        """
+        raise NotImplementedError
+
+    def get_quotes(self, tickers: Iterable[str]) -> Dict[str, float]:
+        """Get the latest price of several tickers (tickers without a price are left out)."""
+        raise NotImplementedError
+
+
+class YFinanceProvider(MarketDataProvider):
+    @instrumented
+    def get_history(self, ticker, start=None):
+        import yfinance as yf
+
+        if start is None:
+            return yf.Ticker(ticker).history(period="max")
+        return yf.Ticker(ticker).history(start=start)
+
+    @instrumented
+    def get_quotes(self, tickers):
+        import yfinance as yf
+
+        tickers = sorted(set(tickers))
+        if not tickers:
+            return {}
+
+        # One request for every ticker
+        df = yf.download(
+            tickers, period="1d", interval="1m", group_by="ticker", progress=False
+        )
+        quotes = {}
+        for ticker in tickers:
+            closes = (df[ticker] if len(tickers) > 1 else df)["Close"].dropna()
+            if not closes.empty:
+                quotes[ticker] = float(closes.iloc[-1])
+        return quotes
+
+
+class OfflineProvider(MarketDataProvider):
+    FIRST_DATE = date(2000, 1, 3)
+
+    @instrumented
+    def get_history(self, ticker, start=None):
+        import numpy as np
+        import pandas as pd
+
+        # A random walk seeded by the ticker, so every process sees the same prices
+        rng = np.random.default_rng(zlib.crc32(ticker.encode()))
+        index = pd.bdate_range(self.FIRST_DATE, timezone.now().date(), name="Date")
+        closes = 20 + 80 * rng.random() * np.cumprod(
+            1 + rng.normal(0, 0.01, len(index))
+        )
+        df = pd.DataFrame(
+            {
+                "Open": closes * (1 + rng.normal(0, 0.002, len(index))),
+                "High": closes * 1.01,
+                "Low": closes * 0.99,
+                "Close": closes,
+                "Volume": rng.integers(10 ** 5, 10 ** 7, len(index)),
+                "Dividends": 0.0,
+                "Stock Splits": 0,
+            },
+            index=index,
+        )
+        if start is not None:
+            df = df[df.index >= pd.Timestamp(start)]
+        return df
+
+    @instrumented
+    def get_quotes(self, tickers):
+        from portfoliohut.models import HistoricalEquity
+
+        latest_date = (
+            HistoricalEquity.objects.filter(ticker=OuterRef("ticker"))
+            .order_by("-date")
+            .values("date")[:1]
+        )
+        return {
+            ticker: float(close)
+            for ticker, close in HistoricalEquity.objects.filter(
+                ticker__in=list(tickers), date=Subquery(latest_date)
+            ).values_list("ticker", "close")
+        }
+
+
+@lru_cache(maxsize=None)
+def get_provider() -> MarketDataProvider:
+    """The provider configured by `PORTFOLIOHUT_MARKET_DATA_PROVIDER`."""
+    return import_string(settings.PORTFOLIOHUT_MARKET_DATA_PROVIDER)()
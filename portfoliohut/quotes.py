@@ -0,0 +1,118 @@
+"""One live quote poller per process.
+
+Each `PortfolioValuationConsumer` (one per open WebSocket) subscribes with the tickers its user
+holds. The poller asks the market data provider for the union of those tickers once every
+`PORTFOLIOHUT_QUOTE_POLL_INTERVAL` seconds and broadcasts the quotes to the `QUOTES_GROUP`
+group, so the number of upstream requests depends on the number of distinct tickers, not on the
+number of connected users. The consumers value their user's holdings from the broadcast.
+
+The holdings can change in any process (a web request, `run_worker`) while a WebSocket is open, so
+the poller also looks up when the watched profiles' `PortfolioItem`s were last rebuilt (one query
+per poll) and tells the consumers of the changed ones to reload their holdings.
+
+"""
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db.models import Max
+
+from portfoliohut.models import PortfolioItem
+from portfoliohut.providers import get_provider
+
+logger = logging.getLogger(__name__)
+
+QUOTES_GROUP = "quotes"
+
+
+def portfolio_versions(profile_ids: Iterable[int]) -> Dict[int, datetime]:
+    """When the `PortfolioItem`s of each profile were last rebuilt (they are never updated)."""
+    return dict(
+        PortfolioItem.objects.filter(profile_id__in=list(profile_ids))
+        .values("profile_id")
+        .order_by("profile_id")
+        .annotate(version=Max("created"))
+        .values_list("profile_id", "version")
+    )
+
+
+class QuotePoller:
+    def __init__(self):
+        # The tickers of each subscribed channel
+        self.subscriptions: Dict[str, Set[str]] = {}
+        # The latest quote of every ticker that was polled
+        self.quotes: Dict[str, float] = {}
+        # The profile and the version of its holdings that each watching channel has loaded
+        self.portfolios: Dict[str, Tuple[int, Optional[datetime]]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def tickers(self) -> Set[str]:
+        return set().union(*self.subscriptions.values())
+
+    async def subscribe(self, channel_name: str, tickers: Iterable[str]):
+        """Start polling `tickers` (and start the poller if it isn't running)."""
+        self.subscriptions[channel_name] = set(tickers)
+        missing = self.subscriptions[channel_name] - set(self.quotes)
+        if missing:
+            # New tickers are quoted right away instead of on the next poll
+            await self.poll(missing)
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    def watch(self, channel_name: str, profile_id: int, version: Optional[datetime]):
+        """Send `portfolio.changed` to a channel once the profile's holdings are rebuilt."""
+        self.portfolios[channel_name] = (profile_id, version)
+
+    def unsubscribe(self, channel_name: str):
+        """Stop polling the tickers of a channel (and stop the poller once nobody listens)."""
+        self.subscriptions.pop(channel_name, None)
+        self.portfolios.pop(channel_name, None)
+        if not self.subscriptions and self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def poll(self, tickers: Optional[Iterable[str]] = None):
+        """Fetch quotes for `tickers` (default every subscribed ticker) and broadcast them."""
+        tickers = sorted(self.tickers() if tickers is None else tickers)
+        if not tickers:
+            return
+
+        # The offline provider reads the database, so run it like any other ORM call
+        quotes = await database_sync_to_async(get_provider().get_quotes)(tickers)
+        self.quotes.update(quotes)
+        await get_channel_layer().group_send(
+            QUOTES_GROUP, {"type": "quotes.update", "quotes": quotes}
+        )
+
+    async def check_portfolios(self):
+        """Notify the channels whose profile's holdings changed since they loaded them."""
+        if not self.portfolios:
+            return
+
+        versions = await database_sync_to_async(portfolio_versions)(
+            {profile_id for profile_id, _ in self.portfolios.values()}
+        )
+        channel_layer = get_channel_layer()
+        for channel_name, (profile_id, version) in list(self.portfolios.items()):
+            latest = versions.get(profile_id)
+            if latest != version:
+                # Only notify once, the consumer watches again with the version it reloads
+                self.portfolios[channel_name] = (profile_id, latest)
+                await channel_layer.send(channel_name, {"type": "portfolio.changed"})
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(settings.PORTFOLIOHUT_QUOTE_POLL_INTERVAL)
+            try:
+                await self.check_portfolios()
+                await self.poll()
+            except Exception:  # noqa: B902
+                # Keep polling, the provider is probably only briefly unavailable
+                logger.exception("Failed to poll quotes")
+
+
+poller = QuotePoller()
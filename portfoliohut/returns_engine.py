@@ -0,0 +1,641 @@
+"""Time weighted returns of portfolios, computed with NumPy only.
+
+The engine knows nothing about Django: it takes the transactions of one or more profiles as a
+`Ledger` of plain arrays and the close prices as a days x tickers matrix, and returns the daily
+returns and holdings of every profile. Loading those arrays from the database and storing the
+results is left to the callers (`batch_returns` and `TransactionManager._recompute_returns`), so
+the engine can be benchmarked on its own (`python manage.py benchmark engine`) and run anywhere
+the arrays can be sent.
+
+Every day is an index into the price matrix, so the work is a handful of array operations
+whatever the number of profiles:
+
+* each `(profile, ticker)` pair only holds shares from the day of its first trade on, so the pairs
+  are sorted by that day and valued in blocks that span the days from the first start in the block
+  and stay in the CPU cache (each trade's running number of shares is repeated until the pair's
+  next trade), the sparse profiles x tickers x days holdings tensor is never built in full
+* the value of the blocks is summed per profile and the days before a chunk's first transaction
+  are left out altogether
+* cash balances and cash flows are scattered onto the same day axis and the time weighted returns
+  are computed for the whole profiles x days matrix
+
+The profiles x days matrices grow with the number of profiles, callers compute them in chunks
+(`batch_returns.PROFILE_CHUNK_SIZE`).
+
+"""
+from collections import namedtuple
+
+import numpy as np
+
+# The kinds of ledger entries (`FinancialActionType.EQUITY`, `INTERNAL_CASH`, `EXTERNAL_CASH`)
+EQUITY, INTERNAL_CASH, EXTERNAL_CASH = 0, 1, 2
+
+# The transactions of some profiles as arrays, sorted by profile and id:
+# * `profile`: The profile id
+# * `kind`: `EQUITY`, `INTERNAL_CASH` or `EXTERNAL_CASH`
+# * `ticker`: The column of the ticker in the price matrix (ignored for cash)
+# * `day`: The transaction date as days since the epoch
+# * `quantity`: The number of shares (negative for sales)
+# * `value`: `price * quantity`
+Ledger = namedtuple("Ledger", ["profile", "kind", "ticker", "day", "quantity", "value"])
+
+# The results of `compute_returns`:
+# * `profile_ids`: The profiles with equity transactions (the rows of `twr` and `value`)
+# * `twr`: The profiles x days daily time weighted returns (NaN on days without a return)
+# * `value`: The profiles x days value of the holdings plus the internal cash
+# * `valid`: The profiles x days mask of the days in each profile's price index
+# * `holding_profiles`, `holding_tickers`: The row in `profile_ids` and the ticker column of each
+#   `(profile, ticker)` pair the profiles traded
+EngineResult = namedtuple(
+    "EngineResult",
+    ["profile_ids", "twr", "value", "valid", "holding_profiles", "holding_tickers"],
+)
+
+
+# The state of each profile at the end of its last day with a return, enough to compute the
+# returns of the following days without going back to its first transaction:
+# * `profile_ids`: The profiles
+# * `day`: The last day in each profile's price index (days since the epoch)
+# * `value`: The portfolio value on `day` that the next day's return starts from
+# * `cash_flows`: The external cash flows counted up to (and including) `day`
+# * `internal_cash`: The internal cash balance on `day`
+# * `growth`: The cumulative growth (`1 + cumulative return`) on `day`
+# * `holding_profiles`, `holding_tickers`: The row in `profile_ids` and the ticker column of each
+#   `(profile, ticker)` pair the profile ever traded
+# * `holdings`: The number of shares of each pair on `day`
+EodState = namedtuple(
+    "EodState",
+    [
+        "profile_ids",
+        "day",
+        "value",
+        "cash_flows",
+        "internal_cash",
+        "growth",
+        "holding_profiles",
+        "holding_tickers",
+        "holdings",
+    ],
+)
+
+
+# The most holdings cells (pairs x days) valued at once, 1 MiB of float64 fits in the CPU cache
+HOLDINGS_BLOCK_CELLS = 2 ** 17
+
+
+def empty_ledger() -> Ledger:
+    return Ledger(*[np.empty(0, dtype="int64")] * 5, np.empty(0, dtype="float64"))
+
+
+def compute_twr_matrix(
+    partial_value: np.ndarray, cash_flows: np.ndarray, valid: np.ndarray
+) -> np.ndarray:
+    """Compute time weighted daily returns for a profiles x days matrix.
+
+    Each profile only "sees" its own valid days (the days on which one of its tickers has a price).
+    Shifts therefore go back to the previous valid day of the same profile.
+
+    Args:
+        partial_value: Holdings value plus internal cash on each day
+        cash_flows: External cash flows on each day (already zero on invalid days)
+        valid: Whether a day is part of a profile's price index
+
+    Returns:
+        np.ndarray: The daily returns with NaN on days without a return
+
+    """
+    # The valid days of every profile one after the other
+    rows = np.nonzero(valid)[0]
+    first_day = np.diff(rows, prepend=-1) != 0
+
+    def previous(values):
+        # The value on the previous valid day of the same profile (NaN on its first)
+        shifted = np.empty_like(values)
+        shifted[1:] = values[:-1]
+        shifted[first_day] = np.nan
+        return shifted
+
+    # Cash deposited up to (and including) the previous valid day is part of today's value
+    portfolio_value = partial_value[valid] + previous(
+        np.cumsum(cash_flows, axis=1)[valid]
+    )
+    begin_value = previous(portfolio_value) + cash_flows[valid]
+    twr = np.full(valid.shape, np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        twr[valid] = (portfolio_value - begin_value) / begin_value
+    twr[~np.isfinite(twr)] = np.nan
+    return twr
+
+
+def _add_rows(matrix: np.ndarray, rows: np.ndarray, values: np.ndarray):
+    """`np.add.at(matrix, rows, values)`, adding the rows of `values` in the same order."""
+    order = np.argsort(rows, kind="stable")
+    sorted_rows = rows[order]
+    group_start = np.flatnonzero(np.r_[True, sorted_rows[1:] != sorted_rows[:-1]])
+    # Every round adds the next row of each group, the rows of a round are all different
+    rank = np.empty(len(rows), dtype="int64")
+    rank[order] = np.arange(len(rows)) - np.repeat(
+        group_start, np.diff(np.r_[group_start, len(rows)])
+    )
+    for i in range(rank.max(initial=-1) + 1):
+        selected = np.flatnonzero(rank == i)
+        matrix[rows[selected]] += values[selected]
+
+
+def _holdings_value(
+    pair_row: np.ndarray,
+    pair_ticker: np.ndarray,
+    pair_of_trade: np.ndarray,
+    trade_idx: np.ndarray,
+    quantity: np.ndarray,
+    prices: np.ndarray,
+    n_rows: int,
+) -> np.ndarray:
+    """Sum the value of the holdings of every `(profile, ticker)` pair per profile and day.
+
+    A pair holds no shares before its first trade, so the pairs are sorted by the day of their
+    first trade and valued `HOLDINGS_BLOCK_CELLS` at a time from the first of those days in the
+    block on. The holdings of a pair only change on the days it trades, a block is built by
+    repeating each number of shares until the next trade. The pairs of a profile are always added
+    up in the same order (by first trade, then ticker), so its value does not depend on the other
+    profiles computed with it.
+
+    Args:
+        pair_row: The profile row of each pair
+        pair_ticker: The ticker column of each pair
+        pair_of_trade: The pair of each trade
+        trade_idx: The index of each trade's day in `prices` (n_days if it is after the last)
+        quantity: The number of shares of each trade
+        prices: The tickers x days close prices (0 for missing prices)
+        n_rows: The number of profiles
+
+    Returns:
+        np.ndarray: The profiles x days value of the holdings
+
+    """
+    n_days = prices.shape[1]
+    value = np.zeros((n_rows, n_days))
+    pair_start = np.full(len(pair_row), n_days)
+    np.minimum.at(pair_start, pair_of_trade, trade_idx)
+
+    order = np.argsort(pair_start, kind="stable")
+    position = np.empty_like(order)
+    position[order] = np.arange(len(order))
+    # The trades sorted by the position of their pair and their day
+    trade_position = position[pair_of_trade]
+    by_position = np.lexsort((trade_idx, trade_position))
+    trade_position = trade_position[by_position]
+    trade_idx = trade_idx[by_position]
+    shares = np.cumsum(quantity[by_position])
+    first_trade = np.r_[True, trade_position[1:] != trade_position[:-1]]
+    # The shares held after each trade, and until the next trade of the pair (or the last day)
+    shares -= np.repeat(
+        (shares - quantity[by_position])[first_trade],
+        np.diff(np.r_[np.flatnonzero(first_trade), len(shares)]),
+    )
+    held_until = np.r_[trade_idx[1:], n_days]
+    held_until[np.r_[first_trade[1:], True]] = n_days
+
+    i = 0
+    # Pairs whose first trade is after the last day hold nothing yet
+    while i < len(order) and pair_start[order[i]] < n_days:
+        start = pair_start[order[i]]
+        width = n_days - start
+        end = min(i + max(HOLDINGS_BLOCK_CELLS // width, 1), len(order))
+        pairs = order[i:end]
+        lo, hi = np.searchsorted(trade_position, [i, end])
+
+        # Each pair of the block holds nothing until its first trade, then `shares` of each trade
+        starts_at = np.flatnonzero(first_trade[lo:hi])
+        counts = np.insert(
+            held_until[lo:hi] - trade_idx[lo:hi],
+            starts_at,
+            trade_idx[lo:hi][starts_at] - start,
+        )
+        holdings = np.repeat(
+            np.insert(shares[lo:hi].astype("float64"), starts_at, 0), counts
+        ).reshape(len(pairs), width)
+        holdings *= prices[pair_ticker[pairs], start:]
+        _add_rows(value[:, start:], pair_row[pairs], holdings)
+        i = end
+    return value
+
+
+def compute_returns(
+    ledger: Ledger, closes: np.ndarray, day_numbers: np.ndarray
+) -> EngineResult:
+    """Compute the daily returns of every profile in `ledger`.
+
+    A profile's days start on the date of its first transaction and only include the days on which
+    one of its tickers has a price. Trades on a day without prices count from the next day with
+    prices onwards and external cash flows on such a day are ignored. Profiles without equity
+    transactions have no returns and are left out.
+
+    Args:
+        ledger: The transactions of the profiles
+        closes: The days x tickers close price matrix (NaN for missing prices)
+        day_numbers: The days of `closes` as days since the epoch (sorted)
+
+    """
+    n_days, n_tickers = closes.shape
+
+    is_equity = ledger.kind == EQUITY
+    profile_ids = np.unique(ledger.profile[is_equity])
+    if not len(profile_ids):
+        empty = np.empty((0, n_days))
+        no_pairs = np.empty(0, dtype="int64")
+        return EngineResult(
+            profile_ids, empty, empty, empty.astype(bool), no_pairs, no_pairs
+        )
+    in_chunk = np.isin(ledger.profile, profile_ids)
+    row_of = np.searchsorted(profile_ids, ledger.profile)
+
+    # A profile's price index starts on the date of its first (lowest id) transaction
+    first = np.unique(ledger.profile, return_index=True)[1]
+    start_day = ledger.day[first][np.isin(ledger.profile[first], profile_ids)]
+
+    # Nothing is held and no day is valid before the first transaction of the chunk
+    skipped = np.searchsorted(day_numbers, ledger.day[in_chunk].min())
+    closes = closes[skipped:]
+    day_numbers = day_numbers[skipped:]
+    n_days = len(day_numbers)
+    has_price = ~np.isnan(closes)
+    # The index of each transaction's day in the price matrix (n_days if it is after the last)
+    day_idx = np.searchsorted(day_numbers, ledger.day)
+
+    # One pair per (profile, ticker), sorted by profile
+    pair_key = row_of[is_equity] * n_tickers + ledger.ticker[is_equity]
+    pairs, pair_of_trade = np.unique(pair_key, return_inverse=True)
+    pair_row, pair_ticker = np.divmod(pairs, n_tickers)
+    holdings_value = _holdings_value(
+        pair_row,
+        pair_ticker,
+        pair_of_trade,
+        day_idx[is_equity],
+        ledger.quantity[is_equity],
+        np.where(has_price, closes, 0).T,
+        len(profile_ids),
+    )
+
+    # A day is in a profile's price index if any of its tickers has a price on it
+    tickers, ticker_col = np.unique(pair_ticker, return_inverse=True)
+    traded = np.zeros((len(profile_ids), len(tickers)))
+    traded[pair_row, ticker_col] = 1
+    valid = traded @ has_price[:, tickers].T > 0
+    valid &= day_numbers[None, :] >= start_day[:, None]
+
+    def scatter(mask):
+        matrix = np.zeros((len(profile_ids), n_days + 1))
+        np.add.at(matrix, (row_of[mask], day_idx[mask]), ledger.value[mask])
+        return matrix[:, :n_days]
+
+    internal_cash = np.cumsum(
+        scatter(in_chunk & (ledger.kind == INTERNAL_CASH)), axis=1
+    )
+    # External cash flows only count if they happen on a day with prices
+    on_price_day = day_idx < n_days
+    on_price_day[on_price_day] = (
+        day_numbers[day_idx[on_price_day]] == ledger.day[on_price_day]
+    )
+    external = in_chunk & (ledger.kind == EXTERNAL_CASH) & on_price_day
+    cash_flows = np.where(valid, scatter(external), 0)
+
+    value = holdings_value + internal_cash
+    twr = compute_twr_matrix(value, cash_flows, valid)
+
+    def pad(matrix, fill):
+        # Back to the days of `closes`
+        if not skipped:
+            return matrix
+        return np.concatenate(
+            [np.full((len(profile_ids), skipped), fill, dtype=matrix.dtype), matrix],
+            axis=1,
+        )
+
+    return EngineResult(
+        profile_ids=profile_ids,
+        twr=pad(twr, np.nan),
+        value=pad(value, 0),
+        valid=pad(valid, False),
+        holding_profiles=pair_row,
+        holding_tickers=pair_ticker,
+    )
+
+
+# `solve_xirr` looks for `ln(1 + xirr)` in this range (an XIRR from -99.995% to about 2.2e6 %)
+XIRR_LOG_BOUNDS = (-10.0, 10.0)
+XIRR_TOLERANCE = 1e-10
+XIRR_MAX_ITERATIONS = 100
+
+
+def solve_xirr(
+    groups: np.ndarray, days: np.ndarray, amounts: np.ndarray, n_groups: int
+) -> np.ndarray:
+    """Solve the XIRR of many series of cash flows at once.
+
+    The XIRR of a series is the annual rate `r` at which its net present value
+    `sum(amount * (1 + r) ** (-(day - first day) / 365))` is zero. Every series is solved at the
+    same time with Newton's method on `x = ln(1 + r)`, falling back to bisection whenever a step
+    leaves the bracket known to hold the root. An iteration is a couple of `np.bincount` over all
+    of the cash flows, however many series there are.
+
+    Args:
+        groups: The series (0 to `n_groups - 1`) of each cash flow
+        days: The day of each cash flow as days since the epoch
+        amounts: The cash flows (negative for money paid in, positive for money paid out)
+        n_groups: The number of series
+
+    Returns:
+        np.ndarray: The XIRR of each series (NaN when there is none, e.g. all flows have one sign)
+
+    """
+    first_day = np.full(n_groups, np.inf)
+    np.minimum.at(first_day, groups, days)
+    years = (days - first_day[groups]) / 365
+    # Stop once the NPV is this close to zero
+    tolerance = XIRR_TOLERANCE * np.maximum(
+        np.bincount(groups, np.abs(amounts), minlength=n_groups), 1
+    )
+
+    def npv(x):
+        discounted = amounts * np.exp(-x[groups] * years)
+        return (
+            np.bincount(groups, discounted, minlength=n_groups),
+            np.bincount(groups, -years * discounted, minlength=n_groups),
+        )
+
+    lo = np.full(n_groups, XIRR_LOG_BOUNDS[0])
+    hi = np.full(n_groups, XIRR_LOG_BOUNDS[1])
+    with np.errstate(over="ignore", invalid="ignore", divide="ignore"):
+        f_lo, _ = npv(lo)
+        has_root = np.sign(f_lo) != np.sign(npv(hi)[0])
+
+        x = np.zeros(n_groups)
+        for _ in range(XIRR_MAX_ITERATIONS):
+            f, df = npv(x)
+            done = ~has_root | (np.abs(f) <= tolerance) | (hi - lo <= XIRR_TOLERANCE)
+            if done.all():
+                break
+            # Keep the root between `lo` and `hi`
+            below = np.sign(f) == np.sign(f_lo)
+            lo = np.where(below, x, lo)
+            f_lo = np.where(below, f, f_lo)
+            hi = np.where(below, hi, x)
+
+            step = x - f / df
+            inside = np.isfinite(step) & (step > lo) & (step < hi)
+            x = np.where(done, x, np.where(inside, step, (lo + hi) / 2))
+
+    return np.where(has_root, np.expm1(x), np.nan)
+
+
+def compute_xirr(
+    ledger: Ledger, result: EngineResult, day_numbers: np.ndarray
+) -> np.ndarray:
+    """Compute the money weighted return (XIRR) of every profile in `result`.
+
+    The cash flows of a profile are its deposits and withdrawals (`EXTERNAL_CASH`) up to its last
+    day with prices, and the value of the portfolio on that day (holdings and cash) as if it was
+    all withdrawn.
+
+    Args:
+        ledger: The transactions passed to `compute_returns`
+        result: The results of `compute_returns`
+        day_numbers: The days of the price matrix as days since the epoch
+
+    Returns:
+        np.ndarray: The XIRR of each profile in `result.profile_ids` (NaN when it has none)
+
+    """
+    n_profiles, n_days = result.valid.shape
+    if not n_profiles or not n_days:
+        return np.full(n_profiles, np.nan)
+
+    has_days = result.valid.any(axis=1)
+    last_idx = n_days - 1 - np.argmax(result.valid[:, ::-1], axis=1)
+    last_day = day_numbers[last_idx]
+
+    row_of = np.minimum(
+        np.searchsorted(result.profile_ids, ledger.profile), n_profiles - 1
+    )
+    external = (ledger.kind == EXTERNAL_CASH) & (
+        result.profile_ids[row_of] == ledger.profile
+    )
+    external[external] = ledger.day[external] <= last_day[row_of[external]]
+    rows = row_of[external]
+    final_value = result.value[np.arange(n_profiles), last_idx] + np.bincount(
+        rows, ledger.value[external], minlength=n_profiles
+    )
+
+    xirr = solve_xirr(
+        groups=np.r_[rows, np.arange(n_profiles)],
+        days=np.r_[ledger.day[external], last_day],
+        amounts=np.r_[-ledger.value[external], final_value],
+        n_groups=n_profiles,
+    )
+    xirr[~has_days] = np.nan
+    return xirr
+
+
+def _price_day_index(ledger: Ledger, day_numbers: np.ndarray):
+    """The index of each transaction's day in the price matrix and whether it is exactly that day.
+
+    Transactions on a day without prices are indexed at the next day with prices (`len(day_numbers)`
+    if there is none).
+
+    """
+    day_idx = np.searchsorted(day_numbers, ledger.day)
+    on_price_day = day_idx < len(day_numbers)
+    on_price_day[on_price_day] = (
+        day_numbers[day_idx[on_price_day]] == ledger.day[on_price_day]
+    )
+    return day_idx, on_price_day
+
+
+def end_of_day_state(
+    ledger: Ledger, result: EngineResult, closes: np.ndarray, day_numbers: np.ndarray
+) -> EodState:
+    """Extract the state of each profile at the end of its last day with prices.
+
+    Profiles without a day in their price index are left out, they have no returns to roll forward.
+
+    Args:
+        ledger: The transactions passed to `compute_returns`
+        result: The results of `compute_returns`
+        closes: The close price matrix passed to `compute_returns`
+        day_numbers: The days of `closes` as days since the epoch
+
+    """
+    n_profiles, n_days = result.valid.shape
+    has_days = result.valid.any(axis=1)
+    if not has_days.any():
+        empty = np.empty(0)
+        no_pairs = np.empty(0, dtype="int64")
+        return EodState(
+            no_pairs, no_pairs, empty, empty, empty, empty, no_pairs, no_pairs, empty
+        )
+    rows = np.flatnonzero(has_days)
+    last_idx = n_days - 1 - np.argmax(result.valid[:, ::-1], axis=1)
+
+    # Cash flows are counted on the profile's valid days only (see `compute_returns`)
+    in_result = np.isin(ledger.profile, result.profile_ids)
+    row_of = np.searchsorted(result.profile_ids, ledger.profile)
+    day_idx, on_price_day = _price_day_index(ledger, day_numbers)
+    counted = in_result & (ledger.kind == EXTERNAL_CASH) & on_price_day
+    counted[counted] = result.valid[row_of[counted], day_idx[counted]]
+    counted[counted] = day_idx[counted] <= last_idx[row_of[counted]]
+    cash_flows = np.bincount(
+        row_of[counted], ledger.value[counted], minlength=n_profiles
+    )
+    on_last_day = counted.copy()
+    on_last_day[counted] = day_idx[counted] == last_idx[row_of[counted]]
+    last_day_flows = np.bincount(
+        row_of[on_last_day], ledger.value[on_last_day], minlength=n_profiles
+    )
+
+    internal = in_result & (ledger.kind == INTERNAL_CASH)
+    internal[internal] = day_idx[internal] <= last_idx[row_of[internal]]
+    internal_cash = np.bincount(
+        row_of[internal], ledger.value[internal], minlength=n_profiles
+    )
+
+    # The value on the last day only includes the cash flows of the days before it
+    value = result.value[np.arange(n_profiles), last_idx] + cash_flows - last_day_flows
+    growth = np.nanprod(np.abs(result.twr + 1), axis=1)
+
+    # The shares of each pair held on the last day
+    n_tickers = closes.shape[1]
+    traded = in_result & (ledger.kind == EQUITY)
+    traded[traded] = day_idx[traded] <= last_idx[row_of[traded]]
+    pair_of_trade = np.searchsorted(
+        result.holding_profiles * n_tickers + result.holding_tickers,
+        row_of[traded] * n_tickers + ledger.ticker[traded],
+    )
+    holdings = np.bincount(
+        pair_of_trade, ledger.quantity[traded], minlength=len(result.holding_profiles)
+    )
+
+    # Drop the profiles without days and renumber the pairs of the others
+    new_row = np.cumsum(has_days) - 1
+    keep_pairs = has_days[result.holding_profiles]
+    return EodState(
+        profile_ids=result.profile_ids[rows],
+        day=day_numbers[last_idx[rows]],
+        value=value[rows],
+        cash_flows=cash_flows[rows],
+        internal_cash=internal_cash[rows],
+        growth=growth[rows],
+        holding_profiles=new_row[result.holding_profiles[keep_pairs]],
+        holding_tickers=result.holding_tickers[keep_pairs],
+        holdings=holdings[keep_pairs],
+    )
+
+
+def roll_forward(
+    state: EodState, ledger: Ledger, closes: np.ndarray, day_numbers: np.ndarray
+):
+    """Compute the returns of the days after each profile's state and the state after them.
+
+    This gives the same returns as `compute_returns` over the whole history, as long as `ledger`
+    only holds transactions after each profile's `state.day` in tickers it already traded.
+
+    Args:
+        state: The state of the profiles
+        ledger: The transactions after each profile's `state.day`
+        closes: The days x tickers close price matrix of the days after the states
+        day_numbers: The days of `closes` as days since the epoch (sorted)
+
+    Returns:
+        The profiles x days daily returns (NaN on days without a return) and the new `EodState`
+
+    Raises:
+        ValueError: A transaction is in a ticker the profile did not trade before
+
+    """
+    n_days, n_tickers = closes.shape
+    n_profiles = len(state.profile_ids)
+    if not n_days:
+        return np.empty((n_profiles, 0)), state
+    rows = np.arange(n_profiles)
+    row_of = np.searchsorted(state.profile_ids, ledger.profile)
+    day_idx, on_price_day = _price_day_index(ledger, day_numbers)
+
+    pair_keys = state.holding_profiles * n_tickers + state.holding_tickers
+    is_equity = ledger.kind == EQUITY
+    trade_keys = row_of[is_equity] * n_tickers + ledger.ticker[is_equity]
+    pair_of_trade = np.minimum(
+        np.searchsorted(pair_keys, trade_keys), len(pair_keys) - 1
+    )
+    if len(trade_keys) and (pair_keys[pair_of_trade] != trade_keys).any():
+        raise ValueError("transactions in new tickers need a full recompute")
+
+    holdings = np.zeros((len(pair_keys), n_days + 1))
+    np.add.at(holdings, (pair_of_trade, day_idx[is_equity]), ledger.quantity[is_equity])
+    holdings = state.holdings[:, None] + np.cumsum(holdings[:, :n_days], axis=1)
+
+    holdings_value = np.zeros((n_profiles, n_days))
+    np.add.at(
+        holdings_value,
+        state.holding_profiles,
+        np.nan_to_num(holdings * closes.T[state.holding_tickers]),
+    )
+    priced = np.zeros((n_profiles, n_days))
+    np.add.at(
+        priced, state.holding_profiles, ~np.isnan(closes.T[state.holding_tickers])
+    )
+    valid = (priced > 0) & (day_numbers[None, :] > state.day[:, None])
+
+    def scatter(mask):
+        matrix = np.zeros((n_profiles, n_days + 1))
+        np.add.at(matrix, (row_of[mask], day_idx[mask]), ledger.value[mask])
+        return matrix[:, :n_days]
+
+    internal_cash = state.internal_cash[:, None] + np.cumsum(
+        scatter(ledger.kind == INTERNAL_CASH), axis=1
+    )
+    cash_flows = np.where(
+        valid, scatter((ledger.kind == EXTERNAL_CASH) & on_price_day), 0
+    )
+    total_flows = state.cash_flows[:, None] + np.cumsum(cash_flows, axis=1)
+    previous_flows = np.concatenate(
+        [state.cash_flows[:, None], total_flows[:, :-1]], axis=1
+    )
+    portfolio_value = holdings_value + internal_cash + previous_flows
+
+    # The state is the valid day before the first new day
+    values = np.concatenate([state.value[:, None], portfolio_value], axis=1)
+    last_valid = np.maximum.accumulate(
+        np.where(
+            np.c_[np.ones(n_profiles, dtype=bool), valid], np.arange(n_days + 1), 0
+        ),
+        axis=1,
+    )
+    begin_value = values[rows[:, None], last_valid[:, :-1]] + cash_flows
+    with np.errstate(divide="ignore", invalid="ignore"):
+        twr = (portfolio_value - begin_value) / begin_value
+    twr[~valid | ~np.isfinite(twr)] = np.nan
+
+    # Profiles without new days keep their state
+    last = last_valid[:, -1] - 1
+    moved = last >= 0
+
+    def on_last_day(matrix, old):
+        return np.where(moved, matrix[rows, np.maximum(last, 0)], old)
+
+    pair_moved = moved[state.holding_profiles]
+    pair_last = np.maximum(last, 0)[state.holding_profiles]
+    return twr, EodState(
+        profile_ids=state.profile_ids,
+        day=on_last_day(np.broadcast_to(day_numbers, (n_profiles, n_days)), state.day),
+        value=on_last_day(portfolio_value, state.value),
+        cash_flows=on_last_day(total_flows, state.cash_flows),
+        internal_cash=on_last_day(internal_cash, state.internal_cash),
+        growth=state.growth * np.nanprod(np.abs(twr + 1), axis=1),
+        holding_profiles=state.holding_profiles,
+        holding_tickers=state.holding_tickers,
+        holdings=np.where(
+            pair_moved,
+            holdings[np.arange(len(pair_keys)), pair_last],
+            state.holdings,
+        ),
+    )
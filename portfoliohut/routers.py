@@ -0,0 +1,67 @@
+"""Send the reads of read-only requests to the read replicas.
+
+Writes always go to the primary (`default`). Reads go to a replica only inside `use_replicas`,
+which `ReplicaMiddleware` enters for GET/HEAD requests, so the worker, management commands and
+anything that reads to decide what to write (e.g. a recompute) keep reading from the primary.
+Within a request the replicas are given up for the primary at the first write (and inside
+`transaction.atomic`), so a request never reads back around its own writes.
+
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class _Routing:
+    def __init__(self):
+        self.wrote = False
+
+
+_routing: ContextVar[Optional[_Routing]] = ContextVar("replica_routing", default=None)
+
+
+@contextmanager
+def use_replicas():
+    """Read from the replicas (if any) until something is written.
+
+    Yields:
+        The routing state, its `wrote` is set once anything is written
+
+    """
+    routing = _Routing()
+    token = _routing.set(routing)
+    try:
+        yield routing
+    finally:
+        _routing.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        routing = _routing.get()
+        if (
+            routing is None
+            or routing.wrote
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return DEFAULT_DB_ALIAS
+        replicas = settings.PORTFOLIOHUT_DATABASE_REPLICAS
+        return random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        routing = _routing.get()
+        if routing is not None:
+            routing.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get the schema from the primary
+        return db == DEFAULT_DB_ALIAS
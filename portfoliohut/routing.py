@@ -0,0 +1,12 @@
+"""WebSocket URLs"""
+from django.urls import path
+
+from portfoliohut.consumers import PortfolioValuationConsumer
+
+websocket_urlpatterns = [
+    path(
+        "ws/portfolio-valuation",
+        PortfolioValuationConsumer.as_asgi(),
+        name="portfolio-valuation",
+    ),
+]
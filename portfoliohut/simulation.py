@@ -0,0 +1,140 @@
+"""What-if simulations of a profile's returns, computed in memory.
+
+The profile's transactions are loaded into a `Ledger` twice: once as they are and once with some
+of them left out and hypothetical ones added. `returns_engine.compute_returns` computes both from
+the cached prices in a single pass (they are two "profiles" of the same ledger), so the simulated
+returns are directly comparable to the actual ones. Nothing is written to the database.
+
+"""
+from collections import namedtuple
+from datetime import timedelta
+from typing import Dict, Iterable, List
+
+import numpy as np
+from django.utils import timezone
+
+from portfoliohut import returns_engine
+from portfoliohut.batch_returns import EPOCH, ledger_rows, price_matrix, to_ledger
+from portfoliohut.forms.transactions import CashAction, StockAction
+from portfoliohut.models import FinancialActionType, Profile
+
+# The rows of the actual and the simulated portfolio in the ledger
+ACTUAL, SIMULATED = 0, 1
+
+# * `dates`: The days on which either portfolio has a return
+# * `actual`, `simulated`: The cumulative returns (in %) on those days (NaN before the first one)
+# * `actual_xirr`, `simulated_xirr`: The money weighted returns (NaN if there is none)
+Simulation = namedtuple(
+    "Simulation", ["dates", "actual", "simulated", "actual_xirr", "simulated_xirr"]
+)
+
+
+def _excluded_ids(profile: Profile, exclude_ids: Iterable[int]) -> set:
+    """The ids of the transactions left out, including the cash legs of left out trades.
+
+    Raises:
+        ValueError: An id is not one of the profile's transactions
+
+    """
+    exclude_ids = set(exclude_ids)
+    excluded = profile.transaction_set.filter(id__in=exclude_ids)
+    unknown = exclude_ids - set(excluded.values_list("id", flat=True))
+    if unknown:
+        raise ValueError(f"Unknown transactions: {sorted(unknown)}")
+
+    # The cash leg of a trade was created along with it at the same date and time
+    cash_legs = profile.transaction_set.filter(
+        type=FinancialActionType.INTERNAL_CASH,
+        date_time__in=excluded.filter(type=FinancialActionType.EQUITY).values(
+            "date_time"
+        ),
+    )
+    return exclude_ids | set(cash_legs.values_list("id", flat=True))
+
+
+def _hypothetical_rows(transactions: List[Dict]) -> list:
+    """The `ledger_rows` of hypothetical transactions (cleaned `SimulatedTransactionForm`s)."""
+    rows = []
+    for transaction in transactions:
+        day = (timezone.localtime(transaction["date_time"]).date() - EPOCH).days
+        price = float(transaction["price"])
+        if transaction["action"] in StockAction:
+            sign = 1 if transaction["action"] == StockAction.BUY else -1
+            quantity = sign * transaction["quantity"]
+            ticker = transaction["ticker"]
+            rows.append(
+                (FinancialActionType.EQUITY, ticker, day, quantity, price * quantity)
+            )
+            # Paid for with (or paid into) the cash balance like `_create_equity_transaction`
+            rows.append(
+                (FinancialActionType.INTERNAL_CASH, "-", day, -sign, -price * quantity)
+            )
+        else:
+            sign = 1 if transaction["action"] == CashAction.DEPOSIT else -1
+            rows.append(
+                (FinancialActionType.EXTERNAL_CASH, "-", day, sign, price * sign)
+            )
+    return sorted(((None, SIMULATED, *row) for row in rows), key=lambda row: row[4])
+
+
+def _cumulative(twr: np.ndarray) -> np.ndarray:
+    """Cumulative returns (in %) like `Profile.get_cumulative_returns` (NaN before the first)."""
+    growth = np.nancumprod(np.abs(twr + 1))
+    started = np.cumsum(~np.isnan(twr)) > 0
+    return np.where(started, (growth - 1) * 100, np.nan)
+
+
+def simulate_returns(
+    profile: Profile, transactions: List[Dict], exclude_ids: Iterable[int] = ()
+) -> Simulation:
+    """Compute the returns the profile would have had with different transactions.
+
+    Args:
+        profile: The profile whose transactions are simulated
+        transactions: Hypothetical transactions to add (cleaned `SimulatedTransactionForm`s)
+        exclude_ids: The ids of transactions to leave out (a trade's cash leg is left out with it)
+
+    Raises:
+        ValueError: An excluded id is not one of the profile's transactions
+
+    """
+    excluded = _excluded_ids(profile, exclude_ids)
+    actual_rows = [
+        (pk, ACTUAL, *row)
+        for pk, _, *row in ledger_rows(profile.transaction_set.all()).iterator()
+    ]
+    simulated_rows = [
+        (pk, SIMULATED, *row) for pk, _, *row in actual_rows if pk not in excluded
+    ]
+    hypothetical_rows = _hypothetical_rows(transactions)
+    # A portfolio starts on the day of its first row, which may now be a hypothetical one
+    if hypothetical_rows and (
+        not simulated_rows or hypothetical_rows[0][4] < simulated_rows[0][4]
+    ):
+        simulated_rows = hypothetical_rows + simulated_rows
+    else:
+        simulated_rows = simulated_rows + hypothetical_rows
+    rows = actual_rows + simulated_rows
+
+    tickers = sorted({row[3] for row in rows if row[2] == FinancialActionType.EQUITY})
+    start = min((row[4] for row in rows), default=None)
+    prices = price_matrix(
+        tickers, None if start is None else EPOCH + timedelta(days=start)
+    )
+    ledger = to_ledger(rows, tickers)
+    result = returns_engine.compute_returns(ledger, prices.closes, prices.day_numbers)
+    xirr = returns_engine.compute_xirr(ledger, result, prices.day_numbers)
+
+    n_days = len(prices.dates)
+    twr = np.full((2, n_days), np.nan)
+    xirrs = np.full(2, np.nan)
+    twr[result.profile_ids] = result.twr
+    xirrs[result.profile_ids] = xirr
+    has_return = ~np.isnan(twr).all(axis=0)
+    return Simulation(
+        dates=prices.dates[has_return],
+        actual=_cumulative(twr[ACTUAL])[has_return],
+        simulated=_cumulative(twr[SIMULATED])[has_return],
+        actual_xirr=xirrs[ACTUAL],
+        simulated_xirr=xirrs[SIMULATED],
+    )
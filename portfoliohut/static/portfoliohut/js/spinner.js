@@ -28,7 +28,10 @@ function displayPortfolioGraph(querystring, url) {
     xhr.onreadystatechange = function() {
         if (xhr.readyState == XMLHttpRequest.DONE ) {
             if (xhr.status == 200) {
-                Plotly.newPlot("returns-graph-id", JSON.parse(xhr.responseText));
+                var graph = document.getElementById("returns-graph-id");
+                Plotly.react(graph, JSON.parse(xhr.responseText)).then(function () {
+                    watchGraphRange(graph, url);
+                });
             }
             removeSpinner()
         }
@@ -36,3 +39,33 @@ function displayPortfolioGraph(querystring, url) {
     xhr.open('GET', url + querystring, true);
     xhr.send();
 }
+
+// Reload the graph for the selected date range so that the server picks the resolution (e.g.
+// monthly points for "all" and daily points for "1m")
+function watchGraphRange(graph, url) {
+    if (graph.dataset.watchingRange) {
+        return;
+    }
+    graph.dataset.watchingRange = "true";
+
+    var timeout = null;
+    graph.on("plotly_relayout", function (event) {
+        var querystring = null;
+        if (event["xaxis.autorange"]) {
+            querystring = "";
+        } else {
+            var range = event["xaxis.range"] || [event["xaxis.range[0]"], event["xaxis.range[1]"]];
+            if (range[0] && range[1]) {
+                querystring = "?start=" + String(range[0]).slice(0, 10) +
+                    "&end=" + String(range[1]).slice(0, 10);
+            }
+        }
+        if (querystring === null) {
+            return;
+        }
+        clearTimeout(timeout);
+        timeout = setTimeout(function () {
+            displayPortfolioGraph(querystring, url);
+        }, 300);
+    });
+}
@@ -0,0 +1,49 @@
+// Infinite scrolling of the transaction history. Once the "Next" link scrolls into view the next
+// page is fetched from `url` and its rows are appended to the table. Without JavaScript the
+// "Previous"/"Next" links load the pages one at a time instead.
+function watchTransactionHistory(url) {
+    var observer = new IntersectionObserver(function (entries) {
+        entries.forEach(function (entry) {
+            if (entry.isIntersecting) {
+                observer.unobserve(entry.target);
+                loadNextTransactions(url, entry.target.dataset.after, observer);
+            }
+        });
+    });
+    var next = document.getElementById("transaction-history-next");
+    if (next) {
+        observer.observe(next);
+    }
+}
+
+function loadNextTransactions(url, after, observer) {
+    var xhr = new XMLHttpRequest();
+    xhr.onreadystatechange = function () {
+        if (xhr.readyState == XMLHttpRequest.DONE && xhr.status == 200) {
+            var page = document.createElement("div");
+            page.innerHTML = xhr.responseText;
+
+            var history = document.getElementById("transaction-history");
+            var rows = history.querySelector("tbody");
+            page.querySelectorAll("tbody tr").forEach(function (row) {
+                rows.appendChild(row);
+            });
+
+            // Every earlier page is already on screen, so only "Next" is kept
+            var pages = page.querySelector("#transaction-history-pages");
+            pages.querySelectorAll(".page-item").forEach(function (item) {
+                if (!item.querySelector("#transaction-history-next")) {
+                    item.remove();
+                }
+            });
+            history.querySelector("#transaction-history-pages").replaceWith(pages);
+
+            var next = document.getElementById("transaction-history-next");
+            if (next) {
+                observer.observe(next);
+            }
+        }
+    };
+    xhr.open("GET", url + "?after=" + encodeURIComponent(after), true);
+    xhr.send();
+}
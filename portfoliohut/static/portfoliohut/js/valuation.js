@@ -0,0 +1,27 @@
+// Live market value of the current portfolio, pushed by `PortfolioValuationConsumer`
+function displayLiveValuation(path) {
+    var scheme = window.location.protocol === "https:" ? "wss://" : "ws://";
+    var socket = new WebSocket(scheme + window.location.host + "/" + path);
+    var format = function (value) {
+        return value === null ? "-" : value.toLocaleString(undefined, {style: "currency", currency: "USD"});
+    };
+
+    socket.onmessage = function (event) {
+        var valuation = JSON.parse(event.data);
+        var rows = valuation.positions.map(function (position) {
+            return "<tr><td>" + position.ticker + "</td><td>" + position.quantity + "</td><td>" +
+                format(position.price) + "</td><td>" + format(position.value) + "</td></tr>";
+        });
+        document.getElementById("live-valuation-rows").innerHTML = rows.join("");
+        document.getElementById("live-valuation-total").textContent = format(valuation.total);
+        document.getElementById("live-valuation-cash").textContent = format(valuation.cash);
+        document.getElementById("live-valuation-as-of").textContent = new Date(valuation.as_of).toLocaleTimeString();
+        document.getElementById("live-valuation").classList.remove("d-none");
+    };
+    // Reconnect after a deploy or a dropped connection
+    socket.onclose = function () {
+        setTimeout(function () {
+            displayLiveValuation(path);
+        }, 5000);
+    };
+}
@@ -29,14 +29,17 @@ class ReturnsTable(tables.Table):
 
     class Meta:
         model = Profile
-        exclude = ("id", "bio", "profile_type")
-        sequence = ("rank", "user", "returns")
+        fields = ("user", "xirr")
+        sequence = ("rank", "user", "returns", "xirr")
         row_attrs = {"data-username": lambda record: record.user.username}
         orderable = False
 
     def render_returns(self, value):
         return f"{value:0.2f}%"
 
+    def render_xirr(self, value):
+        return f"{value * 100:0.2f}%"
+
     # Add clickable link to user's profile page
     # https://stackoverflow.com/questions/22941424/django-tables2-create-extra-column-with-links
     def render_user(self, record):
@@ -0,0 +1,122 @@
+from channels.db import database_sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import AnonymousUser
+from django.test import TransactionTestCase, override_settings
+
+from portfoliohut.consumers import PortfolioValuationConsumer
+from portfoliohut.models import FinancialActionType, HistoricalEquity, PortfolioItem
+from portfoliohut.quotes import poller
+from portfoliohut.tests.utils import ProviderMixin, create_profile
+
+
+def add_items(profile, cash, **equities):
+    PortfolioItem.objects.create(
+        profile=profile,
+        type=FinancialActionType.EXTERNAL_CASH,
+        ticker="-",
+        quantity=1,
+        price=cash,
+    )
+    for ticker, quantity in equities.items():
+        PortfolioItem.objects.create(
+            profile=profile,
+            type=FinancialActionType.EQUITY,
+            ticker=ticker,
+            quantity=quantity,
+            price=10,
+        )
+
+
+# The consumer reads the database from another thread, so the data has to be committed
+@override_settings(
+    CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+)
+class PortfolioValuationConsumerTests(ProviderMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.profile = create_profile()
+        for ticker in ["AAA", "BBB"]:
+            HistoricalEquity.objects.get_ticker(ticker)
+        self.closes = {
+            ticker: float(
+                HistoricalEquity.objects.filter(ticker=ticker).latest("date").close
+            )
+            for ticker in ["AAA", "BBB"]
+        }
+        # A test that failed before disconnecting leaves its channel subscribed
+        for channel_name in list(poller.subscriptions):
+            poller.unsubscribe(channel_name)
+        poller.quotes.clear()
+
+    async def connect(self, user):
+        communicator = WebsocketCommunicator(
+            PortfolioValuationConsumer.as_asgi(), "/ws/portfolio-valuation"
+        )
+        communicator.scope["user"] = user
+        connected, _ = await communicator.connect()
+        return communicator, connected
+
+    async def receive_valuation(self, communicator):
+        # New tickers are also broadcast to the group right away, which repeats the valuation
+        valuation = await communicator.receive_json_from()
+        while not await communicator.receive_nothing():
+            valuation = await communicator.receive_json_from()
+        return valuation
+
+    async def test_rejects_anonymous_users(self):
+        communicator, connected = await self.connect(AnonymousUser())
+        self.assertFalse(connected)
+
+    async def test_values_the_holdings_at_the_latest_quotes(self):
+        await self.sync(add_items)(self.profile, 100, AAA=2)
+        communicator, connected = await self.connect(self.profile.user)
+        self.assertTrue(connected)
+
+        valuation = await self.receive_valuation(communicator)
+        self.assertEqual(valuation["cash"], 100)
+        self.assertEqual(
+            valuation["positions"],
+            [
+                {
+                    "ticker": "AAA",
+                    "quantity": 2,
+                    "cost": 10,
+                    "price": self.closes["AAA"],
+                    "value": 2 * self.closes["AAA"],
+                }
+            ],
+        )
+        self.assertEqual(valuation["total"], 100 + 2 * self.closes["AAA"])
+
+        await communicator.disconnect()
+        self.assertEqual(poller.subscriptions, {})
+        self.assertEqual(poller.portfolios, {})
+
+    async def test_reloads_the_holdings_once_they_are_rebuilt(self):
+        await self.sync(add_items)(self.profile, 100, AAA=2)
+        communicator, _ = await self.connect(self.profile.user)
+        await self.receive_valuation(communicator)
+
+        # Nothing changed
+        await poller.check_portfolios()
+        self.assertTrue(await communicator.receive_nothing())
+
+        # What `_reset_portfolio_cache` does after a trade (in any process)
+        def trade():
+            PortfolioItem.objects.filter(profile=self.profile).delete()
+            add_items(self.profile, 50, AAA=2, BBB=5)
+
+        await self.sync(trade)()
+        await poller.check_portfolios()
+
+        valuation = await self.receive_valuation(communicator)
+        self.assertEqual([p["ticker"] for p in valuation["positions"]], ["AAA", "BBB"])
+        self.assertEqual(valuation["positions"][1]["price"], self.closes["BBB"])
+        self.assertEqual(valuation["cash"], 50)
+        self.assertEqual(set(poller.tickers()), {"AAA", "BBB"})
+
+        await communicator.disconnect()
+
+    @staticmethod
+    def sync(func):
+        return database_sync_to_async(func)
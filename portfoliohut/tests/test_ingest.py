@@ -0,0 +1,82 @@
+import re
+import unittest
+from unittest import mock
+
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase
+
+from portfoliohut.ingest import _copy_rows, _fixed_point, _price_frame, ingest_prices
+from portfoliohut.models import HistoricalEquity
+from portfoliohut.providers import OfflineProvider
+
+
+def history(ticker, start="2021-01-04"):
+    return OfflineProvider().get_history(ticker, start=start)
+
+
+class RecordingCursor:
+    """Records the SQL of `_copy_rows` (a Postgres cursor that writes nothing)."""
+
+    rowcount = 0
+
+    def __init__(self, statements):
+        self.statements = statements
+
+    def execute(self, sql, params=None):
+        self.statements.append(sql)
+
+    def copy_expert(self, sql, file):
+        self.statements.append(sql)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class CopyRowsTests(unittest.TestCase):
+    def test_every_ingest_uses_and_drops_a_table_of_its_own(self):
+        statements = []
+        postgres = mock.Mock(ops=connection.ops)
+        postgres.cursor.side_effect = lambda: RecordingCursor(statements)
+
+        for ticker in ["AAA", "BBB"]:
+            _copy_rows(postgres, _fixed_point(_price_frame(ticker, history(ticker))))
+
+        created = [
+            re.search(r"CREATE TEMPORARY TABLE (\S+)", sql).group(1)
+            for sql in statements
+            if sql.startswith("CREATE")
+        ]
+        dropped = [sql.split()[-1] for sql in statements if sql.startswith("DROP")]
+        self.assertEqual(len(set(created)), 2)
+        self.assertEqual(dropped, created)
+
+
+class IngestPricesTests(TestCase):
+    def test_two_tickers_in_one_transaction(self):
+        with transaction.atomic():
+            for ticker in ["AAA", "BBB"]:
+                self.assertEqual(
+                    ingest_prices(ticker, history(ticker)), len(history(ticker))
+                )
+        self.assertEqual(
+            set(HistoricalEquity.objects.values_list("ticker", flat=True)),
+            {"AAA", "BBB"},
+        )
+
+
+@unittest.skipUnless(connection.vendor == "postgresql", "COPY needs Postgres")
+class CopyIngestTests(TransactionTestCase):
+    def test_two_tickers_in_one_transaction(self):
+        # Like a CSV upload that downloads every new ticker in one transaction
+        with transaction.atomic():
+            for ticker in ["AAA", "BBB"]:
+                ingest_prices(ticker, history(ticker), method="copy")
+                ingest_prices(ticker, history(ticker), method="copy")
+        for ticker in ["AAA", "BBB"]:
+            self.assertEqual(
+                HistoricalEquity.objects.filter(ticker=ticker).count(),
+                len(history(ticker)),
+            )
@@ -0,0 +1,115 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from portfoliohut.jobs import TASKS
+from portfoliohut.models import Job, JobStatus
+
+calls = []
+
+
+def record(**kwargs):
+    calls.append(kwargs)
+
+
+def fail(**kwargs):
+    raise ValueError("upstream is down")
+
+
+@override_settings(
+    PORTFOLIOHUT_JOBS_EAGER=False,
+    PORTFOLIOHUT_JOB_BACKOFF=10,
+    PORTFOLIOHUT_JOB_MAX_ATTEMPTS=3,
+)
+class JobQueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+        tasks = mock.patch.dict(TASKS, {"record": record, "fail": fail})
+        tasks.start()
+        self.addCleanup(tasks.stop)
+
+    def test_enqueue_with_a_dedup_key_collapses_into_the_queued_job(self):
+        first = Job.objects.enqueue("record", {"n": 1}, dedup_key="key")
+        later = timezone.now() + timedelta(minutes=5)
+        second = Job.objects.enqueue(
+            "record", {"n": 1}, dedup_key="key", run_at=later, priority=3
+        )
+
+        self.assertEqual(first.pk, second.pk)
+        job = Job.objects.get()
+        self.assertEqual(job.run_at, later)
+        self.assertEqual(job.priority, 3)
+
+    def test_a_running_job_does_not_absorb_new_jobs(self):
+        Job.objects.enqueue("record", dedup_key="key")
+        Job.objects.claim("worker")
+        Job.objects.enqueue("record", dedup_key="key")
+        self.assertEqual(Job.objects.count(), 2)
+
+    def test_claim_takes_the_highest_priority_due_job(self):
+        Job.objects.enqueue("record", {"n": "low"})
+        Job.objects.enqueue("record", {"n": "high"}, priority=5)
+        Job.objects.enqueue("record", {"n": "later"}, priority=9, delay=60)
+
+        job = Job.objects.claim("worker")
+        self.assertEqual(job.payload, {"n": "high"})
+        self.assertEqual(job.status, JobStatus.RUNNING)
+        self.assertEqual(job.attempts, 1)
+        self.assertEqual(job.locked_by, "worker")
+
+        self.assertEqual(Job.objects.claim("other").payload, {"n": "low"})
+        self.assertIsNone(Job.objects.claim("other"))
+
+    def test_a_job_whose_lease_expired_is_claimed_again(self):
+        Job.objects.enqueue("record")
+        Job.objects.claim("dead")
+        self.assertIsNone(Job.objects.claim("worker"))
+
+        Job.objects.update(locked_until=timezone.now() - timedelta(seconds=1))
+        job = Job.objects.claim("worker")
+        self.assertEqual(job.locked_by, "worker")
+        self.assertEqual(job.attempts, 2)
+
+    def test_a_successful_job_is_deleted(self):
+        Job.objects.enqueue("record", {"n": 1})
+        self.assertTrue(Job.objects.claim("worker").run())
+        self.assertEqual(calls, [{"n": 1}])
+        self.assertFalse(Job.objects.exists())
+
+    def test_a_failed_job_is_retried_with_exponential_backoff(self):
+        Job.objects.enqueue("fail")
+
+        for attempt in range(1, 3):
+            job = Job.objects.claim("worker")
+            before = timezone.now()
+            with self.assertLogs("portfoliohut.models.jobs", "ERROR"):
+                self.assertFalse(job.run())
+
+            job.refresh_from_db()
+            self.assertEqual(job.status, JobStatus.QUEUED)
+            self.assertIn("upstream is down", job.last_error)
+            backoff = timedelta(seconds=10 * 2 ** (attempt - 1))
+            self.assertGreaterEqual(job.run_at, before + backoff)
+            self.assertLessEqual(job.run_at, timezone.now() + backoff)
+            # Due again
+            Job.objects.update(run_at=timezone.now())
+
+    def test_a_job_fails_once_it_runs_out_of_attempts(self):
+        Job.objects.enqueue("fail", max_attempts=1)
+        with self.assertLogs("portfoliohut.models.jobs", "ERROR"):
+            self.assertFalse(Job.objects.claim("worker").run())
+
+        job = Job.objects.get()
+        self.assertEqual(job.status, JobStatus.FAILED)
+        self.assertIsNone(Job.objects.claim("worker"))
+
+    def test_a_failed_job_is_dropped_if_an_identical_job_was_queued(self):
+        Job.objects.enqueue("fail", dedup_key="key")
+        job = Job.objects.claim("worker")
+        queued = Job.objects.enqueue("fail", dedup_key="key")
+
+        with self.assertLogs("portfoliohut.models.jobs", "ERROR"):
+            self.assertFalse(job.run())
+        self.assertEqual(list(Job.objects.values_list("pk", flat=True)), [queued.pk])
@@ -0,0 +1,55 @@
+from datetime import date
+from decimal import Decimal
+
+import numpy as np
+from django.test import TestCase
+
+from portfoliohut.loaders import load_close_frame
+from portfoliohut.models import HistoricalEquity
+
+
+def add_price(ticker, day, close):
+    HistoricalEquity.objects.create(
+        ticker=ticker,
+        date=day,
+        open=close,
+        high=close,
+        low=close,
+        close=close,
+        volume=0,
+        dividends=Decimal(0),
+        stock_splits=0,
+    )
+
+
+class LoadCloseFrameTests(TestCase):
+    def test_each_price_lands_in_its_ticker_and_day(self):
+        add_price("BBB", date(2021, 3, 2), Decimal("20.5"))
+        add_price("AAA", date(2021, 3, 1), Decimal("10.25"))
+        add_price("AAA", date(2021, 3, 3), Decimal("11"))
+        add_price("CCC", date(2021, 3, 3), Decimal("1"))
+
+        frame = load_close_frame(["BBB", "AAA", "ZZZ"])
+
+        # Tickers without prices are left out
+        self.assertEqual(list(frame.columns), ["AAA", "BBB"])
+        self.assertEqual(
+            list(frame.index.date),
+            [date(2021, 3, 1), date(2021, 3, 2), date(2021, 3, 3)],
+        )
+        np.testing.assert_array_equal(
+            frame.values, [[10.25, np.nan], [np.nan, 20.5], [11, np.nan]]
+        )
+
+    def test_date_range(self):
+        for day in range(1, 5):
+            add_price("AAA", date(2021, 3, day), Decimal(day))
+
+        frame = load_close_frame(
+            ["AAA"], start_date=date(2021, 3, 2), end_date=date(2021, 3, 3)
+        )
+
+        self.assertEqual(frame["AAA"].tolist(), [2, 3])
+
+    def test_no_tickers(self):
+        self.assertTrue(load_close_frame([]).empty)
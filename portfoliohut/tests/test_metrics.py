@@ -0,0 +1,110 @@
+import json
+import os
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from portfoliohut.metrics import EXITED_FILE, Counter, Registry
+
+DEAD_PID = 999999999
+
+
+def running(pid):
+    return pid != DEAD_PID
+
+
+@mock.patch("portfoliohut.metrics._is_running", running)
+class RegistryTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        overridden = override_settings(PORTFOLIOHUT_METRICS_DIR=directory.name)
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+
+        self.registry = Registry()
+        self.counter = Counter(
+            "test_total", "A test counter.", ["kind"], registry=self.registry
+        )
+
+    def write_exited(self, name, **counts):
+        rows = [["test_total", [kind], [count]] for kind, count in counts.items()]
+        (self.directory / f"{DEAD_PID}-{name}.json").write_text(json.dumps(rows))
+
+    def totals(self):
+        return {
+            labels: values[0]
+            for (name, labels), values in self.registry.collect().items()
+        }
+
+    def test_sums_the_files_of_every_process(self):
+        self.counter.inc(kind="a")
+        self.counter.inc(2, kind="b")
+        self.write_exited("other", a=5)
+        self.assertEqual(self.totals(), {("a",): 6, ("b",): 2})
+
+    def test_folds_the_files_of_exited_processes_into_one(self):
+        self.counter.inc(kind="a")
+        self.write_exited("first", a=5, b=1)
+        self.write_exited("second", a=10)
+
+        self.assertEqual(self.totals(), {("a",): 16, ("b",): 1})
+        self.assertEqual(
+            sorted(path.name for path in self.directory.glob("*.json")),
+            sorted([EXITED_FILE, self.registry._file_name]),
+        )
+        # Folding again doesn't count them twice
+        self.assertEqual(self.totals(), {("a",): 16, ("b",): 1})
+
+        self.write_exited("third", b=3)
+        self.assertEqual(self.totals(), {("a",): 16, ("b",): 4})
+        self.assertEqual(len(list(self.directory.glob("*.json"))), 2)
+
+    def test_a_folded_file_left_behind_is_not_counted_twice(self):
+        self.write_exited("first", a=5)
+        self.totals()
+        # As if the collector stopped right after writing the exited file
+        self.write_exited("first", a=5)
+        self.assertEqual(self.totals(), {("a",): 5})
+        self.assertFalse(list(self.directory.glob(f"{DEAD_PID}-*.json")))
+
+    def test_the_file_of_this_process_is_kept(self):
+        self.counter.inc(kind="a")
+        self.totals()
+        self.assertTrue((self.directory / self.registry._file_name).exists())
+        self.assertTrue(self.registry._file_name.startswith(f"{os.getpid()}-"))
+
+
+class MetricsViewTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        overridden = override_settings(PORTFOLIOHUT_METRICS_DIR=directory.name)
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+        self.url = reverse("metrics")
+
+    @override_settings(PORTFOLIOHUT_METRICS_TOKEN=None)
+    def test_hidden_without_a_token(self):
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.client.force_login(User.objects.create_user("jane"))
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    @override_settings(PORTFOLIOHUT_METRICS_TOKEN="secret")
+    def test_requires_the_token(self):
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+        response = self.client.get(self.url, HTTP_AUTHORIZATION="Bearer wrong")
+        self.assertEqual(response.status_code, 401)
+
+        response = self.client.get(self.url, HTTP_AUTHORIZATION="Bearer secret")
+        self.assertContains(response, "# TYPE portfoliohut_recompute_duration_seconds")
+
+    @override_settings(PORTFOLIOHUT_METRICS_TOKEN=None)
+    def test_staff_users_can_see_them(self):
+        self.client.force_login(User.objects.create_user("admin", is_staff=True))
+        self.assertEqual(self.client.get(self.url).status_code, 200)
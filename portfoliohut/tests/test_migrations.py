@@ -0,0 +1,102 @@
+from decimal import Decimal
+
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TransactionTestCase
+
+from portfoliohut.models.fields import FixedPointField
+
+BEFORE = [("portfoliohut", "0011_returnsstate")]
+AFTER = [("portfoliohut", "0012_fixed_point_prices")]
+
+
+class FixedPointPricesMigrationTests(TransactionTestCase):
+    prices = {
+        "open": Decimal("10.25"),
+        "high": Decimal("1234567.89"),
+        "low": Decimal("0.01"),
+        "close": Decimal("10.10"),
+        "dividends": Decimal("0"),
+    }
+
+    def migrate(self, targets):
+        # A new executor, so the loader knows which migrations the last call (un)applied
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+        super().tearDown()
+
+    def add_prices(self, apps):
+        return apps.get_model("portfoliohut", "HistoricalEquity").objects.create(
+            type="EQ",
+            ticker="AAA",
+            date="2021-03-01",
+            volume=0,
+            stock_splits=0,
+            **self.prices,
+        )
+
+    def stored(self, table):
+        columns = ", ".join(self.prices)
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT {columns} FROM {table}")
+            return dict(zip(self.prices, cursor.fetchone()))
+
+    def test_forwards_stores_whole_cents(self):
+        self.add_prices(self.migrate(BEFORE))
+
+        apps = self.migrate(AFTER)
+
+        self.assertEqual(
+            self.stored("portfoliohut_historicalequity"),
+            {"open": 1025, "high": 123456789, "low": 1, "close": 1010, "dividends": 0},
+        )
+        bar = apps.get_model("portfoliohut", "HistoricalEquity").objects.get()
+        self.assertEqual(
+            {name: getattr(bar, name) for name in self.prices}, self.prices
+        )
+
+    def test_backwards_restores_the_decimals(self):
+        self.add_prices(self.migrate(BEFORE))
+        self.migrate(AFTER)
+
+        apps = self.migrate(BEFORE)
+
+        bar = apps.get_model("portfoliohut", "HistoricalEquity").objects.get()
+        self.assertEqual(
+            {name: getattr(bar, name) for name in self.prices}, self.prices
+        )
+
+
+class FixedPointFieldTests(SimpleTestCase):
+    field = FixedPointField()
+
+    def round_trip(self, value):
+        return self.field.from_db_value(self.field.get_prep_value(value), None, None)
+
+    def test_round_trip(self):
+        for value in ["0", "0.01", "10.25", "-3.10", "92233720368547758.07"]:
+            with self.subTest(value=value):
+                self.assertEqual(self.round_trip(Decimal(value)), Decimal(value))
+
+    def test_half_cents_are_rounded_half_to_even(self):
+        for value, cents in [
+            ("0.005", 0),
+            ("0.015", 2),
+            ("10.125", 1012),
+            ("10.135", 1014),
+            ("-0.015", -2),
+        ]:
+            with self.subTest(value=value):
+                self.assertEqual(self.field.get_prep_value(Decimal(value)), cents)
+                self.assertEqual(self.round_trip(Decimal(value)), Decimal(cents) / 100)
+
+    def test_strings_and_floats(self):
+        self.assertEqual(self.field.get_prep_value("10.1"), 1010)
+        # The float nearest to 0.015 is slightly below it
+        self.assertEqual(self.field.get_prep_value(0.015), 1)
+        self.assertIsNone(self.field.get_prep_value(None))
+        self.assertIsNone(self.field.from_db_value(None, None, None))
@@ -0,0 +1,95 @@
+from datetime import datetime, timedelta
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from portfoliohut.models import FinancialActionType, Transaction
+from portfoliohut.pagination import (
+    InvalidCursor,
+    KeysetPaginator,
+    decode_cursor,
+    encode_cursor,
+)
+from portfoliohut.tests.utils import create_profile
+
+
+class CursorTests(TestCase):
+    def test_round_trip(self):
+        date_time = timezone.make_aware(datetime(2021, 3, 4, 9, 30, 15, 123456))
+        transaction = Transaction(pk=42, date_time=date_time)
+        self.assertEqual(decode_cursor(encode_cursor(transaction)), (date_time, 42))
+
+    def test_invalid_cursors(self):
+        for cursor in ["", "garbage", "bm8tc2VwYXJhdG9y", "MjAyMXwxMg=="]:
+            with self.subTest(cursor=cursor), self.assertRaises(InvalidCursor):
+                decode_cursor(cursor)
+
+
+class KeysetPaginatorTests(TestCase):
+    def setUp(self):
+        self.profile = create_profile()
+        start = timezone.make_aware(datetime(2021, 1, 4, 10))
+        # Pairs of transactions at the same time, so the pages have to break ties on the id
+        for i in range(5):
+            for ticker in ["AAA", "BBB"]:
+                Transaction.objects.create(
+                    profile=self.profile,
+                    type=FinancialActionType.EQUITY,
+                    ticker=ticker,
+                    date_time=start + timedelta(days=i),
+                    quantity=1,
+                    price=10,
+                )
+        self.newest_first = list(
+            self.profile.transaction_set.order_by("-date_time", "-id")
+        )
+        self.paginator = KeysetPaginator(self.profile.transaction_set.all(), 3)
+
+    def test_pages_forward_through_every_row_once(self):
+        pages = [self.paginator.page()]
+        while pages[-1].next_cursor is not None:
+            pages.append(self.paginator.page(after=pages[-1].next_cursor))
+
+        self.assertEqual([len(page.object_list) for page in pages], [3, 3, 3, 1])
+        self.assertEqual(
+            [row for page in pages for row in page.object_list], self.newest_first
+        )
+        self.assertIsNone(pages[0].previous_cursor)
+        self.assertIsNotNone(pages[-1].previous_cursor)
+
+    def test_previous_returns_the_page_before(self):
+        first = self.paginator.page()
+        second = self.paginator.page(after=first.next_cursor)
+        third = self.paginator.page(after=second.next_cursor)
+
+        back = self.paginator.page(before=third.previous_cursor)
+        self.assertEqual(back.object_list, second.object_list)
+        self.assertEqual(back.next_cursor, second.next_cursor)
+
+        back = self.paginator.page(before=back.previous_cursor)
+        self.assertEqual(back.object_list, first.object_list)
+        self.assertIsNone(back.previous_cursor)
+
+    def test_no_estimated_count_without_a_query_planner(self):
+        # The tests run on SQLite, which would have to count every row
+        self.assertIsNone(self.paginator.estimated_count())
+
+    def test_the_estimated_count_is_opt_in(self):
+        self.client.force_login(self.profile.user)
+        url = reverse("transaction-history")
+
+        with mock.patch.object(KeysetPaginator, "estimated_count", return_value=10):
+            response = self.client.get(url)
+            self.assertIsNone(response.context["transactions_count"])
+            self.assertNotContains(response, "About 10 transactions")
+
+            with override_settings(PORTFOLIOHUT_TRANSACTIONS_ESTIMATED_COUNT=True):
+                response = self.client.get(url)
+            self.assertContains(response, "About 10 transactions")
+
+    def test_an_invalid_cursor_is_a_bad_request(self):
+        self.client.force_login(self.profile.user)
+        response = self.client.get(reverse("transaction-history"), {"after": "nope"})
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,68 @@
+from datetime import date
+
+from django.test import TestCase
+
+from portfoliohut.models import PortfolioReturn, ReturnsWriteStats
+from portfoliohut.tests.utils import create_profile
+
+
+class WriteReturnsTests(TestCase):
+    def setUp(self):
+        self.profile = create_profile()
+        self.other = create_profile("john")
+        self.returns = {
+            date(2021, 3, 1): 0.01,
+            date(2021, 3, 2): -0.02,
+            date(2021, 3, 3): 0.03,
+        }
+
+    def stored(self, profile):
+        return dict(
+            PortfolioReturn.objects.filter(profile=profile).values_list(
+                "date", "returns"
+            )
+        )
+
+    def test_first_write_inserts_every_day(self):
+        stats = PortfolioReturn.objects.write_returns({self.profile.pk: self.returns})
+
+        self.assertEqual(stats, ReturnsWriteStats(3, 0, 0, 0))
+        self.assertEqual(self.stored(self.profile), self.returns)
+
+    def test_rewrite_only_touches_the_days_that_changed(self):
+        PortfolioReturn.objects.write_returns(
+            {self.profile.pk: self.returns, self.other.pk: self.returns}
+        )
+        self.profile.refresh_from_db()
+        version = self.profile.returns_version
+
+        new_returns = {
+            # Floating point noise leaves the row alone
+            date(2021, 3, 1): 0.01 + 1e-15,
+            date(2021, 3, 2): -0.025,
+            date(2021, 3, 4): 0.04,
+        }
+        stats = PortfolioReturn.objects.write_returns({self.profile.pk: new_returns})
+
+        self.assertEqual(
+            stats, ReturnsWriteStats(inserted=1, updated=1, deleted=1, unchanged=1)
+        )
+        self.assertEqual(
+            self.stored(self.profile),
+            {
+                date(2021, 3, 1): 0.01,
+                date(2021, 3, 2): -0.025,
+                date(2021, 3, 4): 0.04,
+            },
+        )
+        # Other profiles are left alone
+        self.assertEqual(self.stored(self.other), self.returns)
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.returns_version, version + 1)
+
+    def test_unchanged_returns_write_nothing(self):
+        PortfolioReturn.objects.write_returns({self.profile.pk: self.returns})
+
+        stats = PortfolioReturn.objects.write_returns({self.profile.pk: self.returns})
+
+        self.assertEqual(stats, ReturnsWriteStats(0, 0, 0, 3))
@@ -0,0 +1,125 @@
+from datetime import timedelta
+from unittest import mock
+
+import pandas as pd
+from django.db import connection, transaction
+from django.test import TransactionTestCase, override_settings
+from django.utils import timezone
+
+from portfoliohut.models import HistoricalEquity, TickerMetadata, TickerStatus
+from portfoliohut.providers import OfflineProvider
+from portfoliohut.tests.utils import ProviderMixin
+
+
+class RecordingProvider(OfflineProvider):
+    """Records every history download, if a transaction was open and if the lease was held."""
+
+    downloads = []
+
+    def get_history(self, ticker, start=None):
+        leased = TickerMetadata.objects.filter(
+            ticker=ticker, fetching_until__gt=timezone.now()
+        ).exists()
+        self.downloads.append((ticker, connection.in_atomic_block, leased))
+        return super().get_history(ticker, start)
+
+
+# A transaction test case, so the downloads can check that no transaction is open
+class GetTickerTests(ProviderMixin, TransactionTestCase):
+    provider = "portfoliohut.tests.test_prices.RecordingProvider"
+
+    def setUp(self):
+        super().setUp()
+        RecordingProvider.downloads = []
+
+    def test_downloads_under_a_lease_outside_of_a_transaction(self):
+        self.assertTrue(HistoricalEquity.objects.get_ticker("AAA").exists())
+        self.assertEqual(RecordingProvider.downloads, [("AAA", False, True)])
+        self.assertIsNone(TickerMetadata.objects.get(ticker="AAA").fetching_until)
+
+    def test_cached_prices_are_not_downloaded_again(self):
+        HistoricalEquity.objects.get_ticker("AAA")
+        HistoricalEquity.objects.get_ticker("AAA")
+        self.assertEqual(len(RecordingProvider.downloads), 1)
+
+    def test_releases_the_lease_when_the_download_fails(self):
+        with mock.patch.object(
+            RecordingProvider, "get_history", side_effect=ConnectionError
+        ):
+            with self.assertRaises(ConnectionError):
+                HistoricalEquity.objects.get_ticker("AAA")
+        self.assertIsNone(TickerMetadata.objects.get(ticker="AAA").fetching_until)
+
+    def test_waits_for_the_process_holding_the_lease(self):
+        TickerMetadata.objects.create(
+            ticker="AAA", fetching_until=timezone.now() + timedelta(minutes=1)
+        )
+
+        def other_process_finishes(seconds):
+            metadata = TickerMetadata.objects.get(ticker="AAA")
+            HistoricalEquity.objects._fetch("AAA", metadata, timezone.now())
+            TickerMetadata.objects.filter(ticker="AAA").update(fetching_until=None)
+
+        with mock.patch(
+            "portfoliohut.models.transactions.time.sleep",
+            side_effect=other_process_finishes,
+        ) as sleep:
+            self.assertTrue(HistoricalEquity.objects.get_ticker("AAA").exists())
+
+        sleep.assert_called_once()
+        # Only the other process downloaded the prices
+        self.assertEqual(len(RecordingProvider.downloads), 1)
+
+    def test_takes_over_an_expired_lease(self):
+        TickerMetadata.objects.create(
+            ticker="AAA", fetching_until=timezone.now() - timedelta(seconds=1)
+        )
+        self.assertTrue(HistoricalEquity.objects.get_ticker("AAA").exists())
+        self.assertEqual(RecordingProvider.downloads, [("AAA", False, True)])
+
+    @override_settings(PORTFOLIOHUT_TICKER_FETCH_WAIT=0)
+    def test_stops_waiting_before_the_request_times_out(self):
+        TickerMetadata.objects.create(
+            ticker="AAA", fetching_until=timezone.now() + timedelta(minutes=1)
+        )
+
+        with mock.patch("portfoliohut.models.transactions.time.sleep") as sleep:
+            self.assertFalse(HistoricalEquity.objects.get_ticker("AAA").exists())
+
+        sleep.assert_not_called()
+        self.assertEqual(RecordingProvider.downloads, [])
+
+    def test_fetches_outside_of_the_callers_transaction(self):
+        # SQLite has a single writer, so only other databases fetch on a connection of their own.
+        # The transaction must not read the metadata first, the test database (SQLite with a
+        # shared cache) locks the tables a transaction read.
+        with mock.patch.object(connection, "vendor", "postgresql"), mock.patch.object(
+            HistoricalEquity.objects, "_get_metadata", return_value=None
+        ):
+            with transaction.atomic():
+                self.assertTrue(HistoricalEquity.objects.get_ticker("AAA").exists())
+                self.assertIsNone(
+                    TickerMetadata.objects.get(ticker="AAA").fetching_until
+                )
+
+        self.assertEqual(RecordingProvider.downloads, [("AAA", False, True)])
+
+    @override_settings(PORTFOLIOHUT_TICKER_NOT_FOUND_TTL=60)
+    def test_unknown_tickers_are_not_looked_up_again_until_the_ttl_expires(self):
+        with mock.patch.object(
+            OfflineProvider, "get_history", return_value=pd.DataFrame()
+        ):
+            self.assertFalse(HistoricalEquity.objects.get_ticker("AAA").exists())
+            self.assertFalse(HistoricalEquity.objects.get_ticker("AAA").exists())
+        self.assertEqual(len(RecordingProvider.downloads), 1)
+        metadata = TickerMetadata.objects.get(ticker="AAA")
+        self.assertEqual(metadata.status, TickerStatus.NOT_FOUND)
+
+        # The ticker got listed in the meantime
+        later = metadata.not_found_until + timedelta(seconds=1)
+        with mock.patch("django.utils.timezone.now", return_value=later):
+            self.assertTrue(HistoricalEquity.objects.get_ticker("AAA").exists())
+        self.assertEqual(len(RecordingProvider.downloads), 2)
+        self.assertEqual(
+            TickerMetadata.objects.get(ticker="AAA").status, TickerStatus.OK
+        )
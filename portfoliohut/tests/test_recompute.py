@@ -0,0 +1,163 @@
+from datetime import datetime, timedelta
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from portfoliohut import batch_returns
+from portfoliohut.jobs import recompute_returns
+from portfoliohut.models import (
+    FinancialActionType,
+    Job,
+    PortfolioReturn,
+    ReturnsRecompute,
+    Transaction,
+)
+from portfoliohut.tests.utils import ProviderMixin, create_profile
+
+STEPS = "portfoliohut.models.transactions.TransactionManager.post_add_transaction_steps"
+
+
+@override_settings(
+    PORTFOLIOHUT_JOBS_EAGER=False,
+    PORTFOLIOHUT_RECOMPUTE_DELAY=2,
+    PORTFOLIOHUT_RECOMPUTE_MAX_DELAY=30,
+)
+class ReturnsRecomputeTests(TestCase):
+    def setUp(self):
+        self.profile = create_profile()
+
+    def test_a_burst_of_writes_coalesces_into_one_recompute(self):
+        for _ in range(5):
+            ReturnsRecompute.objects.schedule(self.profile)
+
+        pending = ReturnsRecompute.objects.get(profile=self.profile)
+        self.assertEqual(pending.generation, 4)
+        self.assertTrue(self.profile.is_returns_updating())
+        job = Job.objects.get()
+        self.assertEqual(job.task, "recompute_returns")
+        self.assertEqual(job.payload, {"profile_id": self.profile.pk})
+        self.assertEqual(job.run_at, pending.run_after)
+
+    def test_each_write_pushes_the_recompute_back_up_to_the_max_delay(self):
+        ReturnsRecompute.objects.schedule(self.profile)
+        first = ReturnsRecompute.objects.get(profile=self.profile)
+
+        ReturnsRecompute.objects.schedule(self.profile, delay=10)
+        self.assertGreater(
+            ReturnsRecompute.objects.get(profile=self.profile).run_after,
+            first.run_after,
+        )
+
+        ReturnsRecompute.objects.schedule(self.profile, delay=60)
+        self.assertEqual(
+            ReturnsRecompute.objects.get(profile=self.profile).run_after,
+            first.first_requested_at + timedelta(seconds=30),
+        )
+
+    def test_run_recomputes_and_removes_the_entry(self):
+        ReturnsRecompute.objects.schedule(self.profile)
+        pending = ReturnsRecompute.objects.get(profile=self.profile)
+
+        with mock.patch(STEPS) as steps:
+            self.assertTrue(ReturnsRecompute.objects.run(pending))
+
+        steps.assert_called_once_with(profile=self.profile)
+        self.assertFalse(self.profile.is_returns_updating())
+
+    def test_run_skips_a_profile_that_is_already_recomputing(self):
+        ReturnsRecompute.objects.schedule(self.profile)
+        ReturnsRecompute.objects.update(
+            locked_until=timezone.now() + timedelta(minutes=1)
+        )
+        pending = ReturnsRecompute.objects.get(profile=self.profile)
+
+        with mock.patch(STEPS) as steps:
+            self.assertFalse(ReturnsRecompute.objects.run(pending))
+
+        steps.assert_not_called()
+        self.assertTrue(self.profile.is_returns_updating())
+
+    def test_a_write_during_the_recompute_keeps_the_entry_queued(self):
+        ReturnsRecompute.objects.schedule(self.profile)
+        pending = ReturnsRecompute.objects.get(profile=self.profile)
+
+        def write_while_running(profile):
+            Transaction.objects.schedule_post_add_transaction_steps(profile=profile)
+
+        with mock.patch(STEPS, side_effect=write_while_running):
+            self.assertTrue(ReturnsRecompute.objects.run(pending))
+
+        pending = ReturnsRecompute.objects.get(profile=self.profile)
+        self.assertEqual(pending.generation, 1)
+        # The lock is released so the queued recompute can run
+        self.assertIsNone(pending.locked_until)
+
+    def test_a_failed_recompute_releases_the_lock(self):
+        ReturnsRecompute.objects.schedule(self.profile)
+        pending = ReturnsRecompute.objects.get(profile=self.profile)
+
+        with mock.patch(STEPS, side_effect=ValueError):
+            with self.assertRaises(ValueError):
+                ReturnsRecompute.objects.run(pending)
+
+        self.assertIsNone(
+            ReturnsRecompute.objects.get(profile=self.profile).locked_until
+        )
+
+    def test_process_due_waits_for_the_debounce_window(self):
+        ReturnsRecompute.objects.schedule(self.profile)
+
+        with mock.patch(STEPS) as steps:
+            self.assertEqual(ReturnsRecompute.objects.process_due(), 0)
+            self.assertEqual(ReturnsRecompute.objects.process_due(force=True), 1)
+
+        steps.assert_called_once()
+
+    def test_the_task_checks_back_when_the_profile_is_locked(self):
+        ReturnsRecompute.objects.schedule(self.profile)
+        ReturnsRecompute.objects.update(
+            locked_until=timezone.now() + timedelta(minutes=1)
+        )
+        Job.objects.all().delete()
+
+        with mock.patch(STEPS) as steps:
+            recompute_returns(profile_id=self.profile.pk)
+
+        steps.assert_not_called()
+        job = Job.objects.get()
+        self.assertEqual(job.dedup_key, f"recompute_returns:{self.profile.pk}")
+
+
+class RecomputeAllReturnsTests(ProviderMixin, TestCase):
+    start = timezone.make_aware(datetime(2021, 3, 1, 12))
+
+    def trade(self, profile, ticker, days=0):
+        Transaction.objects.create(
+            profile=profile,
+            type=FinancialActionType.EQUITY,
+            ticker=ticker,
+            date_time=self.start + timedelta(days=days),
+            quantity=10,
+            price=10,
+        )
+
+    def test_transactions_added_after_the_prices_are_loaded_wait_for_the_next_run(self):
+        profiles = [create_profile("jane"), create_profile("john")]
+        for profile in profiles:
+            self.trade(profile, "AAA")
+        load_price_matrix = batch_returns.load_price_matrix
+
+        def load_then_trade(*args, **kwargs):
+            prices = load_price_matrix(*args, **kwargs)
+            # A trade in a ticker the matrix lacks, before the second chunk runs
+            self.trade(profiles[1], "BBB", days=7)
+            return prices
+
+        with mock.patch.object(batch_returns, "load_price_matrix", load_then_trade):
+            self.assertEqual(batch_returns.recompute_all_returns(chunk_size=1), 2)
+
+        self.assertEqual(
+            set(PortfolioReturn.objects.values_list("profile_id", flat=True)),
+            {profile.pk for profile in profiles},
+        )
@@ -0,0 +1,113 @@
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from portfoliohut.middleware import PIN_COOKIE
+from portfoliohut.models import Profile
+from portfoliohut.routers import use_replicas
+from portfoliohut.tests.utils import create_profile
+
+REPLICA = "replica"
+
+
+@override_settings(PORTFOLIOHUT_DATABASE_REPLICAS=[REPLICA])
+class ReplicaRoutingTests(TransactionTestCase):
+    """Route through a second database alias, a replica of the test database.
+
+    The alias is added the way `settings.py` adds `DATABASE_REPLICA_URLS`, as a mirror of the
+    primary, so both aliases see the same rows but every query shows up on the alias it used.
+
+    """
+
+    # Resolved in `setUpClass`, after the replica alias was added
+    databases = "__all__"
+
+    @classmethod
+    def setUpClass(cls):
+        connections.databases[REPLICA] = {
+            **connections.databases[DEFAULT_DB_ALIAS],
+            "TEST": {"MIRROR": DEFAULT_DB_ALIAS},
+        }
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections[REPLICA].close()
+        del connections.databases[REPLICA]
+        delattr(connections._connections, REPLICA)
+
+    def setUp(self):
+        self.jane = create_profile("jane")
+        self.john = create_profile("john")
+        self.client.force_login(self.jane.user)
+
+    def capture(self):
+        return (
+            CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]),
+            CaptureQueriesContext(connections[REPLICA]),
+        )
+
+    def test_reads_go_to_the_replica_until_something_is_written(self):
+        primary, replica = self.capture()
+        with primary, replica, use_replicas() as routing:
+            Profile.objects.count()
+            self.assertEqual((len(primary), len(replica)), (0, 1))
+
+            Profile.objects.filter(pk=self.jane.pk).update(bio="Hi")
+            self.assertTrue(routing.wrote)
+            Profile.objects.count()
+            self.assertEqual((len(primary), len(replica)), (2, 1))
+
+    def test_everything_outside_of_a_request_uses_the_primary(self):
+        primary, replica = self.capture()
+        with primary, replica:
+            Profile.objects.count()
+        self.assertEqual((len(primary), len(replica)), (1, 0))
+
+    def test_get_requests_read_from_the_replica(self):
+        primary, replica = self.capture()
+        with primary, replica:
+            response = self.client.get(reverse("profile", args=["john"]))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+        self.assertTrue(replica.captured_queries)
+        self.assertFalse(
+            [q for q in primary.captured_queries if q["sql"].startswith("SELECT")]
+        )
+
+    def test_a_friend_request_pins_the_user_to_the_primary(self):
+        response = self.client.post(reverse("friend", args=["john"]))
+
+        self.assertRedirects(response, reverse("profile", args=["john"]))
+        self.assertIn(PIN_COOKIE, response.cookies)
+        self.assertTrue(self.john.friend_requests.filter(pk=self.jane.pk).exists())
+
+        # The redirect reads the new friend request from the primary
+        primary, replica = self.capture()
+        with primary, replica:
+            response = self.client.get(response.url)
+        self.assertContains(response, "Pending")
+        self.assertTrue(primary.captured_queries)
+        self.assertFalse(replica.captured_queries)
+
+    def test_friend_requests_need_a_post(self):
+        for url in [
+            reverse("friend", args=["john"]),
+            reverse("respond-to-friend-request", args=["john", "accept"]),
+        ]:
+            self.assertEqual(self.client.get(url).status_code, 405)
+        self.assertFalse(self.john.friend_requests.exists())
+
+    def test_accepting_a_friend_request_pins_the_user_to_the_primary(self):
+        self.jane.friend_requests.add(self.john)
+
+        response = self.client.post(
+            reverse("respond-to-friend-request", args=["john", "accept"])
+        )
+
+        self.assertIn(PIN_COOKIE, response.cookies)
+        self.assertTrue(self.jane.friends.filter(pk=self.john.pk).exists())
+        self.assertFalse(self.jane.friend_requests.exists())
@@ -0,0 +1,287 @@
+from datetime import date
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from portfoliohut.batch_returns import to_ledger
+from portfoliohut.models import FinancialActionType
+from portfoliohut.returns_engine import (
+    EQUITY,
+    EXTERNAL_CASH,
+    INTERNAL_CASH,
+    Ledger,
+    compute_returns,
+    compute_xirr,
+    end_of_day_state,
+    roll_forward,
+    solve_xirr,
+)
+
+NAN = np.nan
+
+
+def make_ledger(rows) -> Ledger:
+    """A ledger from `(profile, kind, ticker, day, quantity, value)` rows."""
+    columns = list(zip(*rows)) if rows else [()] * 6
+    return Ledger(
+        *[np.array(column, dtype="int64") for column in columns[:5]],
+        np.array(columns[5], dtype="float64"),
+    )
+
+
+def buy(profile, ticker, day, quantity, price):
+    return [
+        (profile, EQUITY, ticker, day, quantity, quantity * price),
+        (profile, INTERNAL_CASH, 0, day, -quantity, -quantity * price),
+    ]
+
+
+def cash(profile, day, amount):
+    return [(profile, EXTERNAL_CASH, 0, day, 1 if amount > 0 else -1, amount)]
+
+
+def epoch_day(year, month, day):
+    return (date(year, month, day) - date(1970, 1, 1)).days
+
+
+class ComputeReturnsTests(SimpleTestCase):
+    days = np.arange(100, 105)
+
+    def test_single_ticker(self):
+        ledger = make_ledger(cash(1, 100, 1000) + buy(1, 0, 100, 10, 10))
+        closes = np.array([[10.0], [10.0], [11.0], [12.0], [9.0]])
+
+        result = compute_returns(ledger, closes, self.days)
+
+        np.testing.assert_array_equal(result.profile_ids, [1])
+        # 10 shares plus the -100 spent on them
+        np.testing.assert_allclose(result.value, [[0, 0, 10, 20, -10]])
+        # Deposits count from the next day on (like the original pandas implementation), so the
+        # first return is on the third day: 1010 / 1000, then 1020 / 1010 and 990 / 1020
+        np.testing.assert_allclose(
+            result.twr, [[NAN, NAN, 0.01, 10 / 1010, -30 / 1020]]
+        )
+
+    def test_a_deposit_is_part_of_the_value_from_the_next_day_on(self):
+        ledger = make_ledger(
+            cash(1, 100, 1000) + buy(1, 0, 100, 10, 10) + cash(1, 102, 500)
+        )
+        closes = np.array([[10.0], [10.0], [10.0], [10.0], [10.0]])
+
+        result = compute_returns(ledger, closes, self.days)
+
+        # The day of the deposit starts from 1000 + 500 and ends at 1000, the next day starts from
+        # those 1000 and ends at 1500
+        np.testing.assert_allclose(result.twr, [[NAN, NAN, -500 / 1500, 500 / 1000, 0]])
+
+    def test_days_without_prices_are_skipped(self):
+        ledger = make_ledger(
+            cash(1, 100, 1000)
+            + buy(1, 1, 100, 10, 10)
+            # Traded on a day without a price, held from the next day with prices on
+            + buy(1, 1, 102, 10, 20)
+            + cash(2, 100, 1000)
+            + buy(2, 0, 100, 10, 10)
+        )
+        closes = np.array(
+            [
+                [10.0, 10.0],
+                [10.0, 10.0],
+                [10.0, NAN],
+                [10.0, 20.0],
+                [10.0, 30.0],
+            ]
+        )
+
+        result = compute_returns(ledger, closes, self.days)
+
+        np.testing.assert_array_equal(
+            result.valid,
+            [[True, True, False, True, True], [True] * 5],
+        )
+        # Profile 1: 1000 on day 101, then 20 shares at 20 - 300 spent + 1000 = 1100 on day 103
+        # and 20 shares at 30 = 1300 on day 104
+        np.testing.assert_allclose(
+            result.twr,
+            [[NAN, NAN, NAN, 0.1, 200 / 1100], [NAN, NAN, 0, 0, 0]],
+        )
+
+    def test_profiles_are_independent(self):
+        rng = np.random.default_rng(0)
+        closes = 10 + rng.random((30, 3))
+        closes[rng.random(closes.shape) < 0.1] = NAN
+        days = np.arange(30)
+        rows = [
+            cash(1, 0, 1000) + buy(1, 0, 2, 5, 10) + buy(1, 2, 10, 3, 10),
+            cash(2, 5, 500) + buy(2, 1, 5, 10, 10) + cash(2, 20, -100),
+            cash(3, 12, 800) + buy(3, 2, 14, 20, 10) + buy(3, 2, 20, -10, 10),
+        ]
+
+        together = compute_returns(make_ledger(sum(rows, [])), closes, days)
+
+        for i, profile_rows in enumerate(rows):
+            alone = compute_returns(make_ledger(profile_rows), closes, days)
+            np.testing.assert_allclose(together.twr[i], alone.twr[0])
+            np.testing.assert_allclose(together.value[i], alone.value[0])
+
+    def test_cash_only_profiles_have_no_returns(self):
+        result = compute_returns(
+            make_ledger(cash(1, 100, 1000)), np.ones((5, 1)), self.days
+        )
+        self.assertEqual(result.twr.shape, (0, 5))
+
+
+def random_ledger(rng, n_profiles, n_tickers, first_day, last_day, tickers=None):
+    """Random deposits, withdrawals and trades, sorted by profile like a ledger from the database.
+
+    `tickers` limits the trades of each profile to the given ticker columns (and leaves out the
+    initial deposit, the ledger continues an earlier one).
+
+    """
+    rows = []
+    for profile in range(1, n_profiles + 1):
+        choices = range(n_tickers) if tickers is None else tickers[profile]
+        if tickers is None:
+            # A deposit on the first day starts every profile's history
+            rows += cash(profile, first_day, 5000)
+        for _ in range(rng.integers(1, 8)):
+            day = int(rng.integers(first_day, last_day))
+            if rng.random() < 0.3 or not len(choices):
+                rows += cash(profile, day, float(rng.integers(-200, 1000)))
+            else:
+                ticker = int(rng.choice(list(choices)))
+                rows += buy(profile, ticker, day, int(rng.integers(-5, 20)), 10.0)
+    return make_ledger(rows)
+
+
+class RollForwardTests(SimpleTestCase):
+    days = np.arange(100, 105)
+
+    def test_rolling_forward_matches_a_full_recompute(self):
+        rng = np.random.default_rng(42)
+        n_days, n_tickers, cut = 120, 4, 80
+        closes = 10 * np.cumprod(1 + rng.normal(0, 0.02, (n_days, n_tickers)), axis=0)
+        closes[rng.random(closes.shape) < 0.05] = NAN
+        # Weekends without prices
+        day_numbers = np.flatnonzero(np.arange(n_days * 7 // 5 + 2) % 7 < 5)[:n_days]
+
+        before = random_ledger(rng, 20, n_tickers, day_numbers[0], day_numbers[cut])
+        result = compute_returns(before, closes[:cut], day_numbers[:cut])
+        state = end_of_day_state(before, result, closes[:cut], day_numbers[:cut])
+
+        # Later transactions in the tickers each profile already holds
+        traded = {
+            profile: state.holding_tickers[state.holding_profiles == row]
+            for row, profile in enumerate(state.profile_ids)
+        }
+        after = random_ledger(
+            rng,
+            20,
+            n_tickers,
+            day_numbers[cut],
+            day_numbers[-1] + 1,
+            tickers={p: traded.get(p, []) for p in range(1, 21)},
+        )
+        combined = Ledger(*[np.r_[a, b] for a, b in zip(before, after)])
+        # Sorted by profile and only the profiles with a state (the others have no returns)
+        order = np.argsort(combined.profile, kind="stable")
+        order = order[np.isin(combined.profile[order], state.profile_ids)]
+        combined = Ledger(*[column[order] for column in combined])
+        # Like `batch_returns`, everything after the day of each state (which includes the trades
+        # on the weekend after it)
+        row_of = np.searchsorted(state.profile_ids, combined.profile)
+        new = combined.day > state.day[row_of]
+        new = Ledger(*[column[new] for column in combined])
+
+        twr, rolled_state = roll_forward(state, new, closes[cut:], day_numbers[cut:])
+
+        full = compute_returns(combined, closes, day_numbers)
+        rows = np.searchsorted(full.profile_ids, state.profile_ids)
+        np.testing.assert_allclose(twr, full.twr[rows, cut:], rtol=1e-9)
+        full_state = end_of_day_state(combined, full, closes, day_numbers)
+        for field in ["profile_ids", "day", "holding_tickers", "holdings"]:
+            np.testing.assert_array_equal(
+                getattr(rolled_state, field), getattr(full_state, field), field
+            )
+        for field in ["value", "cash_flows", "internal_cash", "growth"]:
+            np.testing.assert_allclose(
+                getattr(rolled_state, field),
+                getattr(full_state, field),
+                rtol=1e-9,
+                err_msg=field,
+            )
+
+    def test_new_tickers_need_a_full_recompute(self):
+        ledger = make_ledger(cash(1, 100, 1000) + buy(1, 0, 100, 10, 10))
+        closes = np.full((5, 2), 10.0)
+        result = compute_returns(ledger, closes[:3], self.days[:3])
+        state = end_of_day_state(ledger, result, closes[:3], self.days[:3])
+
+        with self.assertRaises(ValueError):
+            roll_forward(
+                state, make_ledger(buy(1, 1, 103, 1, 10)), closes[3:], self.days[3:]
+            )
+
+
+class ToLedgerTests(SimpleTestCase):
+    rows = [
+        (1, 1, FinancialActionType.EXTERNAL_CASH, "-", 100, 1, 1000.0),
+        (2, 1, FinancialActionType.EQUITY, "BBB", 100, 10, 100.0),
+        (3, 1, FinancialActionType.INTERNAL_CASH, "-", 100, -1, -100.0),
+    ]
+
+    def test_tickers_are_price_columns(self):
+        ledger = to_ledger(self.rows, ["AAA", "BBB"])
+
+        np.testing.assert_array_equal(
+            ledger.kind, [EXTERNAL_CASH, EQUITY, INTERNAL_CASH]
+        )
+        self.assertEqual(ledger.ticker[1], 1)
+
+    def test_a_ticker_without_prices_is_an_error(self):
+        # Rather than valuing the shares with the prices of another column
+        with self.assertRaises(ValueError):
+            to_ledger(self.rows, ["AAA"])
+
+
+class XirrTests(SimpleTestCase):
+    def test_known_cash_flows(self):
+        # The example of Excel's XIRR documentation
+        days = [
+            epoch_day(2008, 1, 1),
+            epoch_day(2008, 3, 1),
+            epoch_day(2008, 10, 30),
+            epoch_day(2009, 2, 15),
+            epoch_day(2009, 4, 1),
+        ]
+        amounts = [-10000, 2750, 4250, 3250, 2750]
+
+        xirr = solve_xirr(
+            np.zeros(5, dtype="int64"), np.array(days), np.array(amounts, float), 1
+        )
+
+        np.testing.assert_allclose(xirr, [0.373362535], rtol=1e-8)
+
+    def test_many_series_at_once(self):
+        xirr = solve_xirr(
+            groups=np.array([0, 0, 1, 1, 2, 2]),
+            days=np.array([0, 365, 0, 730, 0, 365]),
+            amounts=np.array([-100, 110, -100, 121, -100, -5], float),
+            n_groups=3,
+        )
+        # The last series only pays in, it has no rate of return
+        np.testing.assert_allclose(xirr, [0.1, 0.1, NAN])
+
+    def test_portfolio_xirr(self):
+        # 1000 deposited and invested in a stock that is up 10% a year later
+        day_numbers = np.array([epoch_day(2020, 1, 2), epoch_day(2021, 1, 1)])
+        ledger = make_ledger(
+            cash(1, day_numbers[0], 1000) + buy(1, 0, day_numbers[0], 100, 10)
+        )
+        closes = np.array([[10.0], [11.0]])
+
+        result = compute_returns(ledger, closes, day_numbers)
+
+        np.testing.assert_allclose(
+            compute_xirr(ledger, result, day_numbers), [0.1], rtol=1e-9
+        )
@@ -0,0 +1,25 @@
+from django.contrib.auth.models import User
+from django.test import override_settings
+
+from portfoliohut.models import Profile
+from portfoliohut.providers import get_provider
+
+
+def create_profile(username: str = "jane") -> Profile:
+    user = User.objects.create_user(username=username, password=f"{username}-password")
+    return Profile.objects.create(user=user)
+
+
+class ProviderMixin:
+    """Get the market data of a test from `provider` (the offline one by default)."""
+
+    provider = "portfoliohut.providers.OfflineProvider"
+
+    def setUp(self):
+        super().setUp()
+        overridden = override_settings(PORTFOLIOHUT_MARKET_DATA_PROVIDER=self.provider)
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+        # The provider is built once per process
+        get_provider.cache_clear()
+        self.addCleanup(get_provider.cache_clear)
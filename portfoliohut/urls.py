@@ -6,6 +6,7 @@ from django.views.generic import RedirectView
 from portfoliohut.views import (
     display_friends_table,
     display_global_table,
+    export,
     friend,
     friends_competition,
     friends_returns_graph,
@@ -14,13 +15,16 @@ from portfoliohut.views import (
     logged_in_user_profile,
     login_action,
     logout_action,
+    metrics,
     portfolio,
     profile,
     profile_returns,
     register_action,
     respond_to_friend_request,
     returns_graph,
+    transaction_history,
     transaction_input,
+    what_if,
 )
 
 urlpatterns = [
@@ -40,6 +44,7 @@ urlpatterns = [
     path("profile/<str:username>", profile, name="profile"),
     path("add-transaction", transaction_input, name="add-transaction"),
     path("portfolio", portfolio, name="portfolio"),
+    path("transaction-history", transaction_history, name="transaction-history"),
     path("friend/<str:username>", friend, name="friend"),
     path(
         "respond-to-friend-request/<str:username>/<str:action>",
@@ -52,4 +57,7 @@ urlpatterns = [
     path("profile-returns/<str:username>", profile_returns, name="profile-returns"),
     path("returns-graph", returns_graph, name="returns-graph"),
     path("friends-returns-graph", friends_returns_graph, name="friends-returns-graph"),
+    path("export/<str:dataset>.<str:file_format>", export, name="export"),
+    path("metrics", metrics, name="metrics"),
+    path("what-if", what_if, name="what-if"),
 ]
@@ -10,7 +10,9 @@ from .base import (
     landing_page,
     page_not_found,
 )
-from .portfolio import portfolio, returns_graph
+from .export import export
+from .metrics import metrics
+from .portfolio import portfolio, returns_graph, transaction_history
 from .profile import (
     friend,
     logged_in_user_profile,
@@ -18,6 +20,7 @@ from .profile import (
     profile_returns,
     respond_to_friend_request,
 )
+from .simulation import what_if
 from .transactions import transaction_input
 
 __all__ = [
@@ -39,4 +42,8 @@ __all__ = [
     "profile_returns",
     "returns_graph",
     "friends_returns_graph",
+    "export",
+    "transaction_history",
+    "metrics",
+    "what_if",
 ]
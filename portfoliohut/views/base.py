@@ -1,12 +1,15 @@
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseBadRequest
 from django.shortcuts import render
 from django_tables2 import RequestConfig
 
+from portfoliohut.forms import GraphRangeForm
 from portfoliohut.graph import _get_sp_index, combine_data, multi_plot
 from portfoliohut.models import Profile
 from portfoliohut.tables import ReturnsTable
 
+from .conditional import conditional, friends_returns_graph_version
+
 NUM_LEADERS = 10
 
 
@@ -77,8 +80,17 @@ def global_competition(request):
 
 
 @login_required
+@conditional(friends_returns_graph_version)
 def friends_returns_graph(request):
+    range_form = GraphRangeForm(request.GET)
+    if not range_form.is_valid():
+        return HttpResponseBadRequest(range_form.errors.as_text())
+    start = range_form.cleaned_data["start"]
+    end = range_form.cleaned_data["end"]
+
     my_profile = Profile.objects.get(user=request.user)
+    first_date = my_profile.get_first_return_date()
+    resolution = range_form.get_resolution(first_date)
     friends_profiles = Profile.objects.filter(friends__pk=my_profile.id)
     unsorted_friends_profiles = friends_profiles.all()
 
@@ -86,11 +98,11 @@ def friends_returns_graph(request):
     friends_series = []
     friends_names = []
     for profile in unsorted_friends_profiles:
-        friend_returns = profile.get_cumulative_returns().to_series()
+        friend_returns = profile.get_returns_series(start, end, resolution)
         friends_series.append(friend_returns)
         friends_names.append(profile.user.first_name + " " + profile.user.last_name)
-    user_returns = my_profile.get_cumulative_returns().to_series()
-    index_returns = _get_sp_index(user_returns.index[0])
+    user_returns = my_profile.get_returns_series(start, end, resolution)
+    index_returns = _get_sp_index(first_date, start, end, resolution)
 
     # Create the competition graph
     merged_df = combine_data(friends_series, friends_names, user_returns, index_returns)
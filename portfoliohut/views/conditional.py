@@ -0,0 +1,146 @@
+"""Conditional GET for the returns endpoints.
+
+The returns of a profile only change when its `PortfolioReturn` rows are written (which bumps
+`Profile.returns_version`) and the index line of the graphs only when new `INDEX_TICKER` prices
+are stored. The ETags below are built from those versions, so a repeated poll is answered with a
+304 after one indexed lookup instead of rebuilding the graph.
+
+"""
+import hashlib
+from collections import namedtuple
+from functools import wraps
+
+from django.db.models import Q
+from django.utils import timezone
+from django.views.decorators.cache import cache_control
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import condition
+
+from portfoliohut.graph import INDEX_TICKER
+from portfoliohut.metrics import CACHE_HITS, CACHE_MISSES
+from portfoliohut.models import HistoricalEquity, Job, Profile, TickerMetadata
+
+Version = namedtuple("Version", ["etag", "last_modified"])
+
+
+def _latest(*datetimes):
+    datetimes = [dt for dt in datetimes if dt is not None]
+    return max(datetimes) if datetimes else None
+
+
+def _index_version():
+    """The last stored index price date and when the index was last checked for new prices."""
+    metadata = TickerMetadata.objects.filter(ticker=INDEX_TICKER).first()
+    # A 304 skips the `get_ticker` call that would have refreshed the index prices
+    if HistoricalEquity.objects.needs_fetch(metadata, timezone.now()):
+        Job.objects.enqueue(
+            "refresh_ticker",
+            {"ticker": INDEX_TICKER},
+            dedup_key=f"refresh_ticker:{INDEX_TICKER}",
+        )
+    if metadata is None:
+        return None, None
+    return metadata.last_date, metadata.last_fetch_attempt
+
+
+def _memoize(func):
+    """Compute a `Version` once per request (`condition` asks for the ETag and Last-Modified)."""
+
+    def wrapper(request, *args, **kwargs):
+        cache = request.__dict__.setdefault("_versions", {})
+        if func.__name__ not in cache:
+            cache[func.__name__] = func(request, *args, **kwargs)
+        return cache[func.__name__]
+
+    return wrapper
+
+
+@_memoize
+def returns_graph_version(request):
+    profile = (
+        Profile.objects.filter(user=request.user)
+        .values("pk", "returns_version", "returns_updated")
+        .first()
+    )
+    if profile is None:
+        return Version(None, None)
+    index_date, index_checked = _index_version()
+    return Version(
+        f'"returns-graph-{profile["pk"]}-{profile["returns_version"]}-{index_date}"',
+        _latest(profile["returns_updated"], index_checked),
+    )
+
+
+@_memoize
+def friends_returns_graph_version(request):
+    # The user's and their friends' returns versions and names
+    profiles = list(
+        Profile.objects.filter(Q(user=request.user) | Q(friends__user=request.user))
+        .distinct()
+        .order_by("pk")
+        .values_list(
+            "pk",
+            "returns_version",
+            "returns_updated",
+            "user__first_name",
+            "user__last_name",
+        )
+    )
+    index_date, index_checked = _index_version()
+    digest = hashlib.sha1(repr((profiles, index_date)).encode()).hexdigest()
+    return Version(
+        f'"friends-returns-graph-{digest}"',
+        _latest(index_checked, *(profile[2] for profile in profiles)),
+    )
+
+
+@_memoize
+def profile_returns_version(request, username):
+    profile = (
+        Profile.objects.filter(user__username=username)
+        .values("pk", "returns_version", "returns_updated")
+        .first()
+    )
+    if profile is None:
+        return Version(None, None)
+    return Version(
+        f'"profile-returns-{profile["pk"]}-{profile["returns_version"]}"',
+        profile["returns_updated"],
+    )
+
+
+def _count_not_modified(view):
+    """Count 304s as hits of the browser cache and everything else as misses."""
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        if response.status_code == 304:
+            CACHE_HITS.inc(cache="etag")
+        else:
+            CACHE_MISSES.inc(cache="etag")
+        return response
+
+    return wrapper
+
+
+def conditional(version_func):
+    """Answer matching `If-None-Match`/`If-Modified-Since` requests with a 304 and gzip the rest.
+
+    Args:
+        version_func: Returns the `Version` of the view's response for a request
+
+    """
+
+    def decorator(view):
+        view = condition(
+            etag_func=lambda *args, **kwargs: version_func(*args, **kwargs).etag,
+            last_modified_func=lambda *args, **kwargs: version_func(
+                *args, **kwargs
+            ).last_modified,
+        )(view)
+        view = _count_not_modified(view)
+        # Browsers must revalidate since the data changes without the URL changing
+        return cache_control(private=True, no_cache=True)(gzip_page(view))
+
+    return decorator
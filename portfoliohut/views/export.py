@@ -0,0 +1,81 @@
+import csv
+
+from django.contrib.auth.decorators import login_required
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+
+from portfoliohut.models import Profile
+
+# Rows fetched from the database at a time (a server side cursor on Postgres)
+CHUNK_SIZE = 2000
+
+# The related manager and columns of every dataset that can be exported
+EXPORTS = {
+    "transactions": (
+        "transaction_set",
+        ["date_time", "type", "ticker", "quantity", "price"],
+        ["date_time", "id"],
+    ),
+    "holdings": (
+        "portfolioitem_set",
+        ["type", "ticker", "quantity", "price", "created"],
+        ["ticker"],
+    ),
+    "returns": ("portfolioreturn_set", ["date", "returns"], ["date"]),
+}
+
+CONTENT_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+
+class Echo:
+    """A file-like object for `csv.writer` that hands back each line instead of storing it."""
+
+    def write(self, value):
+        return value
+
+
+def _csv_lines(fields, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def _ndjson_lines(fields, rows):
+    encoder = DjangoJSONEncoder()
+    for row in rows:
+        yield encoder.encode(dict(zip(fields, row))) + "\n"
+
+
+@login_required
+def export(request, dataset, file_format):
+    """Stream every row of one of the user's datasets as CSV or newline delimited JSON.
+
+    Rows are written as they are read from the database, so the memory used doesn't grow with
+    the size of the account.
+
+    """
+    if dataset not in EXPORTS or file_format not in CONTENT_TYPES:
+        raise Http404
+
+    profile = get_object_or_404(Profile, user=request.user)
+    related_name, fields, ordering = EXPORTS[dataset]
+    rows = (
+        getattr(profile, related_name)
+        .order_by(*ordering)
+        .values_list(*fields)
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+    lines = _csv_lines if file_format == "csv" else _ndjson_lines
+
+    response = StreamingHttpResponse(
+        lines(fields, rows), content_type=CONTENT_TYPES[file_format]
+    )
+    response[
+        "Content-Disposition"
+    ] = f'attachment; filename="{request.user.username}-{dataset}.{file_format}"'
+    return response
@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotFound
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.cache import never_cache
+
+from portfoliohut.metrics import REGISTRY
+
+
+@never_cache
+def metrics(request):
+    """The metrics of every process in the Prometheus text format.
+
+    Scrapers send `PORTFOLIOHUT_METRICS_TOKEN` as a bearer token, staff users can look at them
+    while logged in. Without a token only staff users can, everyone else gets a 404.
+
+    """
+    token = settings.PORTFOLIOHUT_METRICS_TOKEN
+    if not request.user.is_staff:
+        if not token:
+            return HttpResponseNotFound("Not found")
+        if not constant_time_compare(
+            request.headers.get("Authorization", ""), f"Bearer {token}"
+        ):
+            return HttpResponse("Unauthorized", status=401)
+
+    return HttpResponse(
+        REGISTRY.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
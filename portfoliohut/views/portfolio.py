@@ -1,29 +1,85 @@
 import math
 
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseBadRequest
 from django.shortcuts import get_object_or_404, render
-from django.utils.html import mark_safe
+from django.template.loader import render_to_string
 
+from portfoliohut.forms import GraphRangeForm
 from portfoliohut.graph import _get_sp_index, combine_index_user, multi_plot
 from portfoliohut.models import FinancialActionType, Profile
+from portfoliohut.pagination import InvalidCursor, KeysetPaginator
 from portfoliohut.tables import PortfolioItemTable, TransactionTable
 
+from .conditional import conditional, returns_graph_version
+
 NUM_TRANSACTIONS = 10
 
 
 @login_required
+@conditional(returns_graph_version)
 def returns_graph(request):
+    range_form = GraphRangeForm(request.GET)
+    if not range_form.is_valid():
+        return HttpResponseBadRequest(range_form.errors.as_text())
+    start = range_form.cleaned_data["start"]
+    end = range_form.cleaned_data["end"]
+
     profile = get_object_or_404(Profile, user=request.user)
-    graph_data = profile.get_cumulative_returns().to_series()
+    first_date = profile.get_first_return_date()
+    resolution = range_form.get_resolution(first_date)
+    graph_data = profile.get_returns_series(start, end, resolution)
     graph = None
     if not graph_data.empty:
-        start_date = graph_data.index[0]
-        index_data = _get_sp_index(start_date)
+        index_data = _get_sp_index(first_date, start, end, resolution)
         merged_df = combine_index_user(graph_data, index_data)
         graph = multi_plot(merged_df)
         return HttpResponse(graph)
-    return mark_safe("<table><table>")
+    return HttpResponse("<table><table>")
+
+
+def _transaction_history(request, profile):
+    """The context of one page of `portfoliohut/transaction_history.html`.
+
+    The page is picked by the `after` (next) or `before` (previous) cursor in the query string.
+
+    Raises:
+        InvalidCursor: When the cursor in the query string is invalid
+
+    """
+    paginator = KeysetPaginator(
+        profile.transaction_set.filter(
+            type__in=[FinancialActionType.EXTERNAL_CASH, FinancialActionType.EQUITY]
+        ),
+        NUM_TRANSACTIONS,
+    )
+    page = paginator.page(
+        after=request.GET.get("after"), before=request.GET.get("before")
+    )
+    transactions_count = None
+    if settings.PORTFOLIOHUT_TRANSACTIONS_ESTIMATED_COUNT:
+        transactions_count = paginator.estimated_count()
+    return {
+        "current_transactions_table": TransactionTable(page.object_list),
+        "transactions_page": page,
+        "transactions_count": transactions_count,
+    }
+
+
+@login_required
+def transaction_history(request):
+    """One page of the transaction history for infinite scrolling."""
+    profile = get_object_or_404(Profile, user=request.user)
+    try:
+        context = _transaction_history(request, profile)
+    except InvalidCursor as e:
+        return HttpResponseBadRequest(str(e))
+    return HttpResponse(
+        render_to_string(
+            "portfoliohut/transaction_history.html", context, request=request
+        )
+    )
 
 
 @login_required
@@ -40,25 +96,21 @@ def portfolio(request):
         if math.isnan(returns):
             has_returns = False
 
+        try:
+            transaction_history_context = _transaction_history(request, profile)
+        except InvalidCursor as e:
+            return HttpResponseBadRequest(str(e))
+
         # Get current portfolio
         current_portfolio_table = PortfolioItemTable(profile.portfolioitem_set.all())
-        current_transactions_table = TransactionTable(
-            profile.transaction_set.filter(
-                type__in=[FinancialActionType.EXTERNAL_CASH, FinancialActionType.EQUITY]
-            )
-            .all()
-            .order_by("-date_time")
-        )
-        current_transactions_table.paginate(
-            page=request.GET.get("page", 1), per_page=NUM_TRANSACTIONS
-        )
 
         return render(
             request,
             "portfoliohut/portfolio.html",
             {
                 "has_returns": has_returns,
+                "returns_updating": profile.is_returns_updating(),
                 "current_portfolio_table": current_portfolio_table,
-                "current_transactions_table": current_transactions_table,
+                **transaction_history_context,
             },
         )
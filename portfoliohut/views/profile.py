@@ -2,13 +2,27 @@ import math
 
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
-from django.db.models import DecimalField, ExpressionWrapper, F
+from django.core.paginator import Paginator
+from django.db.models import ExpressionWrapper, F
 from django.http import HttpResponse
 from django.shortcuts import redirect, render
 from django.urls import reverse
+from django.views.decorators.http import require_POST
 
 from portfoliohut.forms import ProfileForm
-from portfoliohut.models import EquityInfo, FinancialActionType, PortfolioItem, Profile
+from portfoliohut.models import (
+    EquityInfo,
+    FinancialActionType,
+    Job,
+    PortfolioItem,
+    Profile,
+)
+from portfoliohut.models.fields import FixedPointField
+
+from .conditional import conditional, profile_returns_version
+
+# Friends and friend requests listed per page of the profile page
+NUM_FRIENDS = 50
 
 
 @login_required
@@ -17,6 +31,7 @@ def logged_in_user_profile(request):
 
 
 @login_required
+@conditional(profile_returns_version)
 def profile_returns(request, username):
     user = User.objects.filter(username=username)
     if not user.exists():
@@ -36,30 +51,59 @@ def profile_returns(request, username):
 def profile(request, username):
     context = {}
 
-    # Make sure user exists
-    user_exists = User.objects.filter(username=username)
-    if not user_exists:
+    # The profile, its user and how it relates to the logged in user in one query
+    profile = (
+        Profile.objects.select_related("user")
+        .with_relationship(request.user)
+        .filter(user__username=username)
+        .first()
+    )
+    if profile is None:
         return redirect("index")
-
-    # Save user's profile
-    user_id = User.objects.get(username=username)
-    profile = Profile.objects.get(user_id=user_id)
     context["profile"] = profile
+
+    # Only one page of friends and of friend requests is loaded, along with their users
+    friends = Paginator(
+        profile.friends.select_related("user").order_by("user__username"),
+        NUM_FRIENDS,
+    )
+    context["friends_page"] = friends.get_page(request.GET.get("friends_page"))
+    if profile.user_id == request.user.id:
+        friend_requests = Paginator(
+            profile.friend_requests.select_related("user").order_by("user__username"),
+            NUM_FRIENDS,
+        )
+        context["friend_requests_page"] = friend_requests.get_page(
+            request.GET.get("requests_page")
+        )
     get_all_stocks = (
         PortfolioItem.objects.filter(profile=profile, type=FinancialActionType.EQUITY)
         .values("ticker")
         .annotate(
             total_price=ExpressionWrapper(
-                F("quantity") * F("price"), output_field=DecimalField()
+                F("quantity") * F("price"), output_field=FixedPointField()
             )
         )
         .order_by("-total_price")[:5]
     )
 
+    # Fetching company info blocks on yfinance, so missing logos are backfilled by the worker
+    top_tickers = [i["ticker"] for i in get_all_stocks]
+    logo_urls = dict(
+        EquityInfo.objects.filter(ticker__in=top_tickers).values_list(
+            "ticker", "logo_url"
+        )
+    )
     stocks_urls = []
-    if get_all_stocks:
-        for i in get_all_stocks:
-            stocks_urls.append((EquityInfo.objects.get_ticker(i["ticker"])).logo_url)
+    for ticker in top_tickers:
+        if ticker in logo_urls:
+            stocks_urls.append(logo_urls[ticker])
+        else:
+            Job.objects.enqueue(
+                "fetch_equity_info",
+                {"ticker": ticker},
+                dedup_key=f"fetch_equity_info:{ticker}",
+            )
 
     context["top_stocks"] = stocks_urls
     context["returns"] = profile.get_most_recent_return()
@@ -91,6 +135,7 @@ def profile(request, username):
 
 
 @login_required
+@require_POST
 def friend(request, username):
     context = {}
 
@@ -109,32 +154,30 @@ def friend(request, username):
     logged_in_user = Profile.objects.get(user=request.user)
     context["profile"] = other_user
 
-    # Handle GET request
-    if request.method == "GET":
+    # See if friend request already exists
+    request_already_exists = other_user.friend_requests.filter(
+        user_id=logged_in_user.user_id
+    )
+    if not request_already_exists:
+        already_friends = other_user.friends.filter(user_id=logged_in_user.user_id)
 
-        # See if friend request already exists
-        request_already_exists = other_user.friend_requests.filter(
-            user_id=logged_in_user.user_id
-        )
-        if not request_already_exists:
-            already_friends = other_user.friends.filter(user_id=logged_in_user.user_id)
+        # Send friend request
+        if not already_friends:
+            other_user.friend_requests.add(logged_in_user)
 
-            # Send friend request
-            if not already_friends:
-                other_user.friend_requests.add(logged_in_user)
+        # Unfriend
+        else:
+            other_user.friends.remove(logged_in_user)
+            logged_in_user.friends.remove(other_user)
 
-            # Unfriend
-            else:
-                other_user.friends.remove(logged_in_user)
-                logged_in_user.friends.remove(other_user)
+        logged_in_user.save()
+        other_user.save()
 
-            logged_in_user.save()
-            other_user.save()
-
-        return redirect(reverse("profile", args=[username]))
+    return redirect(reverse("profile", args=[username]))
 
 
 @login_required
+@require_POST
 def respond_to_friend_request(request, username, action):
     context = {}
 
@@ -159,19 +202,17 @@ def respond_to_friend_request(request, username, action):
     if not friend_request_exists:
         return redirect(reverse("profile", args=[username]))
 
-    # Handle GET request
-    if request.method == "GET":
-        # Accept friend request
-        if action == "accept":
-            logged_in_user.friend_requests.remove(other_user)
-            logged_in_user.friends.add(other_user)
-            other_user.friends.add(logged_in_user)
+    # Accept friend request
+    if action == "accept":
+        logged_in_user.friend_requests.remove(other_user)
+        logged_in_user.friends.add(other_user)
+        other_user.friends.add(logged_in_user)
 
-        # Decline friend request
-        elif action == "decline":
-            logged_in_user.friend_requests.remove(other_user)
+    # Decline friend request
+    elif action == "decline":
+        logged_in_user.friend_requests.remove(other_user)
 
-        logged_in_user.save()
-        other_user.save()
+    logged_in_user.save()
+    other_user.save()
 
-        return redirect(reverse("profile", args=[username]))
+    return redirect(reverse("profile", args=[username]))
@@ -0,0 +1,80 @@
+import json
+import math
+
+from django.contrib.auth.decorators import login_required
+from django.http import HttpResponseBadRequest, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import require_POST
+
+from portfoliohut.forms import SimulatedTransactionForm
+from portfoliohut.models import Profile
+
+# Bounds the work done by a single request
+MAX_SIMULATED_TRANSACTIONS = 100
+
+
+def _or_none(value: float):
+    return None if math.isnan(value) else value
+
+
+@login_required
+@require_POST
+def what_if(request):
+    """Simulate the user's returns with hypothetical transactions added and others left out.
+
+    The JSON body looks like::
+
+        {
+            "transactions": [
+                {"action": "buy", "date_time": "2021-03-01 11:00", "ticker": "AAPL",
+                 "quantity": 10, "price": "120.50"}
+            ],
+            "exclude": [12, 15]
+        }
+
+    `transactions` take the fields of `SimulatedTransactionForm` and `exclude` holds the ids of
+    the user's transactions to leave out. The response has the actual and the simulated
+    cumulative returns (in %) on each day and both XIRRs. Nothing is saved.
+
+    """
+    try:
+        body = json.loads(request.body)
+        transactions = list(body.get("transactions", []))
+        exclude_ids = [int(pk) for pk in body.get("exclude", [])]
+    except (AttributeError, TypeError, ValueError):
+        return HttpResponseBadRequest(
+            "Expected a JSON object with 'transactions' and 'exclude' lists"
+        )
+    if len(transactions) > MAX_SIMULATED_TRANSACTIONS:
+        return HttpResponseBadRequest(
+            f"At most {MAX_SIMULATED_TRANSACTIONS} transactions can be simulated"
+        )
+
+    cleaned_transactions = []
+    for i, data in enumerate(transactions):
+        form = SimulatedTransactionForm(data if isinstance(data, dict) else {})
+        if not form.is_valid():
+            return HttpResponseBadRequest(
+                f"Transaction {i + 1}: {form.errors.as_text()}"
+            )
+        cleaned_transactions.append(form.cleaned_data)
+
+    from portfoliohut.simulation import simulate_returns
+
+    profile = get_object_or_404(Profile, user=request.user)
+    try:
+        simulation = simulate_returns(profile, cleaned_transactions, exclude_ids)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+
+    return JsonResponse(
+        {
+            "dates": [day.isoformat() for day in simulation.dates],
+            "actual": [_or_none(value) for value in simulation.actual.tolist()],
+            "simulated": [_or_none(value) for value in simulation.simulated.tolist()],
+            "xirr": {
+                "actual": _or_none(float(simulation.actual_xirr)),
+                "simulated": _or_none(float(simulation.simulated_xirr)),
+            },
+        }
+    )
@@ -10,8 +10,10 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.1/ref/settings/
 """
 import os
+import tempfile
 from pathlib import Path
 
+import dj_database_url
 import django_heroku
 from django.contrib import messages
 from dotenv import load_dotenv
@@ -55,6 +57,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "portfoliohut.middleware.ReplicaMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -82,6 +85,14 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = "webapps.wsgi.application"
+# Served by uvicorn workers under gunicorn (see the Procfile). "channels" is deliberately not an
+# installed app, its runserver override imports daphne (and numpy through autobahn) on every
+# startup
+ASGI_APPLICATION = "webapps.asgi.application"
+
+# The live valuation consumers of a process share one quote poller, so an in-memory layer is
+# enough (see `portfoliohut/consumers.py`)
+CHANNEL_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
 
 
 # Database
@@ -157,5 +168,80 @@ MESSAGE_TAGS = {
     messages.ERROR: "alert-danger",
 }
 
+# Coalesce post transaction recomputes (all values are in seconds). Each write pushes the recompute
+# back by RECOMPUTE_DELAY but never further than RECOMPUTE_MAX_DELAY after the first pending write.
+# RECOMPUTE_LEASE is how long a running recompute holds the per-profile lock before it is
+# considered dead.
+PORTFOLIOHUT_RECOMPUTE_DELAY = 2
+PORTFOLIOHUT_RECOMPUTE_MAX_DELAY = 30
+PORTFOLIOHUT_RECOMPUTE_LEASE = 300
+
+# Database backed job queue (see `python manage.py run_worker`). Set JOBS_EAGER to run jobs inline
+# (after the current transaction commits) when no worker is running, e.g. during development.
+PORTFOLIOHUT_JOBS_EAGER = os.environ.get("JOBS_EAGER", False)
+# Seconds a worker may hold a job before another worker can claim it again
+PORTFOLIOHUT_JOB_LEASE = 600
+# Failed jobs are retried after JOB_BACKOFF * 2 ** (attempt - 1) seconds
+PORTFOLIOHUT_JOB_BACKOFF = 10
+PORTFOLIOHUT_JOB_MAX_ATTEMPTS = 5
+
+# Price cache (in seconds). Tickers that yfinance doesn't know are rejected without a network call
+# for TICKER_NOT_FOUND_TTL. Cached prices are checked for new data at most every
+# PRICE_REFRESH_INTERVAL.
+PORTFOLIOHUT_TICKER_NOT_FOUND_TTL = 24 * 60 * 60
+PORTFOLIOHUT_PRICE_REFRESH_INTERVAL = 15 * 60
+# Seconds a process may spend downloading a ticker's prices before another process takes over, the
+# others check every TICKER_FETCH_POLL seconds whether the prices are in. They stop waiting after
+# TICKER_FETCH_WAIT seconds, which must stay under the request timeout (gunicorn's --timeout).
+PORTFOLIOHUT_TICKER_FETCH_LEASE = 60
+PORTFOLIOHUT_TICKER_FETCH_POLL = 0.5
+PORTFOLIOHUT_TICKER_FETCH_WAIT = 10
+
+# Optional Parquet archive of old prices (needs pyarrow). With PRICE_ARCHIVE_DIR set the database
+# only keeps the prices of the last PRICE_ARCHIVE_KEEP_DAYS days and older ones are read from the
+# archive (see `portfoliohut/archive.py` and `python manage.py archive_prices`).
+PORTFOLIOHUT_PRICE_ARCHIVE_DIR = os.environ.get("PRICE_ARCHIVE_DIR")
+PORTFOLIOHUT_PRICE_ARCHIVE_KEEP_DAYS = 365
+
+# Show the query planner's estimate of the number of transactions under the transaction history
+# (Postgres only, other databases have no estimate and show nothing)
+PORTFOLIOHUT_TRANSACTIONS_ESTIMATED_COUNT = os.environ.get(
+    "TRANSACTIONS_ESTIMATED_COUNT", False
+)
+
+# Tickers with weekly/monthly rollups (the index the returns graphs compare against)
+PORTFOLIOHUT_ROLLUP_TICKERS = ["SPY"]
+
+# Where prices come from: "portfoliohut.providers.YFinanceProvider" or
+# "portfoliohut.providers.OfflineProvider" (made up prices, no network access)
+PORTFOLIOHUT_MARKET_DATA_PROVIDER = os.environ.get(
+    "MARKET_DATA_PROVIDER", "portfoliohut.providers.YFinanceProvider"
+)
+# Seconds between two quote requests of the live valuation poller
+PORTFOLIOHUT_QUOTE_POLL_INTERVAL = 15
+# Where each process writes its metrics for `/metrics` to add up (shared by the processes of a
+# dyno) and the bearer token a scraper has to send (without a token only staff users see them)
+PORTFOLIOHUT_METRICS_DIR = os.environ.get(
+    "METRICS_DIR", os.path.join(tempfile.gettempdir(), "portfoliohut-metrics")
+)
+PORTFOLIOHUT_METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+
 # Activate Django-Heroku.
 django_heroku.settings(locals())
+
+# Read replicas of the primary database as comma separated database URLs. GET/HEAD requests read
+# from them, everything else (and reads after a request wrote something) uses the primary (see
+# `portfoliohut/routers.py`). After a user changes data their requests stay on the primary for
+# REPLICA_PIN_SECONDS, which should be longer than the replication lag.
+PORTFOLIOHUT_DATABASE_REPLICAS = []
+for i, url in enumerate(
+    filter(None, map(str.strip, os.environ.get("DATABASE_REPLICA_URLS", "").split(",")))
+):
+    DATABASES[f"replica_{i}"] = {
+        **dj_database_url.parse(url, conn_max_age=600),
+        # Tests read the primary through the replica aliases
+        "TEST": {"MIRROR": "default"},
+    }
+    PORTFOLIOHUT_DATABASE_REPLICAS.append(f"replica_{i}")
+DATABASE_ROUTERS = ["portfoliohut.routers.ReplicaRouter"]
+PORTFOLIOHUT_REPLICA_PIN_SECONDS = 10